@@ -0,0 +1,221 @@
+#/*##########################################################################
+# Copyright (C) 2014 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# This toolkit is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2 of the License, or (at your option)
+# any later version.
+#
+# PyMca is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyMca; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# PyMca follows the dual licensing model of Riverbank's PyQt and cannot be
+# used as a free plugin for a non-free program.
+#
+# Please contact the ESRF industrial unit (industry@esrf.fr) if this license
+# is a problem for you.
+#############################################################################*/
+__author__ = "Tonn Rueter - ESRF Data Analysis Unit"
+__doc__ = """Headless reduction of RIXS images to spectra. The module does not depend on any GUI library and can
+therefore be used on machines without X server (c.f. scripts/rixsbatch)."""
+
+import sys
+import time
+import argparse
+
+from os import listdir as OsListDir
+from os import makedirs as OsMakeDirs
+from os.path import isdir as OsPathIsDir
+from os.path import isfile as OsPathIsFile
+from os.path import join as OsPathJoin
+from os.path import splitext as OsPathSplitext
+
+import numpy
+
+from RixsTool.IO import IODict
+from RixsTool.Parallel import ParallelExecutor
+from RixsTool.Pipeline import Pipeline
+
+DEBUG = 0
+
+
+class BatchReduction(object):
+    __doc__ = """The :py:class:`BatchReduction` applies a :py:class:`RixsTool.Pipeline.Pipeline` to every image of a
+    list of files. The last stage of the pipeline must reduce the image to a spectrum. Parameter files are the JSON or
+    YAML files written by :py:func:`RixsTool.Pipeline.Pipeline.save`.
+
+    Notice that the quadratic coefficient a is given in absolute units, contrary to the slope correction tool window
+    that shows it in units of 1e-5.
+    """
+
+    operations = Pipeline.operations
+
+    def __init__(self, stages, processes=1):
+        """
+        :param stages: Pipeline or list of (name, parameters) pairs
+        :param int processes: Number of worker processes used by :py:func:`run`, None uses all cores
+
+        References to dark maps are read from file, c.f. :py:func:`RixsTool.Pipeline.Pipeline.resolve`.
+
+        :raises ValueError: if a stage name is unknown
+        """
+        self.pipeline = Pipeline(stages).resolve()
+        self.stages = list(self.pipeline)
+        self.inputReaders = IODict.inputReaderDict()
+        self.executor = ParallelExecutor(processes)
+
+    @staticmethod
+    def fromFile(fileName, processes=1):
+        """
+        :param str fileName: JSON or YAML parameter file
+        :param int processes: Number of worker processes, None uses all cores
+
+        :returns BatchReduction: Reduction using the stages defined in the file
+        """
+        return BatchReduction(Pipeline.fromFile(fileName), processes)
+
+    def process(self, image):
+        """
+        :param ndarray image: Two dimensional numpy.ndarray
+
+        :returns ndarray: Spectrum
+        :raises ValueError: if the stages do not reduce the image to one dimension
+        """
+        data = self.pipeline.run(image)
+        if data.ndim != 1:
+            raise ValueError('BatchReduction.process -- Result has %d dimensions, expected spectrum' % data.ndim)
+        return data
+
+    def reduceFile(self, fileName):
+        """
+        :param str fileName: File name including path to the file
+
+        :returns list: List of (key, spectrum) pairs, one for every image in the file
+        :raises TypeError: if the file type is unknown
+        """
+        name, ext = OsPathSplitext(fileName)
+        fileType = ext.replace('.', '').lower()
+        if fileType not in self.inputReaders:
+            raise TypeError("BatchReduction.reduceFile -- Unknown file type '%s'" % fileType)
+        itemList = self.inputReaders[fileType].itemize(fileName)
+        return [(item.key(), self.process(item.array)) for item in itemList]
+
+    def run(self, fileNameList, outputDirectory):
+        """
+        :param list fileNameList: Files to reduce
+        :param str outputDirectory: Directory the spectra are written to
+
+        Reduces every file and writes the resulting spectra as two column text files (pixel number, counts).
+        The files are distributed over the worker processes of the executor. Files that can not be reduced are
+        reported on stderr and skipped.
+
+        :returns list: Names of the files that failed
+        """
+        if not OsPathIsDir(outputDirectory):
+            OsMakeDirs(outputDirectory)
+        failed = []
+        resultList = self.executor.map(reduceFile,
+                                       [(fileName, self.pipeline) for fileName in fileNameList])
+        for fileName, spectra, error in resultList:
+            if error is not None:
+                sys.stderr.write("BatchReduction.run -- Failed to reduce '%s': %s\n" % (fileName, error))
+                failed += [fileName]
+                continue
+            for key, spectrum in spectra:
+                outputName = OsPathJoin(outputDirectory, key.replace('.edf', '.dat'))
+                data = numpy.vstack((numpy.arange(len(spectrum)), spectrum)).T
+                numpy.savetxt(outputName, data, fmt='%.6f', delimiter=' ')
+                if DEBUG >= 1:
+                    print("BatchReduction.run -- Wrote '%s'" % outputName)
+        return failed
+
+
+def reduceFile(arguments):
+    """
+    :param tuple arguments: Pair of file name and pipeline
+
+    Worker function for :py:class:`RixsTool.Parallel.ParallelExecutor`. Errors are returned instead of raised,
+    so that a single defective file does not abort the whole run.
+
+    :returns tuple: File name, list of (key, spectrum) pairs and error message (None on success)
+    """
+    fileName, pipeline = arguments
+    try:
+        spectra = BatchReduction(pipeline).reduceFile(fileName)
+    except Exception as error:
+        return fileName, [], str(error)
+    return fileName, spectra, None
+
+
+def reduceImage(arguments):
+    """
+    :param tuple arguments: Pair of image source and pipeline. The source is either a numpy.ndarray or a pair
+     of item key and file name, in which case the image is read by the worker.
+
+    Worker function for :py:class:`RixsTool.Parallel.ParallelExecutor`.
+
+    :returns ndarray: Spectrum
+    :raises KeyError: if the file does not contain an image with the given key
+    """
+    source, pipeline = arguments
+    reduction = BatchReduction(pipeline)
+    if isinstance(source, numpy.ndarray):
+        return reduction.process(source)
+    key, fileName = source
+    name, ext = OsPathSplitext(fileName)
+    reader = reduction.inputReaders[ext.replace('.', '').lower()]
+    for item in reader.itemize(fileName):
+        if item.key() == key:
+            return reduction.process(item.array)
+    raise KeyError("reduceImage -- '%s' not found in '%s'" % (key, fileName))
+
+
+def expandFileNames(pathList, extension='edf'):
+    """
+    :param list pathList: File names or directories
+    :param str extension: Directories are searched for files with this extension
+
+    :returns list: Sorted list of file names
+    """
+    fileNameList = []
+    for path in pathList:
+        if OsPathIsDir(path):
+            fileNameList += sorted([OsPathJoin(path, name) for name in OsListDir(path)
+                                    if OsPathSplitext(name)[1].lower() == '.' + extension
+                                    and OsPathIsFile(OsPathJoin(path, name))])
+        else:
+            fileNameList += [path]
+    return fileNameList
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Reduce RIXS images to spectra without GUI')
+    parser.add_argument('parameters', help='JSON or YAML file defining the processing stages')
+    parser.add_argument('input', nargs='+', help='EDF files or directories containing EDF files')
+    parser.add_argument('-o', '--output', default='.', help='Output directory (default: current directory)')
+    parser.add_argument('-p', '--processes', type=int, default=None,
+                        help='Number of worker processes (default: number of cores)')
+    args = parser.parse_args(argv)
+
+    reduction = BatchReduction.fromFile(args.parameters, args.processes)
+    fileNameList = expandFileNames(args.input)
+
+    timeStart = time.time()
+    failed = reduction.run(fileNameList, args.output)
+    timeEnd = time.time()
+    print('Reduced %d of %d files in %.1f s' % (len(fileNameList) - len(failed), len(fileNameList),
+                                               timeEnd - timeStart))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,225 @@
+#/*##########################################################################
+# Copyright (C) 2014 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# This toolkit is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2 of the License, or (at your option)
+# any later version.
+#
+# PyMca is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyMca; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# PyMca follows the dual licensing model of Riverbank's PyQt and cannot be
+# used as a free plugin for a non-free program.
+#
+# Please contact the ESRF industrial unit (industry@esrf.fr) if this license
+# is a problem for you.
+#############################################################################*/
+__author__ = "Tonn Rueter - ESRF Data Analysis Unit"
+__doc__ = """Module provides a persistent cache of files read by the input readers of :py:mod:`RixsTool.IO`. Reading
+files from a slow network file system is avoided when the same files are read again in a later session."""
+
+import numpy
+import pickle
+import copy
+import hashlib
+import shutil
+import threading
+from os import getpid as OsGetPid
+from os import listdir as OsListDir
+from os import makedirs as OsMakeDirs
+from os import rename as OsRename
+from os import stat as OsStat
+from os import utime as OsUtime
+from os.path import abspath as OsAbsPath
+from os.path import expanduser as OsExpandUser
+from os.path import getsize as OsPathGetSize
+from os.path import isdir as OsPathIsDir
+from os.path import join as OsPathJoin
+
+DEBUG = 0
+
+CACHE_VERSION = 1
+INDEX_NAME = 'items.pkl'
+
+
+class NpyLoader(object):
+    __doc__ = """Picklable loader that memory maps an array stored in a .npy file, c.f.
+    :py:func:`RixsTool.Items.DataItem.setLoader`"""
+
+    def __init__(self, fileName, shape, dtype):
+        self.fileName = fileName
+        self.shape = tuple(shape)
+        self.dtype = numpy.dtype(dtype)
+
+    def __call__(self):
+        return numpy.load(self.fileName, mmap_mode='r')
+
+    def frame(self, idx):
+        """
+        :param int idx: Index along the first axis of the array, i.e. the image in a stack
+        """
+        return self()[idx]
+
+
+class FileCache(object):
+    __doc__ = """The :py:class:`FileCache` stores the items read from a file in a local directory. Entries are keyed
+    by absolute path, size and modification time of the file, so that modified files are read again. Every entry is
+    a directory containing the pickled item list (the index) and the arrays of the items as .npy files. Arrays
+    from the cache are memory mapped, i.e. read on access.
+
+    The entries do not share any state, therefore the cache can be used from several threads or processes at once.
+    The size of the cache is tracked by :func:`put`. Once a new entry pushes the tracked size over the maximum size,
+    the least recently used entries are removed by :func:`evict`. Entries stored by other processes are only
+    accounted for the next time :func:`evict` scans the cache directory.
+
+    .. py:attribute:: directory
+
+        Directory containing the cache entries
+
+    .. py:attribute:: maxSize
+
+        Maximum size of the cache in bytes"""
+
+    def __init__(self, directory=None, maxSize=10 * 2 ** 30):
+        if directory is None:
+            directory = OsPathJoin(OsExpandUser('~'), '.rixstool', 'cache')
+        self.directory = OsAbsPath(directory)
+        self.maxSize = maxSize
+        if not OsPathIsDir(self.directory):
+            OsMakeDirs(self.directory)
+        # Estimate of the size in bytes, updated by put and evict
+        self._size = self.size()
+
+    def key(self, fileName):
+        """
+        :param str fileName: File name including path to the file
+
+        :returns str: Key of the entry for the current version of the file
+        :raises OSError: if the file does not exist
+        """
+        fileName = OsAbsPath(fileName)
+        stat = OsStat(fileName)
+        identifier = repr((CACHE_VERSION, fileName, stat.st_size, stat.st_mtime))
+        return hashlib.sha1(identifier.encode('utf-8')).hexdigest()
+
+    def get(self, fileName):
+        """
+        :param str fileName: File name including path to the file
+
+        :returns: List of items read from the file or None if the file is not in the cache
+        :rtype: list
+        """
+        entry = OsPathJoin(self.directory, self.key(fileName))
+        index = OsPathJoin(entry, INDEX_NAME)
+        try:
+            with open(index, 'rb') as indexFile:
+                itemList = pickle.load(indexFile)
+            # Mark entry as recently used
+            OsUtime(index, None)
+        except (IOError, OSError):
+            return None
+        if DEBUG >= 1:
+            print("FileCache.get -- Found '%s'" % fileName)
+        return itemList
+
+    def put(self, fileName, itemList):
+        """
+        :param str fileName: File name including path to the file
+        :param list itemList: Items read from the file
+
+        Stores the items in a new entry. The entry is written under a temporary name and renamed when it is
+        complete, so that concurrent readers never see partial entries.
+        """
+        key = self.key(fileName)
+        entry = OsPathJoin(self.directory, key)
+        if OsPathIsDir(entry):
+            return
+        tmpEntry = '%s.tmp-%d-%d' % (entry, OsGetPid(), threading.current_thread().ident)
+        OsMakeDirs(tmpEntry)
+        try:
+            cachedList = []
+            for idx, item in enumerate(itemList):
+                # Lazy items stay unloaded, otherwise every cached file would keep its memory map open
+                array = item.readArray()
+                arrayName = OsPathJoin(entry, '%d.npy' % idx)
+                numpy.save(OsPathJoin(tmpEntry, '%d.npy' % idx), array)
+                # Shallow copy of the item that reads its data from the cache
+                cached = copy.copy(item)
+                cached.setLoader(NpyLoader(arrayName, array.shape, array.dtype))
+                cachedList += [cached]
+            with open(OsPathJoin(tmpEntry, INDEX_NAME), 'wb') as indexFile:
+                pickle.dump(cachedList, indexFile, pickle.HIGHEST_PROTOCOL)
+            size = sum(OsPathGetSize(OsPathJoin(tmpEntry, name)) for name in OsListDir(tmpEntry))
+            OsRename(tmpEntry, entry)
+        except Exception:
+            shutil.rmtree(tmpEntry, ignore_errors=True)
+            if OsPathIsDir(entry):
+                # Entry was stored concurrently
+                return
+            raise
+        if DEBUG >= 1:
+            print("FileCache.put -- Stored '%s'" % fileName)
+        self._size += size
+        if self._size > self.maxSize:
+            self.evict()
+
+    def size(self):
+        """
+        :returns int: Size of all entries in bytes
+        """
+        return sum(size for entry, size, lastUse in self._entries())
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the size of the cache is below :py:attr:`maxSize`. The cache
+        directory is scanned, i.e. the cost grows with the number of entries.
+
+        :returns int: Number of removed entries
+        """
+        entries = self._entries()
+        total = sum(size for entry, size, lastUse in entries)
+        removed = 0
+        for entry, size, lastUse in sorted(entries, key=lambda entryTuple: entryTuple[2]):
+            if total <= self.maxSize:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            removed += 1
+        self._size = total
+        if DEBUG >= 1:
+            print('FileCache.evict -- Removed %d entries' % removed)
+        return removed
+
+    def clear(self):
+        """
+        Removes all entries
+        """
+        for entry, size, lastUse in self._entries():
+            shutil.rmtree(entry, ignore_errors=True)
+        self._size = 0
+
+    def _entries(self):
+        """
+        :returns list: Triples of entry directory, size in bytes and time of last use
+        """
+        entries = []
+        for name in OsListDir(self.directory):
+            entry = OsPathJoin(self.directory, name)
+            try:
+                lastUse = OsStat(OsPathJoin(entry, INDEX_NAME)).st_mtime
+                size = sum(OsPathGetSize(OsPathJoin(entry, fileName)) for fileName in OsListDir(entry))
+            except (IOError, OSError):
+                # Incomplete or concurrently removed entry
+                continue
+            entries += [(entry, size, lastUse)]
+        return entries
@@ -0,0 +1,249 @@
+#/*##########################################################################
+# Copyright (C) 2014 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# This toolkit is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2 of the License, or (at your option)
+# any later version.
+#
+# PyMca is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyMca; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# PyMca follows the dual licensing model of Riverbank's PyQt and cannot be
+# used as a free plugin for a non-free program.
+#
+# Please contact the ESRF industrial unit (industry@esrf.fr) if this license
+# is a problem for you.
+#############################################################################*/
+__author__ = "Tonn Rueter - ESRF Data Analysis Unit"
+__doc__ = """Export of spectra to SPEC files. The spectra are formatted in bulk and streamed to the file in chunks of
+rows, so that the memory needed does not grow with the number of spectra. Optionally, the spectra are also written to
+a binary (npz or HDF5) file next to the SPEC file. The module does not depend on the GUI."""
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+import numpy
+import zipfile
+import sys
+
+from io import BytesIO
+from numpy.lib.format import write_array
+from os.path import splitext as OsPathSplitext
+
+from RixsTool.Items import ScanItem, SpecItem
+
+DEBUG = 0
+
+CHUNK_ROWS = 4096  # Number of rows formatted at a time
+BINARY_FORMATS = {
+    'npz': '.npz',
+    'hdf5': '.h5'
+}
+
+
+def _checkH5py():
+    if h5py is None:
+        raise ImportError('Export -- h5py is required to write HDF5 files')
+
+
+def formatRows(data, fmt='%.6f', delimiter=' ', newline='\n'):
+    """
+    :param ndarray data: Two dimensional numpy.ndarray
+    :param str fmt: Format of a single value
+    :param str delimiter: Separates the columns
+    :param str newline: Terminates a row
+
+    Formats all values of data with a single string operation. The result is identical to numpy.savetxt.
+
+    :returns str: Formatted rows
+    """
+    nRows, nCols = data.shape
+    row = delimiter.join([fmt] * nCols) + newline
+    return (row * nRows) % tuple(data.ravel().tolist())
+
+
+def spectrumColumns(item, scales=None):
+    """
+    :param DataItem item: SpecItem or ScanItem
+    :param dict scales: Pixel scales by spectrum length, reused between spectra (default: None)
+
+    The columns of a :py:class:`RixsTool.Items.ScanItem` are its scale and its array. Spectra without scale are
+    written against the pixel number.
+
+    :returns ndarray: Two dimensional numpy.ndarray with one row per point
+    :raises NotImplementedError: if the item is neither a SpecItem nor a ScanItem
+    """
+    if not isinstance(item, (ScanItem, SpecItem)):
+        raise NotImplementedError('spectrumColumns -- Unknown item type: %s' % type(item))
+    counts = numpy.asarray(item.array)
+    if counts.ndim != 1:
+        raise NotImplementedError('spectrumColumns -- Can write item with dimensionality > 1')
+    scale = item.scale() if isinstance(item, ScanItem) else None
+    if scale is None:
+        if scales is None:
+            scales = {}
+        if len(counts) not in scales:
+            scales[len(counts)] = numpy.arange(len(counts), dtype=numpy.float64)
+        scale = scales[len(counts)]
+    data = numpy.empty(shape=(len(counts), 2), dtype=numpy.float64)
+    data[:, 0] = scale
+    data[:, 1] = counts
+    return data
+
+
+def writeScan(fileHandle, scanNumber, key, data, labels=('PixelNo', 'Counts'), fmt='%.6f', chunkRows=CHUNK_ROWS):
+    """
+    :param file fileHandle: File opened for writing in binary mode
+    :param int scanNumber: Number of the scan in the file
+    :param str key: Scan title
+    :param ndarray data: Two dimensional numpy.ndarray, one column per label
+    :param tuple labels: Column labels
+    :param str fmt: Format of a single value
+    :param int chunkRows: Number of rows formatted and written at a time
+
+    Writes a scan in SPEC format, i.e. header lines followed by the data rows.
+    """
+    header = '#S %d %s\n#N %d\n#L %s\n' % (scanNumber, key, data.shape[1], '  '.join(labels))
+    fileHandle.write(header.encode('utf-8'))
+    for start in range(0, len(data), chunkRows):
+        fileHandle.write(formatRows(data[start:start + chunkRows], fmt).encode('ascii'))
+    fileHandle.write(b'\n')
+
+
+def binaryFileName(fileName, binaryFormat):
+    """
+    :param str fileName: Name of the SPEC file
+    :param str binaryFormat: 'npz' or 'hdf5'
+
+    :returns str: Name of the binary file next to the SPEC file
+    :raises ValueError: if the format is unknown
+    """
+    if binaryFormat not in BINARY_FORMATS:
+        raise ValueError("binaryFileName -- Unknown binary format '%s'" % str(binaryFormat))
+    return OsPathSplitext(fileName)[0] + BINARY_FORMATS[binaryFormat]
+
+
+class NpzWriter(object):
+    __doc__ = """Writes spectra to a numpy .npz archive, readable by numpy.load. The arrays scale<idx> and counts<idx>
+    of a spectrum are written to the archive as it is appended, the array keys is written on :func:`close`. Only the
+    keys of the spectra are kept in memory."""
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.keys = []
+        self.zipFile = zipfile.ZipFile(fileName, mode='w', compression=zipfile.ZIP_STORED, allowZip64=True)
+
+    def _writeMember(self, name, array):
+        array = numpy.asanyarray(array)
+        if sys.version_info >= (3, 6):
+            with self.zipFile.open(name + '.npy', 'w', force_zip64=True) as member:
+                write_array(member, array, allow_pickle=False)
+        else:
+            # ZipFile.open can not write members before Python 3.6
+            member = BytesIO()
+            write_array(member, array, allow_pickle=False)
+            self.zipFile.writestr(name + '.npy', member.getvalue())
+
+    def append(self, key, data):
+        idx = len(self.keys)
+        self.keys += [key]
+        self._writeMember('scale%d' % idx, data[:, 0])
+        self._writeMember('counts%d' % idx, data[:, 1])
+
+    def close(self):
+        try:
+            self._writeMember('keys', numpy.array(self.keys))
+        finally:
+            self.zipFile.close()
+
+
+class HDF5Writer(object):
+    __doc__ = """Writes every spectrum to a group of a HDF5 file as datasets scale and counts. The groups are named by
+    their index, the key of the spectrum is stored in the attribute key."""
+
+    def __init__(self, fileName):
+        """
+        :raises ImportError: if h5py is not available
+        """
+        _checkH5py()
+        self.fileName = fileName
+        self.count = 0
+        self.h5File = h5py.File(fileName, 'w')
+
+    def append(self, key, data):
+        group = self.h5File.create_group('%05d' % self.count)
+        group.attrs['key'] = key
+        group.create_dataset('scale', data=data[:, 0])
+        group.create_dataset('counts', data=data[:, 1])
+        self.count += 1
+
+    def close(self):
+        self.h5File.close()
+
+
+def exportSpectra(itemList, fileName, singleFile=True, binaryFormat=None, fmt='%.6f', callback=None):
+    """
+    :param list itemList: SpecItems and ScanItems to export
+    :param str fileName: Name of the SPEC file
+    :param bool singleFile: Write all spectra to fileName. Otherwise every spectrum is written to its own file, named
+     by appending the index of the spectrum to fileName (default: True)
+    :param str binaryFormat: Also write the spectra to a binary file next to fileName, either 'npz' or 'hdf5'
+     (default: None)
+    :param str fmt: Format of a single value
+    :param callback: Called with the number of exported spectra and the total number after every spectrum, e.g. to
+     report progress (default: None)
+
+    :returns list: Names of the files written
+    :raises ValueError: if the binary format is unknown
+    """
+    binaryWriter = None
+    if binaryFormat is not None:
+        binaryName = binaryFileName(fileName, binaryFormat)
+        binaryWriter = NpzWriter(binaryName) if binaryFormat == 'npz' else HDF5Writer(binaryName)
+
+    path, ext = OsPathSplitext(fileName)
+    width = len(str(len(itemList)))
+    scales = {}
+    fileNameList = []
+    fileHandle = None
+    try:
+        if singleFile:
+            fileHandle = open(fileName, 'wb')
+            fileHandle.write(b'\n')
+            fileNameList += [fileName]
+        for idx, item in enumerate(itemList):
+            data = spectrumColumns(item, scales)
+            if singleFile:
+                writeScan(fileHandle, idx + 1, item.key(), data, fmt=fmt)
+            else:
+                numberedPath = '{path}_{idx:0>{width}}{ext}'.format(path=path, idx=idx, width=width, ext=ext)
+                with open(numberedPath, 'wb') as numberedHandle:
+                    numberedHandle.write(b'\n')
+                    writeScan(numberedHandle, 1, item.key(), data, fmt=fmt)
+                fileNameList += [numberedPath]
+            if binaryWriter is not None:
+                binaryWriter.append(item.key(), data)
+            if callback is not None:
+                callback(idx + 1, len(itemList))
+    finally:
+        if fileHandle is not None:
+            fileHandle.close()
+        if binaryWriter is not None:
+            binaryWriter.close()
+    if binaryWriter is not None:
+        fileNameList += [binaryWriter.fileName]
+    if DEBUG >= 1:
+        print('exportSpectra -- Wrote %d spectra to %s' % (len(itemList), ', '.join(fileNameList)))
+    return fileNameList
@@ -75,8 +75,7 @@ class Fit(object):
         #
         # Function definition: y = a * x**2 + b * x + c
         #
-        expression = lambda x, a, b, c: a * x**2 + b * x + c
-        function.setExpression(expression)
+        function.setExpression('lambda x, a, b, c: a * x**2 + b * x + c')
 
         #
         # Parameter assignment
@@ -93,4 +92,104 @@ class Fit(object):
             print('\ta = %.3e' % par[0])
             print('\tb = %.3e' % par[1])
             print('\tc = %.3e' % par[2])
-        return function
\ No newline at end of file
+        return function
+
+    @staticmethod
+    def gaussians(curves, estimates, x=None, weights=None, maxIterations=100, tolerance=1e-8):
+        """
+        :param ndarray curves: Two dimensional array, every row is fitted independently
+        :param ndarray estimates: Initial values of height, position and FWHM for every curve, shape (nCurves, 3)
+        :param ndarray x: x-range common to all curves (default: None, i.e. channel numbers)
+        :param ndarray weights: Weight of every point, e.g. a mask selecting the points used in the fit (default: 1)
+        :param int maxIterations: Maximum number of iterations
+        :param float tolerance: A fit converged once the relative change of chi-square falls below the tolerance
+
+        Fits y = height * exp(-4 ln(2) (x - position)**2 / fwhm**2), i.e. :py:func:`PyMca5.PyMca.SpecfitFuns.gauss`,
+        to all curves simultaneously. Levenberg-Marquardt steps are calculated for all curves at once from
+        stacked normal equations, curves drop out of the iteration once they converged.
+
+        :returns tuple: fitp, chisq and sigma. fitp and sigma have shape (nCurves, 3) and contain height, position
+         and FWHM respectively their uncertainties. chisq contains the reduced chi-square of every curve. Curves
+         for which the fit failed are NaN.
+        """
+        curves = numpy.asarray(curves, dtype=numpy.float64)
+        nCurves, nPoints = curves.shape
+        if x is None:
+            x = numpy.arange(nPoints, dtype=numpy.float64)
+        x = numpy.asarray(x, dtype=numpy.float64)
+        if weights is None:
+            weights = numpy.ones(curves.shape, dtype=numpy.float64)
+        else:
+            weights = numpy.ascontiguousarray(numpy.broadcast_to(weights, curves.shape), dtype=numpy.float64)
+        fitp = numpy.array(estimates, dtype=numpy.float64, ndmin=2)
+        if fitp.shape != (nCurves, 3):
+            raise ValueError('Fit.gaussians -- estimates must have shape (%d, 3)' % nCurves)
+
+        def evaluate(params, idx):
+            # Residuals, Jacobian of the model and weighted sum of squares
+            height, position, fwhm = params[:, 0:1], params[:, 1:2], params[:, 2:3]
+            dx = x - position
+            factor = 4. * numpy.log(2.) / fwhm ** 2
+            gauss = numpy.exp(-factor * dx ** 2)
+            model = height * gauss
+            jacobian = numpy.empty(model.shape + (3,))
+            jacobian[:, :, 0] = gauss
+            jacobian[:, :, 1] = 2. * factor * dx * model
+            jacobian[:, :, 2] = 2. * factor * dx ** 2 * model / fwhm
+            residuals = curves[idx] - model
+            chisq = (weights[idx] * residuals ** 2).sum(axis=1)
+            return residuals, jacobian, chisq
+
+        allCurves = numpy.arange(nCurves)
+        residuals, jacobian, chisq = evaluate(fitp, allCurves)
+        damping = numpy.full(nCurves, 1e-3)
+        active = numpy.isfinite(chisq)
+        for iteration in range(maxIterations):
+            idx = numpy.nonzero(active)[0]
+            if not len(idx):
+                break
+            weightedJacobian = jacobian[idx] * weights[idx, :, numpy.newaxis]
+            alpha = numpy.einsum('nki,nkj->nij', weightedJacobian, jacobian[idx])
+            beta = numpy.einsum('nki,nk->ni', weightedJacobian, residuals[idx])
+            diagonal = numpy.diagonal(alpha, axis1=1, axis2=2).copy()
+            diagonal[diagonal <= 0.] = 1.
+            system = alpha + damping[idx, numpy.newaxis, numpy.newaxis] * (diagonal[:, :, numpy.newaxis] *
+                                                                           numpy.eye(3))
+            try:
+                step = numpy.linalg.solve(system, beta[:, :, numpy.newaxis])[:, :, 0]
+            except numpy.linalg.LinAlgError:
+                step = numpy.einsum('nij,nj->ni', numpy.linalg.pinv(system), beta)
+
+            trial = fitp[idx] + step
+            trialResiduals, trialJacobian, trialChisq = evaluate(trial, idx)
+            better = numpy.isfinite(trialChisq) & (trialChisq <= chisq[idx])
+            improved = idx[better]
+            converged = better & (chisq[idx] - trialChisq <= tolerance * chisq[idx])
+            fitp[improved] = trial[better]
+            residuals[improved] = trialResiduals[better]
+            jacobian[improved] = trialJacobian[better]
+            chisq[improved] = trialChisq[better]
+            damping[improved] *= .1
+            damping[idx[~better]] *= 10.
+            active[idx[converged]] = False
+            active[damping > 1e10] = False
+        if DEBUG >= 2:
+            print('Fit.gaussians -- %d curves, %d iterations, %d not converged' % (nCurves, iteration + 1,
+                                                                                 active.sum()))
+
+        #
+        # Uncertainties from the covariance matrix, scaled by the reduced chi-square
+        #
+        degreesOfFreedom = (weights > 0).sum(axis=1) - 3
+        reducedChisq = numpy.where(degreesOfFreedom > 0, chisq / numpy.maximum(degreesOfFreedom, 1), numpy.nan)
+        weightedJacobian = jacobian * weights[:, :, numpy.newaxis]
+        alpha = numpy.einsum('nki,nkj->nij', weightedJacobian, jacobian)
+        covariance = numpy.linalg.pinv(alpha)
+        sigma = numpy.sqrt(numpy.abs(numpy.diagonal(covariance, axis1=1, axis2=2)) * reducedChisq[:, numpy.newaxis])
+
+        fitp[:, 2] = numpy.abs(fitp[:, 2])
+        failed = ~numpy.isfinite(fitp).all(axis=1) | ~numpy.isfinite(reducedChisq)
+        fitp[failed] = numpy.nan
+        sigma[failed] = numpy.nan
+        reducedChisq[failed] = numpy.nan
+        return fitp, reducedChisq, sigma
\ No newline at end of file
@@ -0,0 +1,262 @@
+#/*##########################################################################
+# Copyright (C) 2014 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# This toolkit is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2 of the License, or (at your option)
+# any later version.
+#
+# PyMca is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyMca; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# PyMca follows the dual licensing model of Riverbank's PyQt and cannot be
+# used as a free plugin for a non-free program.
+#
+# Please contact the ESRF industrial unit (industry@esrf.fr) if this license
+# is a problem for you.
+#############################################################################*/
+__author__ = "Tonn Rueter - ESRF Data Analysis Unit"
+__doc__ = """Module provides saving and loading of a :py:class:`RixsTool.Project.RixsProject` to and from a single HDF5
+file. The groups in the file mirror the project tree, the data of the items is stored in chunked and compressed
+datasets (c.f. :py:func:`RixsTool.Items.ProjectItem.hdf5Dump`). Loading a project only reads the tree and the
+attributes of the items, the datasets are read when the data is accessed.
+
+Layout of a project file::
+
+    /project                    attrs: version
+        /000000                 attrs: class='ItemContainer', label='Spectra'
+            /000000             attrs: class='ScanItem', label, key, header, fileLocation
+                array
+                scale
+            ...
+        /000001                 attrs: class='ItemContainer', label='Images'
+        ..."""
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+import json
+import numpy
+from os import remove as OsRemove
+from os import rename as OsRename
+from os.path import abspath as OsAbsPath
+from os.path import exists as OsPathExists
+
+from RixsTool.Items import SpecItem, ScanItem, ImageItem, StackItem, DarkItem, AccumulatorItem, FunctionItem
+
+DEBUG = 0
+
+FORMAT_VERSION = 1
+CONTAINER_CLASS = 'ItemContainer'
+ITEM_CLASSES = dict((cls.__name__, cls) for cls in [SpecItem, ScanItem, ImageItem, StackItem, DarkItem,
+                                                            AccumulatorItem])
+
+
+class HDF5DatasetLoader(object):
+    __doc__ = """Picklable loader that reads a dataset from a HDF5 file when it is called, c.f.
+    :py:func:`RixsTool.Items.DataItem.setLoader`. The file is only open while the data is read."""
+
+    def __init__(self, fileName, path, shape, dtype):
+        """
+        :param str fileName: Name of the HDF5 file
+        :param str path: Path of the dataset inside the file
+        :param tuple shape: Shape of the dataset
+        :param dtype: Type of the dataset
+        """
+        self.fileName = fileName
+        self.path = path
+        self.shape = tuple(shape)
+        self.dtype = numpy.dtype(dtype)
+
+    def __call__(self):
+        with h5py.File(self.fileName, 'r') as h5File:
+            return h5File[self.path][()]
+
+    def frame(self, idx):
+        """
+        :param int idx: Index along the first axis of the dataset, i.e. the image in a stack
+
+        :returns ndarray: Only the requested part of the dataset
+        """
+        with h5py.File(self.fileName, 'r') as h5File:
+            return h5File[self.path][idx]
+
+
+def saveProject(project, fileName):
+    """
+    :param RixsProject project: Project to be saved
+    :param str fileName: Name of the HDF5 file
+
+    Writes the project tree and all items to fileName. The file is written under a temporary name and replaces
+    an existing file only when complete, so that a project can be saved to the file it was loaded from. Items
+    whose data is read from that file are afterwards read from the new file.
+
+    :raises ImportError: if h5py is not available
+    :raises ValueError: if an item can not be stored, c.f. :py:func:`RixsTool.Items.FunctionItem.hdf5Dump`
+    """
+    _checkH5py()
+    fileName = OsAbsPath(fileName)
+    tmpName = fileName + '.tmp'
+    dumped = []
+    with h5py.File(tmpName, 'w') as h5File:
+        h5File.attrs['creator'] = 'RixsTool'
+        root = h5File.create_group('project')
+        root.attrs['version'] = FORMAT_VERSION
+        _dumpContainer(project.projectRoot, root, dumped)
+    if OsPathExists(fileName):
+        OsRemove(fileName)
+    OsRename(tmpName, fileName)
+
+    for item, dataset in dumped:
+        loader = item.loader()
+        if isinstance(loader, HDF5DatasetLoader) and loader.fileName == fileName:
+            item.setLoader(HDF5DatasetLoader(fileName, dataset, loader.shape, loader.dtype))
+    if DEBUG >= 1:
+        print("HDF5Backend.saveProject -- Saved %d datasets to '%s'" % (len(dumped), fileName))
+
+
+def loadProject(project, fileName):
+    """
+    :param RixsProject project: Project the content of the file is added to
+    :param str fileName: Name of the HDF5 file
+
+    Adds the groups and items stored in fileName to the project. The data of the items is read on access. The
+    whole file is read and checked before the project is changed, so that the project remains unchanged if the
+    file can not be loaded.
+
+    :returns list: Loaded items
+    :raises ImportError: if h5py is not available
+    :raises ValueError: if the file is not a project file or an item key is already present in the project
+    """
+    _checkH5py()
+    fileName = OsAbsPath(fileName)
+    groupList = []
+    itemList = []
+    with h5py.File(fileName, 'r') as h5File:
+        if 'project' not in h5File:
+            raise ValueError("HDF5Backend.loadProject -- '%s' is not a project file" % fileName)
+        root = h5File['project']
+        version = root.attrs.get('version', 0)
+        if version > FORMAT_VERSION:
+            raise ValueError('HDF5Backend.loadProject -- Unsupported file version %d' % version)
+        _loadContainer(root, None, fileName, groupList, itemList)
+    _checkKeys(project, groupList, itemList)
+
+    for label, parentLabel in groupList:
+        if label not in project:
+            project.addGroup(label, project[parentLabel] if parentLabel is not None else None)
+    project.addItems(itemList)
+    return itemList
+
+
+def _checkH5py():
+    if h5py is None:
+        raise ImportError('HDF5Backend -- h5py is required to save and load projects')
+
+
+def _attribute(group, name, default=None):
+    value = group.attrs.get(name, default)
+    if isinstance(value, bytes) and not isinstance(value, str):
+        value = value.decode('utf-8')
+    return value
+
+
+def _dumpContainer(container, group, dumped):
+    for idx, child in enumerate(container.children):
+        childGroup = group.create_group('%06d' % idx)
+        childGroup.attrs['label'] = child.label
+        if child.hasItem():
+            item = child.item()
+            item.hdf5Dump(childGroup)
+            if 'array' in childGroup:
+                dumped += [(item, childGroup['array'].name)]
+        else:
+            childGroup.attrs['class'] = CONTAINER_CLASS
+            _dumpContainer(child, childGroup, dumped)
+
+
+def _loadContainer(group, parentLabel, fileName, groupList, itemList):
+    for name in sorted(group.keys()):
+        childGroup = group[name]
+        className = _attribute(childGroup, 'class')
+        if className == CONTAINER_CLASS:
+            label = _attribute(childGroup, 'label')
+            groupList += [(label, parentLabel)]
+            _loadContainer(childGroup, label, fileName, groupList, itemList)
+        elif className in ITEM_CLASSES:
+            itemList += [_loadItem(ITEM_CLASSES[className], childGroup, fileName)]
+        else:
+            raise ValueError("HDF5Backend.loadProject -- Unknown class '%s' in '%s'" % (className, childGroup.name))
+
+
+def _checkKeys(project, groupList, itemList):
+    """
+    :raises ValueError: if an item key is already present in the project or in the file, or a group label is used
+     by an item
+    """
+    labels = set(label for label, parentLabel in groupList)
+    keys = set()
+    for item in itemList:
+        key = item.key()
+        if key in project or key in keys or key in labels:
+            raise ValueError("HDF5Backend.loadProject -- Item key '%s' already present" % key)
+        keys.add(key)
+    for label in labels:
+        if label in project and project[label].hasItem():
+            raise ValueError("HDF5Backend.loadProject -- Group label '%s' is used by an item" % label)
+
+
+def _loadItem(itemClass, group, fileName):
+    item = itemClass(
+        key=_attribute(group, 'key'),
+        header=json.loads(_attribute(group, 'header', 'null')),
+        array=None,
+        fileLocation=_attribute(group, 'fileLocation') or None
+    )
+    if 'array' in group:
+        dataset = group['array']
+        item.setLoader(HDF5DatasetLoader(fileName, dataset.name, dataset.shape, dataset.dtype))
+    if isinstance(item, ScanItem):
+        if 'scale' in group:
+            scale = group['scale']
+            if isinstance(scale, h5py.Group):
+                item.setScale(_loadFunction(scale))
+            else:
+                item.setScale(scale[()])
+        if 'columns' in group:
+            item.setColumns(group['columns'][()])
+    elif isinstance(item, ImageItem):
+        for name in ['scaleX', 'scaleY']:
+            if name in group:
+                setattr(item, name, group[name][()])
+    elif isinstance(item, DarkItem):
+        item.mode = _attribute(group, 'mode', item.mode)
+        item.count = int(_attribute(group, 'count', 1))
+    elif isinstance(item, AccumulatorItem):
+        if 'mean' in group:
+            item.setStatistics(_attribute(group, 'count'), group['mean'][()], group['m2'][()])
+    if DEBUG >= 1:
+        print("HDF5Backend.loadProject -- Loaded '%s'" % item.key())
+    return item
+
+
+def _loadFunction(group):
+    function = FunctionItem(
+        key=_attribute(group, 'key'),
+        header=json.loads(_attribute(group, 'header', 'null'))
+    )
+    function.setExpression(_attribute(group, 'expression'))
+    parameters = group['parameters']
+    function.setParameters(dict((name, parameters.attrs[name]) for name in parameters.attrs))
+    return function
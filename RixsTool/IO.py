@@ -41,7 +41,7 @@ from PyMca5.PyMcaIO.EdfFile import EdfFile
 # Imports for file access
 #
 from os.path import split as OsPathSplit
-from os import linesep as NEWLINE
+from os.path import getsize as OsPathGetSize
 from os import access as OsAccess
 from os import R_OK as OS_R_OK
 
@@ -50,14 +50,22 @@ from os import R_OK as OS_R_OK
 #
 import numpy as np
 import time
+import warnings
+import re
 
 #
 # ProjectItem to wrap data in
 #
-from RixsTool.Items import ImageItem, SpecItem, ScanItem
+from RixsTool.Items import ImageItem, SpecItem, ScanItem, StackItem
 
 DEBUG = 0
 
+#
+# Comments in plain text files
+#
+COMMENT_LINE = re.compile(r'^[ \t]*#.*$', re.MULTILINE)
+COMMENT = re.compile(r'#.*$', re.MULTILINE)
+
 
 class IODict(object):
     EDF_TYPE = 'edf'    # -> Wrapper for edf files
@@ -126,35 +134,186 @@ class InputReader(object):
             raise ValueError("InputReader.itemize -- Invalid file '%s'" % fileName)
 
 
+class EdfMemoryMap(object):
+    __doc__ = """Picklable loader that maps the data of an image in an edf file into memory"""
+
+    def __init__(self, fileName, dtype, offset, shape):
+        """
+        :param str fileName: File name including absolute path to the file
+        :param dtype: Type of the data as stored in the file, including byte order
+        :param int offset: Position of the data in the file in bytes
+        :param tuple shape: Shape of the data
+        """
+        self.fileName = fileName
+        self.fileType = np.dtype(dtype)
+        self.dtype = self.fileType.newbyteorder('=')
+        self.offset = offset
+        self.shape = tuple(shape)
+
+    def nbytes(self):
+        return int(np.prod(self.shape)) * self.fileType.itemsize
+
+    def __call__(self):
+        """
+        :returns: Read-only memory mapped array, pixels are read from disk when they are accessed
+        :rtype: numpy.memmap
+        """
+        arr = np.memmap(self.fileName,
+                        dtype=self.fileType,
+                        mode='r',
+                        offset=self.offset,
+                        shape=self.shape)
+        if not self.fileType.isnative:
+            # Data has to be swapped to native byte order
+            arr = arr.astype(self.dtype)
+        return arr
+
+
+class EdfStackMemoryMap(object):
+    __doc__ = """Picklable loader that maps the images of a multi-image edf file into memory"""
+
+    def __init__(self, frameMaps):
+        """
+        :param list frameMaps: EdfMemoryMap instances of the images, all images must have the same shape and type
+        """
+        first = frameMaps[0]
+        for frameMap in frameMaps:
+            if frameMap.shape != first.shape or frameMap.fileType != first.fileType:
+                raise ValueError('EdfStackMemoryMap -- Images differ in shape or type')
+        self.frameMaps = frameMaps
+        self.fileName = first.fileName
+        self.fileType = first.fileType
+        self.dtype = first.dtype
+        self.shape = (len(frameMaps),) + first.shape
+
+    def frame(self, idx):
+        """
+        :param int idx: Index of the image in the stack
+        :returns: Memory mapped image
+        :rtype: numpy.memmap
+        """
+        return self.frameMaps[idx]()
+
+    def __call__(self):
+        """
+        If the images are evenly spaced in the file, i.e. all headers have the same size, the stack is a strided
+        view on a single memory map. Otherwise the images are copied into one array.
+
+        :returns: Three dimensional array of shape (images, rows, columns)
+        :rtype: ndarray
+        """
+        offsets = [frameMap.offset for frameMap in self.frameMaps]
+        steps = np.diff(offsets)
+        if len(steps) and (steps == steps[0]).all():
+            step = int(steps[0])
+            frameShape = self.shape[1:]
+            frameStrides = []
+            stride = self.fileType.itemsize
+            for dim in reversed(frameShape):
+                frameStrides.insert(0, stride)
+                stride *= dim
+            raw = np.memmap(self.fileName,
+                            dtype=np.uint8,
+                            mode='r',
+                            offset=offsets[0],
+                            shape=((len(offsets) - 1) * step + self.frameMaps[0].nbytes(),))
+            arr = np.ndarray(self.shape,
+                             dtype=self.fileType,
+                             buffer=raw,
+                             strides=(step,) + tuple(frameStrides))
+            if not self.fileType.isnative:
+                # Data has to be swapped to native byte order
+                arr = arr.astype(self.dtype)
+            return arr
+        arr = np.empty(self.shape, dtype=self.dtype)
+        for idx, frameMap in enumerate(self.frameMaps):
+            arr[idx] = frameMap()
+        return arr
+
+
 class EdfReader(InputReader):
     def __init__(self):
         super(EdfReader, self).__init__()
         self._srcType = EdfFile
 
+    def memoryMap(self, index):
+        """
+        :param int index: Index of the image in the file
+
+        Determines the position of the data of an image from its header.
+
+        :returns: Loader for the image data or None if the data can not be mapped, e.g. for compressed files
+        :rtype: EdfMemoryMap
+        """
+        reader = self.reader
+        for wrappedFormat in ['ADSC', 'MARCCD', 'PILATUS_CBF', 'SPE', 'TIFF']:
+            if getattr(reader, wrappedFormat, False):
+                return None
+        if reader.FileName.lower().endswith(('.gz', '.bz2')):
+            return None
+
+        image = reader.Images[index]
+        dtype = np.dtype(reader.GetDefaultNumpyType(image.DataType, index=index))
+        if image.ByteOrder.upper() == 'HIGHBYTEFIRST':
+            dtype = dtype.newbyteorder('>')
+        else:
+            dtype = dtype.newbyteorder('<')
+        if image.NumDim == 3:
+            shape = (image.Dim3, image.Dim2, image.Dim1)
+        elif image.NumDim == 2:
+            shape = (image.Dim2, image.Dim1)
+        else:
+            shape = (image.Dim1,)
+
+        memoryMap = EdfMemoryMap(reader.FileName, dtype, image.DataPosition, shape)
+        if OsPathGetSize(reader.FileName) < memoryMap.offset + memoryMap.nbytes():
+            # Truncated file, let EdfFile handle it
+            return None
+        return memoryMap
+
     def itemize(self, fileName):
         timeStart = time.time()
         InputReader.itemize(self, fileName)
 
         numImages = self.reader.GetNumImages()
+        memoryMaps = [self.memoryMap(idx) for idx in range(numImages)]
+        if None in memoryMaps:
+            memoryMaps = None
         llist = []
         if numImages > 1:
-            raise NotImplementedError('EdfReader.itemize -- No support for edfs containing multiple images')
-            #for idx in range(numImages):
-            #    arr = reader.GetData(idx)
-            #    newItem = ImageItem(
-            #        key=key,
-            #        header=reader.GetHeader(0),
-            #        array=np.ascontiguousarray(arr, arr.dtype),
-            #        fileLocation=reader.FileName
-            #    )
+            if memoryMaps is None:
+                arr = np.asarray([self.reader.GetData(idx) for idx in range(numImages)])
+            else:
+                arr = None
+            newItem = StackItem(
+                key=self.key,
+                header=self.reader.GetHeader(0),
+                array=arr,
+                fileLocation=self.reader.FileName)
+            if memoryMaps is not None:
+                # Images are read one at a time when they are accessed
+                newItem.setLoader(EdfStackMemoryMap(memoryMaps))
         else:
-            arr = self.reader.GetData(0)
-            newItem = ImageItem(
+            if memoryMaps is None:
+                arr = self.reader.GetData(0)
+                arr = np.ascontiguousarray(arr, arr.dtype)
+                ndim = arr.ndim
+            else:
+                arr = None
+                ndim = len(memoryMaps[0].shape)
+            if ndim == 3:
+                itemType = StackItem
+            else:
+                itemType = ImageItem
+            newItem = itemType(
                 key=self.key,
                 header=self.reader.GetHeader(0),
-                array=np.ascontiguousarray(arr, arr.dtype),
+                array=arr,
                 fileLocation=self.reader.FileName)
-            llist += [newItem]
+            if memoryMaps is not None:
+                # Pixel data is only read when the array is accessed
+                newItem.setLoader(memoryMaps[0])
+        llist += [newItem]
 
         timeEnd = time.time()
         if DEBUG >= 1:
@@ -168,7 +327,18 @@ class RawReader(InputReader):
         self._srcType = open
 
     def itemize(self, fileName):
-        #raise NotImplementedError('Shit ain\'t ready yet..')
+        """
+        :param str fileName: File name including absolute path to the file
+
+        Reads plain text files containing one or more columns of numbers. Lines starting with '#' are
+        collected in the header, comments at the end of a line are ignored. Lines may be terminated by
+        any newline convention. A single column is itemized as SpecItem, multiple columns as ScanItem
+        where the zero-th column is used as scale and the first column as data. All columns are kept,
+        c.f. :func:`ScanItem.columns`.
+
+        :returns list: Contains a single item, empty for empty files
+        :raises ValueError: If the file contains non-numeric data or rows differ in length
+        """
         timeStart = time.time()
         InputReader.itemize(self, fileName)
 
@@ -182,10 +352,17 @@ class RawReader(InputReader):
         if DEBUG >= 1:
             print("RawReader -- key: '%s'" % key)
 
-        raw = self.reader.read()
-        raw = raw.strip().split(NEWLINE)
-        if DEBUG >= 1:
-            print("RawReader -- raw: %s" % str(raw))
+        try:
+            raw = self.reader.read()
+        finally:
+            self.reader.close()
+
+        #
+        # Normalize newlines and separate comments from data
+        #
+        raw = raw.replace('\r\n', '\n').replace('\r', '\n')
+        header = '\n'.join(COMMENT_LINE.findall(raw))
+        raw = COMMENT.sub('', raw).strip()
 
         if not len(raw):
             if DEBUG >= 1:
@@ -195,47 +372,52 @@ class RawReader(InputReader):
         #
         # Try to determine the number of columns
         #
-        nRows = len(raw)
+        nCols = len(raw.split('\n', 1)[0].split())
         if DEBUG >= 1:
-            print('RawReader.itemize -- Determined %d rows' % nRows)
+            print('RawReader.itemize -- Determined %d columns' % nCols)
 
         #
-        # Try to determine the number of columns
+        # Parse all numbers in a single call. Any whitespace, including newlines, separates numbers
         #
-        nCols = len(raw[0].split())
-        if DEBUG >= 1:
-            print('RawReader.itemize -- Determined %d columns' % nCols)
-
-        data = np.zeros((nRows, nCols))
-
-        for idx, line in enumerate(raw):
-            iterator = [float(number.strip()) for number in line.split()]  # is list even in python3(.2.3)
-            data[idx, :] = np.fromiter(iterator, dtype=float)
-        data = np.squeeze(data.T)
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', DeprecationWarning)
+            try:
+                data = np.fromstring(raw, dtype=float, sep=' ')
+            except (DeprecationWarning, ValueError):
+                # Depending on the numpy version, anything else than numbers raises either
+                raise ValueError("RawReader.itemize -- Non-numeric data in '%s'" % fileName)
+        #
+        # Every data line has to contain nCols numbers, otherwise the reshape below would shift the values
+        #
+        rowLengths = set(len(line.split()) for line in raw.split('\n'))
+        rowLengths.discard(0)
+        if rowLengths != set([nCols]):
+            raise ValueError("RawReader.itemize -- Inconsistent number of columns in '%s'" % fileName)
+        data = data.reshape(-1, nCols).T
 
         if DEBUG >= 1:
             print('RawReader.itemize -- data.shape %s, data:\n%s' % (str(data.shape), data))
 
-        if len(data.shape) == 1:
+        if nCols == 1:
             item = SpecItem(
                 key=key,
-                header='',
-                array=data,
+                header=header,
+                array=data[0],
                 fileLocation=fileName
             )
-        elif len(data.shape) == 2:
+        else:
             #
-            # Set zero-th column as scale, and first column as data. IGNORE THE REST
+            # Set zero-th column as scale, and first column as data. The rest is kept as additional columns
             #
+            columns = np.ascontiguousarray(data[1:])
             item = ScanItem(
                 key=key,
-                header='',
-                array=data[1],
+                header=header,
+                array=columns[0],
                 fileLocation=fileName
             )
-            item.setScale(np.copy(data[0]))
-        else:
-            raise ValueError('RawReader.itemize -- Unexpected dimensionality')
+            item.setScale(np.ascontiguousarray(data[0]))
+            item.setColumns(columns)
 
         llist = [item]
 
@@ -262,7 +444,7 @@ def unitTest_InputReader():
 
     edfReader = EdfReader()
     for elem in sum([edfReader.itemize(fn) for fn in edfImageList], []):
-        print elem.key
+        print(elem.key)
     print(edfReader)
 
 if __name__ == '__main__':
@@ -28,9 +28,110 @@ __author__ = "Tonn Rueter - ESRF Data Analysis Unit"
 from uuid import uuid4
 from inspect import getargspec as getArgSpec
 import numpy
+import json
+import ast
 
 DEBUG = 1
 
+#
+# Syntax elements allowed in expressions of FunctionItems, c.f. compileExpression
+#
+EXPRESSION_NODES = tuple(getattr(ast, name) for name in
+                         ['Expression', 'Lambda', 'arguments', 'arg', 'Param', 'Name', 'Load', 'Call',
+                          'BinOp', 'UnaryOp', 'operator', 'unaryop', 'Num', 'Constant']
+                         if hasattr(ast, name))
+
+#
+# Attributes of numpy allowed in expressions, i.e. numeric functions and constants
+#
+EXPRESSION_ATTRIBUTES = frozenset(['sin', 'cos', 'tan', 'arcsin', 'arccos', 'arctan', 'arctan2',
+                                   'sinh', 'cosh', 'tanh', 'arcsinh', 'arccosh', 'arctanh',
+                                   'exp', 'expm1', 'log', 'log10', 'log2', 'log1p', 'sqrt', 'square', 'power',
+                                   'abs', 'absolute', 'sign', 'floor', 'ceil', 'round', 'minimum', 'maximum',
+                                   'hypot', 'heaviside', 'pi', 'e'])
+
+# Python 3 represents all constants, including strings, as ast.Constant
+CONSTANT_NODE = getattr(ast, 'Constant', ())
+
+
+def compileExpression(source):
+    """
+    :param str source: Lambda expression, e.g. 'lambda x, a, b: a * x + b'
+
+    Compiles an expression given as string. Since expressions are read from project files, only arithmetic
+    operations, numbers, the arguments of the lambda and the numeric functions and constants of numpy listed in
+    EXPRESSION_ATTRIBUTES (e.g. numpy.exp) are allowed.
+
+    :returns function: Compiled expression
+    :raises ValueError: if the source is not a lambda expression or contains anything else
+    """
+    try:
+        tree = ast.parse(source.strip(), mode='eval')
+    except SyntaxError:
+        raise ValueError("compileExpression -- Invalid expression '%s'" % source)
+    if not isinstance(tree.body, ast.Lambda):
+        raise ValueError("compileExpression -- Expression must be a lambda: '%s'" % source)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Attribute):
+            if not (isinstance(node.value, ast.Name) and node.value.id == 'numpy'
+                    and node.attr in EXPRESSION_ATTRIBUTES):
+                raise ValueError("compileExpression -- Attribute '%s' not allowed: '%s'" % (node.attr, source))
+        elif isinstance(node, CONSTANT_NODE):
+            if isinstance(node.value, bool) or not isinstance(node.value, (int, float, complex)):
+                raise ValueError("compileExpression -- Only numeric constants allowed: '%s'" % source)
+        elif isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Attribute):
+                raise ValueError("compileExpression -- Only numpy functions allowed: '%s'" % source)
+        elif not isinstance(node, EXPRESSION_NODES):
+            raise ValueError("compileExpression -- Unsupported syntax in '%s'" % source)
+    return eval(compile(tree, '<expression>', 'eval'), {'__builtins__': {}, 'numpy': numpy})
+
+
+def hdf5WriteArray(group, name, array):
+    """
+    :param h5py.Group group: Group in which the dataset is created
+    :param str name: Name of the dataset
+    :param ndarray array: Data
+
+    Writes the array as chunked and compressed dataset. Stacks are chunked image by image.
+    """
+    array = numpy.asarray(array)
+    if not array.ndim or not array.size:
+        group.create_dataset(name, data=array)
+        return
+    if array.ndim == 3:
+        chunks = (1,) + array.shape[1:]
+    else:
+        chunks = True
+    group.create_dataset(name,
+                         data=array,
+                         chunks=chunks,
+                         compression='gzip',
+                         compression_opts=4,
+                         shuffle=True)
+
+
+def hdf5WriteFrames(group, name, shape, dtype, frames):
+    """
+    :param h5py.Group group: Group in which the dataset is created
+    :param str name: Name of the dataset
+    :param tuple shape: Shape of the stack
+    :param dtype: Type of the data
+    :param frames: Iterable yielding the images of the stack
+
+    Writes a stack image by image, so that only one image has to be in memory. The dataset is chunked and
+    compressed like in :func:`hdf5WriteArray`.
+    """
+    dataset = group.create_dataset(name,
+                                   shape=tuple(shape),
+                                   dtype=dtype,
+                                   chunks=(1,) + tuple(shape[1:]),
+                                   compression='gzip',
+                                   compression_opts=4,
+                                   shuffle=True)
+    for idx, frame in enumerate(frames):
+        dataset[idx] = frame
+
 
 class ProjectItem(object):
     __doc__ = """Base class to be contained in a project"""
@@ -54,8 +155,16 @@ class ProjectItem(object):
     def getID(self):
         return self.__identifier
 
-    def hdf5Dump(self):
-        raise NotImplementedError('DataItem.hdfDump -- to be implemented here?')
+    def hdf5Dump(self, group):
+        """
+        :param h5py.Group group: Group the item is written to
+
+        Writes type, key and header of the item as attributes of the group. Subclasses extend the method to
+        write their data, c.f. :py:mod:`RixsTool.HDF5Backend`
+        """
+        group.attrs['class'] = type(self).__name__
+        group.attrs['key'] = self.key()
+        group.attrs['header'] = json.dumps(self.header, default=str)
 
 
 class DataItem(ProjectItem):
@@ -65,17 +174,77 @@ class DataItem(ProjectItem):
     def __init__(self, key, header, array, fileLocation):
         ProjectItem.__init__(self, key, header)
         self.fileLocation = fileLocation
-        self.array = array
+        self._array = array
+        self._loader = None
 
     def __repr__(self):
         return '%s %s: %s' % (self.interpretation, self.key(), str(self.shape()))
 
+    def __getstate__(self):
+        # Items that can reload their data are pickled without it
+        state = self.__dict__.copy()
+        if self._loader is not None:
+            state['_array'] = None
+        return state
+
+    @property
+    def array(self):
+        if self._array is None and self._loader is not None:
+            self._array = self._loader()
+        return self._array
+
+    @array.setter
+    def array(self, array):
+        self._array = array
+        self._loader = None
+
+    def setLoader(self, loader):
+        """
+        :param loader: Callable returning the array, must provide the attributes shape and dtype
+
+        Defers loading the data until :py:attr:`array` is accessed for the first time.
+        """
+        self._array = None
+        self._loader = loader
+
+    def loader(self):
+        """
+        :returns: Loader of the array or None, c.f. :func:`setLoader`
+        """
+        return self._loader
+
+    def readArray(self):
+        """
+        Unlike :py:attr:`array`, data that has not been loaded yet is read without being kept by the item. Memory
+        maps returned by the loader are released once the result is no longer referenced.
+
+        :returns: ndarray or None
+        """
+        if self._array is None and self._loader is not None:
+            return self._loader()
+        return self._array
+
     def shape(self):
+        if self._array is None and self._loader is not None:
+            return self._loader.shape
         return self.array.shape
 
     def dtype(self):
+        if self._array is None and self._loader is not None:
+            return self._loader.dtype
         return self.array.dtype
 
+    def hdf5Dump(self, group):
+        ProjectItem.hdf5Dump(self, group)
+        group.attrs['fileLocation'] = self.fileLocation if self.fileLocation else ''
+        self._hdf5DumpArray(group)
+
+    def _hdf5DumpArray(self, group):
+        # Data that is not loaded is written without being kept, c.f. readArray
+        array = self.readArray()
+        if array is not None:
+            hdf5WriteArray(group, 'array', array)
+
 
 class FunctionItem(ProjectItem):
     __doc__ = """Class to contain a real valued function in terms of an analytical expression and a set of parameters"""
@@ -84,13 +253,20 @@ class FunctionItem(ProjectItem):
     def __init__(self, key, header):
         ProjectItem.__init__(self, key, header)
         self.expression = lambda x: x
+        self.expressionString = 'lambda x: x'
         self.parameters = {}
         self._argspec = getArgSpec(self.expression)
 
     def setExpression(self, expression):
         """
-        :param function expression: Analystical function
+        :param function or str expression: Analystical function. Expressions given as string, e.g.
+         'lambda x, a: a * x', are compiled using :func:`compileExpression` and can be stored in project files.
         """
+        if callable(expression):
+            self.expressionString = None
+        else:
+            self.expressionString = expression
+            expression = compileExpression(expression)
         self._argspec = getArgSpec(expression)
         self.expression = expression
 
@@ -121,10 +297,22 @@ class FunctionItem(ProjectItem):
         if len(self.parameters) <= 0:
             raise AttributeError('FunctionItem.sample -- parameters dict empty')
         # CONTINUE HERE
-        param = self.parameters
+        param = dict(self.parameters)
         param.update({'x': sampleRange})
         return self.expression(**param)
 
+    def hdf5Dump(self, group):
+        """
+        :raises ValueError: if the expression was not given as string, c.f. :func:`setExpression`
+        """
+        if self.expressionString is None:
+            raise ValueError("FunctionItem.hdf5Dump -- Expression of '%s' can not be stored" % self.key())
+        ProjectItem.hdf5Dump(self, group)
+        group.attrs['expression'] = self.expressionString
+        parameters = group.create_group('parameters')
+        for name, value in self.parameters.items():
+            parameters.attrs[name] = value
+
 
 class ScanItem(DataItem):
     __doc__ = """Class to contain data in multiple 1D numpy arrays"""
@@ -133,6 +321,7 @@ class ScanItem(DataItem):
     def __init__(self, key, header, array, fileLocation):
         DataItem.__init__(self, key, header, array, fileLocation)
         self._scale = None
+        self._columns = None
 
     def scale(self, sampleRange=None):
         """
@@ -156,6 +345,26 @@ class ScanItem(DataItem):
     def setScale(self, scale):
         self._scale = scale
 
+    def columns(self):
+        """
+        :returns: ndarray containing all data columns of the scan as rows, the zero-th row being the array
+        """
+        if self._columns is None:
+            return numpy.atleast_2d(self.array)
+        return self._columns
+
+    def setColumns(self, columns):
+        self._columns = columns
+
+    def hdf5Dump(self, group):
+        DataItem.hdf5Dump(self, group)
+        if isinstance(self._scale, FunctionItem):
+            self._scale.hdf5Dump(group.create_group('scale'))
+        elif self._scale is not None:
+            hdf5WriteArray(group, 'scale', self._scale)
+        if self._columns is not None:
+            hdf5WriteArray(group, 'columns', self._columns)
+
 
 class SpecItem(DataItem):
     __doc__ = """Class to contain data in 1D numpy array"""
@@ -163,6 +372,117 @@ class SpecItem(DataItem):
     pass
 
 
+class AccumulatorItem(SpecItem):
+    __doc__ = """Class to contain the running sum of spectra, e.g. of many short exposures. The array is the sum of all
+    added spectra. Mean and variance are updated incrementally using Welford's algorithm, adding a spectrum takes
+    O(n_points) operations and the added spectra are not kept."""
+    interpretation = 'Sum'
+
+    def __init__(self, key, header, array, fileLocation):
+        SpecItem.__init__(self, key, header, None, fileLocation)
+        self.count = 0
+        self._mean = None
+        self._m2 = None
+        if array is not None:
+            self.add(array)
+
+    def add(self, spectrum, align=False, maxShift=None):
+        """
+        :param ndarray spectrum: One dimensional numpy.ndarray
+        :param bool align: Shift the spectrum onto the current mean before adding it (default: False)
+        :param int maxShift: Largest shift in points considered by the alignment (default: None, i.e. any)
+
+        The shift is determined by cross-correlation with the current mean, c.f. :func:`alignmentShift`. Points
+        shifted into the spectrum are set to zero.
+
+        :returns float: Shift applied to the spectrum
+        :raises ValueError: if the spectrum length differs from the spectra added before
+        """
+        spectrum = numpy.asarray(spectrum, dtype=numpy.float64)
+        if self.count and spectrum.shape != self._mean.shape:
+            raise ValueError('AccumulatorItem.add -- Spectrum has shape %s, expected %s' %
+                             (str(spectrum.shape), str(self._mean.shape)))
+        shift = 0.
+        if align and self.count:
+            shift = self.alignmentShift(spectrum, maxShift)
+            points = numpy.arange(len(spectrum), dtype=numpy.float64)
+            spectrum = numpy.interp(points - shift, points, spectrum, left=0., right=0.)
+
+        self.count += 1
+        if self.count == 1:
+            self._mean = spectrum.copy()
+            self._m2 = numpy.zeros(shape=spectrum.shape, dtype=numpy.float64)
+        else:
+            delta = spectrum - self._mean
+            self._mean += delta / self.count
+            delta *= spectrum - self._mean
+            self._m2 += delta
+        self._array = self._mean * self.count
+        self._loader = None
+        return shift
+
+    def alignmentShift(self, spectrum, maxShift=None):
+        """
+        :param ndarray spectrum: One dimensional numpy.ndarray
+        :param int maxShift: Largest shift in points that is considered (default: None, i.e. any)
+
+        Cross-correlates the spectrum with the current mean. The maximum of the correlation is refined to sub-pixel
+        precision by a parabola through its neighbours.
+
+        :returns float: Shift that moves the spectrum onto the mean
+        """
+        nPoints = len(spectrum)
+        size = 2 * nPoints  # Zero padding avoids wrap around
+        reference = numpy.fft.rfft(self._mean - self._mean.mean(), size)
+        reference *= numpy.conjugate(numpy.fft.rfft(spectrum - spectrum.mean(), size))
+        correlation = numpy.fft.irfft(reference, size)
+
+        lags = numpy.arange(size)
+        lags[lags >= nPoints] -= size
+        if maxShift is not None:
+            correlation[numpy.abs(lags) > maxShift] = -numpy.inf
+        idxMax = correlation.argmax()
+        left, center, right = correlation[idxMax - 1], correlation[idxMax], correlation[(idxMax + 1) % size]
+        denominator = left - 2. * center + right
+        delta = .5 * (left - right) / denominator if numpy.isfinite(denominator) and denominator < 0. else 0.
+        return float(lags[idxMax] + delta)
+
+    def mean(self):
+        """
+        :returns ndarray: Mean of the added spectra
+        """
+        return self._mean
+
+    def variance(self):
+        """
+        :returns ndarray: Sample variance of the added spectra, NaN if less than two spectra were added
+        """
+        if self.count < 2:
+            return None if self._mean is None else numpy.full(self._mean.shape, numpy.nan)
+        return self._m2 / (self.count - 1)
+
+    def setStatistics(self, count, mean, m2):
+        """
+        :param int count: Number of added spectra
+        :param ndarray mean: Mean of the added spectra
+        :param ndarray m2: Sum of squared deviations from the mean
+
+        Restores the state of the accumulator, e.g. when a project is loaded.
+        """
+        self.count = int(count)
+        self._mean = numpy.array(mean, dtype=numpy.float64)
+        self._m2 = numpy.array(m2, dtype=numpy.float64)
+        self._array = self._mean * self.count
+        self._loader = None
+
+    def hdf5Dump(self, group):
+        DataItem.hdf5Dump(self, group)
+        group.attrs['count'] = self.count
+        if self.count:
+            hdf5WriteArray(group, 'mean', self._mean)
+            hdf5WriteArray(group, 'm2', self._m2)
+
+
 class ImageItem(DataItem):
     __doc__ = """Class to contain data in 2D numpy array"""
     interpretation = 'Image'
@@ -172,11 +492,98 @@ class ImageItem(DataItem):
         self.scaleX = None
         self.scaleY = None
 
+    def hdf5Dump(self, group):
+        DataItem.hdf5Dump(self, group)
+        for name in ['scaleX', 'scaleY']:
+            scale = getattr(self, name)
+            if scale is not None:
+                hdf5WriteArray(group, name, scale)
+
 
 class StackItem(DataItem):
     __doc__ = """Class to contain data in 3D numpy array"""
     interpretation = 'Stack'
-    pass
+
+    def __len__(self):
+        return self.shape()[0]
+
+    def frame(self, idx):
+        """
+        :param int idx: Index of the image in the stack
+        :returns: ndarray
+
+        If the data has not been loaded yet, only the requested image is read.
+        """
+        if self._array is None and hasattr(self._loader, 'frame'):
+            return self._loader.frame(idx)
+        return self.array[idx]
+
+    def frames(self):
+        """
+        Generator that yields the images of the stack one at a time.
+        """
+        for idx in range(len(self)):
+            yield self.frame(idx)
+
+    def _hdf5DumpArray(self, group):
+        # Stacks that are not loaded are written image by image
+        if self._array is None and hasattr(self._loader, 'frame') and numpy.prod(self.shape()):
+            hdf5WriteFrames(group, 'array', self.shape(), self.dtype(), self.frames())
+        else:
+            DataItem._hdf5DumpArray(self, group)
+
+
+class DarkItem(DataItem):
+    __doc__ = """Class to contain the dark level of a detector. The dark level is either given per pixel (mode 'pixel',
+    2D numpy array) or per detector row (mode 'row', 1D numpy array). It is the mean of count dark images, c.f.
+    :py:func:`update`."""
+    interpretation = 'Dark'
+
+    def __init__(self, key, header, array, fileLocation, mode='pixel', count=1):
+        """
+        :param str mode: Either 'pixel' or 'row'
+        :param int count: Number of dark images the array is averaged over
+
+        :raises ValueError: if the mode is unknown
+        """
+        if mode not in ('pixel', 'row'):
+            raise ValueError("DarkItem -- Unknown mode '%s'" % str(mode))
+        DataItem.__init__(self, key, header, array, fileLocation)
+        self.mode = mode
+        self.count = count if array is not None else 0
+
+    def update(self, image, maxCount=None):
+        """
+        :param ndarray image: Dark image
+        :param int maxCount: Number of images after which the mean becomes a rolling mean (default: None)
+
+        Adds a dark image to the mean. Once maxCount images are averaged, every new image enters the mean with
+        weight 1 / maxCount, i.e. the dark level follows slow drifts of the detector during a run.
+        """
+        image = numpy.asarray(image, dtype=numpy.float64)
+        if self.mode == 'row':
+            image = image.mean(axis=1)
+        if not self.count:
+            self.array = image.copy()
+        else:
+            weight = 1. / (self.count + 1 if maxCount is None else min(self.count + 1, maxCount))
+            array = numpy.array(self.array, dtype=numpy.float64)
+            array += weight * (image - array)
+            self.array = array
+        self.count += 1
+
+    def offset(self):
+        """
+        :returns ndarray: Dark level that broadcasts against an image, per row levels are returned as column
+        """
+        if self.mode == 'row':
+            return self.array[:, numpy.newaxis]
+        return self.array
+
+    def hdf5Dump(self, group):
+        DataItem.hdf5Dump(self, group)
+        group.attrs['mode'] = self.mode
+        group.attrs['count'] = self.count
 
 
 if __name__ == '__main__':
@@ -29,10 +29,7 @@ __author__ = "Tonn Rueter - ESRF Data Analysis Unit"
 import numpy
 
 # Numeric routines from PyMca
-from PyMca5.PyMca.Gefit import LeastSquaresFit as LSF
 from PyMca5.PyMca import SpecfitFunctions as SF
-from PyMca5.PyMca.SpecfitFuns import gauss as gaussianModel
-from PyMca5.PyMca import SNIPModule as SNIP
 
 # IO and Datahandling from RixsTool
 from .Project import RixsProject
@@ -43,50 +40,84 @@ DEBUG = 0
 
 
 class ImageOp(object):
+    __doc__ = """Base class of the image operations. Images are two dimensional numpy.ndarrays. The operations
+    bandPassFilter, snip, flip, fftAlignment, skewAlongAxis, smileCorrection, axisSum, sliceAndSum and zeroToOne also
+    accept a stack of images, i.e. a three dimensional numpy.ndarray whose leading axis indexes the images (c.f.
+    :py:class:`Items.StackItem`), and process all images in one call. Axis parameters always refer to the axes of a
+    single image."""
+
     def __init__(self):
         object.__init__(self)
         self._ops = {}
 
+    @staticmethod
+    def arrayAxis(image, axis):
+        """
+        :param ndarray image: Image or stack of images
+        :param int axis: Axis of a single image, either 0 or 1
+
+        :returns int: Corresponding axis of the array
+        """
+        return axis + image.ndim - 2
+
 
 class Filter(ImageOp):
     def __init__(self):
         ImageOp.__init__(self)
         self._ops = {
-            'bandpass': self.bandPassFilter
+            'bandpass': self.bandPassFilter,
+            'snip': self.snip
         }
 
     # def bandPassFilter(self, image, params):
     @staticmethod
     def bandPassFilter(image, params):
         """
-        :param ndarray image: Two dimensional numpy.ndarray
+        :param ndarray image: Two dimensional numpy.ndarray or stack of images
         :param dict params: Contains parameters low, high and offset
 
         General purpose bandpass filter. Possible parameters are
 
         low
-            lower threshold (default: minimum value)
+            lower threshold (default: minimum value, of every image for stacks)
 
         high
-            upper threshold (default: maximum value)
+            upper threshold (default: maximum value, of every image for stacks)
 
         offset
-            baseline (default: 0)
+            baseline (default: 0), either a number or an array that broadcasts against the image, e.g. a dark map
         replace
             value to be used as replacement (default: minimum value)
 
+        dtype
+            type of the filtered image (default: type of offset)
+
+        out
+            preallocated array of the image shape the result is written to, may be the image itself (default: None)
+
         The offset is subtracted from the image. Values above the upper threshold or
         below the lower threshold are replaced by a given replacement value. *Notice:* the image will be casted
-        into the type of offset.
+        into the common type of offset (the type of its elements for arrays) and replace unless dtype or out are
+        given, e.g. an integer offset with the default replacement gives a floating point image.
+
+        The image is filtered in blocks of rows, so that subtraction, thresholding and replacement of a block
+        happen while it is in the processor cache. Apart from the result no image sized arrays are allocated.
 
         :returns ndarray: Filtered image
         """
-        imMin = image.min()
-        imMax = image.max()
-        lo = params.get('low', imMin)
-        hi = params.get('high', imMax)
+        lo = params.get('low', None)
+        hi = params.get('high', None)
         offset = params.get('offset', 0.)
         replace = params.get('replace', 0.)
+        out = params.get('out', None)
+
+        # Thresholds default to the image range, only determined when needed. For stacks the range of every image
+        # is used, the thresholds then have the shape (images, 1, 1)
+        if lo is None:
+            lo = image.min(axis=(-2, -1), keepdims=True) if image.ndim > 2 else image.min()
+        if hi is None:
+            hi = image.max(axis=(-2, -1), keepdims=True) if image.ndim > 2 else image.max()
+        perImage = [image.ndim > 2 and numpy.ndim(threshold) == image.ndim for threshold in (lo, hi)]
 
         if DEBUG >= 1:
             print('Filter.bandPassFilter -- calculating..')
@@ -95,9 +126,47 @@ class Filter(ImageOp):
             print('\toffset = %s (type: %s)' % (str(offset), str(type(offset))))
             print('\treplace = %s (type: %s)' % (str(replace), str(type(replace))))
 
-        out = image.astype(type(offset)) - offset
-        out = numpy.where((lo <= out), out, replace)
-        out = numpy.where((out <= hi), out, replace)
+        if not numpy.isscalar(offset):
+            # Offset maps, possibly given as nested lists (c.f. RixsTool.Pipeline)
+            offset = numpy.asarray(offset)
+        if isinstance(offset, numpy.ndarray):
+            dtype = params.get('dtype', numpy.result_type(offset.dtype, replace))
+            offset = numpy.broadcast_to(offset, image.shape)
+        else:
+            dtype = params.get('dtype', numpy.result_type(type(offset), replace))
+        if out is None:
+            out = numpy.empty(shape=image.shape, dtype=dtype)
+        elif out.shape != image.shape:
+            raise ValueError('Filter.bandPassFilter -- Output shape %s does not match image shape %s' %
+                             (str(out.shape), str(image.shape)))
+
+        if image.ndim > 2 and image[0].size > 65536:
+            # Large images of a stack are filtered one after the other
+            frameParams = dict(params, dtype=out.dtype)
+            for idx in range(len(image)):
+                frameParams['low'] = lo[idx] if perImage[0] else lo
+                frameParams['high'] = hi[idx] if perImage[1] else hi
+                frameParams['offset'] = offset[idx] if isinstance(offset, numpy.ndarray) else offset
+                frameParams['out'] = out[idx]
+                Filter.bandPassFilter(image[idx], frameParams)
+            return out
+
+        rowSize = image[0].size if image.ndim > 1 else 1
+        blockSize = max(1, 65536 // max(rowSize, 1))
+        valid = numpy.empty(shape=(blockSize,) + image.shape[1:], dtype=bool)
+        belowHigh = numpy.empty(shape=valid.shape, dtype=bool)
+        for start in range(0, len(image), blockSize):
+            block = out[start:start + blockSize]
+            blockValid, blockBelowHigh = valid[:len(block)], belowHigh[:len(block)]
+            blockOffset = offset[start:start + blockSize] if isinstance(offset, numpy.ndarray) else offset
+            blockLo = lo[start:start + blockSize] if perImage[0] else lo
+            blockHi = hi[start:start + blockSize] if perImage[1] else hi
+            numpy.subtract(image[start:start + blockSize], blockOffset, out=block, dtype=out.dtype, casting='unsafe')
+            numpy.less_equal(blockLo, block, out=blockValid)
+            numpy.less_equal(block, blockHi, out=blockBelowHigh)
+            numpy.logical_and(blockValid, blockBelowHigh, out=blockValid)
+            numpy.logical_not(blockValid, out=blockValid)
+            numpy.copyto(block, replace, casting='unsafe', where=blockValid)
 
         if DEBUG >= 1:
             print('\timage.min = %s (type: %s)' % (str(image.min()), str(type(image.min()))))
@@ -110,11 +179,13 @@ class Filter(ImageOp):
     @staticmethod
     def bandPassFilterID32(image, params):
         """
-        :param ndarray image: Two dimensional numpy.ndarray
+        :param ndarray image: Two dimensional numpy.ndarray or stack of images
         :param dict params: Contains parameters specific to the ID32 detector (c.f. comments in source code)
 
         The method implements a bandpass filter specific to the measurement configuration of
-        beamline ID32 at the ESRF.
+        beamline ID32 at the ESRF. The optional parameter dark takes a dark map (c.f. :py:func:`darkMap`
+        and :py:func:`RixsTool.Items.DarkItem.offset`) that replaces the dark level estimated from the image. In a
+        :py:class:`RixsTool.Pipeline.Pipeline` the map is given by reference, e.g. by the key of a DarkItem.
 
         :returns ndarray: Filtered image
         """
@@ -137,7 +208,8 @@ class Filter(ImageOp):
         #
         # -- BASELINE --
         # Values beneath the baseline are cut off. The baseline is derived from the image
-        # itself, by taking the mean of a dark part of the image (here: the first 100 rows)
+        # itself, by taking the mean of a dark part of the image (here: the first 100 rows).
+        # Alternatively a dark map is provided, either per pixel or per row (c.f. darkMap)
         #
         # exposureTime: time to record an entire image in seconds
         # DC: counts per pixel per second
@@ -145,7 +217,16 @@ class Filter(ImageOp):
         exposureTime = params.get('preset', 300)
         dc = params.get('dc', 0.00016)
 
-        offset = numpy.mean(image[:100, :]) + 1
+        dark = params.get('dark', None)
+        if dark is None:
+            # For stacks, the dark level is determined for every image
+            offset = numpy.mean(image[..., :100, :], axis=(-2, -1), keepdims=image.ndim > 2) + 1
+        else:
+            dark = numpy.asarray(dark, dtype=numpy.float64)
+            if dark.ndim == 1:
+                # Per row dark level
+                dark = dark[:, numpy.newaxis]
+            offset = dark + 1
         baseline = offset + exposureTime * dc
 
         parameters = {
@@ -163,6 +244,101 @@ class Filter(ImageOp):
         # print('Filter.bandPassFilterID32 -- parameters:\n\t%s' % str(parameters))
         return Filter.bandPassFilter(image, parameters)
 
+    @staticmethod
+    def snip(image, params):
+        """
+        :param ndarray image: Two dimensional numpy.ndarray
+        :param dict params: Contains parameters width, axis, smoothing and background
+
+        Estimates the background of every curve in the image using the SNIP algorithm. All curves are clipped
+        simultaneously, the result is identical to :py:func:`PyMca5.PyMca.SNIPModule.getSnip1DBackground` applied
+        to every curve. Possible parameters are
+
+        width
+            width of the clipping window in points (default: a tenth of the curve length)
+
+        axis
+            axis of the image along which the curves run (default: -1, i.e. every row is a curve)
+
+        smoothing
+            number of smoothing passes before clipping (default: 1)
+
+        background
+            return the background instead of the background subtracted image (default: False)
+
+        :returns ndarray: Background subtracted image respectively background as numpy.float64
+        """
+        axis = params.get('axis', -1)
+        if axis >= 0:
+            axis = ImageOp.arrayAxis(image, axis)
+        smoothing = params.get('smoothing', 1)
+
+        curves = numpy.moveaxis(numpy.asarray(image, dtype=numpy.float64), axis, -1)
+        shape = curves.shape
+        nPoints = shape[-1]
+        width = params.get('width', None)
+        if width is None:
+            width = nPoints // 10
+
+        background = numpy.array(curves.reshape(-1, nPoints), copy=True)
+        if nPoints >= 3:
+            for _ in range(smoothing):
+                # Smoothing [1, 2, 1] / 4, curve ends are weighted [3, 1] / 4
+                smoothed = numpy.empty(shape=background.shape, dtype=numpy.float64)
+                smoothed[:, 1:-1] = .25 * (background[:, :-2] + 2. * background[:, 1:-1] + background[:, 2:])
+                smoothed[:, 0] = .75 * background[:, 0] + .25 * background[:, 1]
+                smoothed[:, -1] = .25 * background[:, -2] + .75 * background[:, -1]
+                background = smoothed
+
+        #
+        # Iterative clipping with decreasing window: Every point is replaced by the mean of
+        # its neighbours at distance p if the mean is smaller. Blocks of curves are clipped
+        # together, the block size keeps the working set in the processor cache.
+        #
+        blockSize = max(1, 32768 // nPoints)
+        buf = numpy.empty(shape=(blockSize, nPoints), dtype=numpy.float64)
+        for start in range(0, len(background), blockSize):
+            block = background[start:start + blockSize]
+            for p in range(min(int(width), (nPoints - 1) // 2), 0, -1):
+                mean = buf[:len(block), :nPoints - 2 * p]
+                numpy.add(block[:, :nPoints - 2 * p], block[:, 2 * p:], out=mean)
+                mean *= .5
+                numpy.minimum(block[:, p:nPoints - p], mean, out=block[:, p:nPoints - p])
+
+        background = background.reshape(shape)
+        if not params.get('background', False):
+            background = curves - background
+        return numpy.moveaxis(background, -1, axis)
+
+
+def darkMap(images, mode='pixel'):
+    """
+    :param images: Sequence of two dimensional numpy.ndarrays or three dimensional numpy.ndarray
+    :param str mode: 'pixel' for a dark level per pixel, 'row' for a dark level per detector row (default: 'pixel')
+
+    Averages dark images to a dark map, c.f. :py:class:`RixsTool.Items.DarkItem`. The images are summed one at a
+    time, a sequence does not need to fit into memory at once.
+
+    :returns ndarray: Dark map as numpy.float64, two dimensional respectively one dimensional
+    :raises ValueError: if no images are given or the mode is unknown
+    """
+    if mode not in ('pixel', 'row'):
+        raise ValueError("darkMap -- Unknown mode '%s'" % str(mode))
+
+    total, count = None, 0
+    for image in images:
+        if total is None:
+            total = numpy.array(image, dtype=numpy.float64)
+        else:
+            total += image
+        count += 1
+    if not count:
+        raise ValueError('darkMap -- No dark images given')
+    total /= count
+    if mode == 'row':
+        return total.mean(axis=1)
+    return total
+
 
 class Alignment(ImageOp):
     def __init__(self=None):
@@ -175,10 +351,29 @@ class Alignment(ImageOp):
 
     @staticmethod
     def maxAlignment(image, params):
+        """
+        :param ndarray image: Two dimensional numpy.ndarray
+        :param dict params: Contains parameters idx0, axis, scale and interpolation
+
+        Aligns the curves of the image on their maxima. The parameter interpolation refines the
+        maxima to sub-pixel precision using the neighbouring points, possible values are
+
+        None
+            integer shifts (default)
+
+        'parabolic'
+            vertex of the parabola through the maximum and its neighbours
+
+        'gaussian'
+            vertex of the parabola through the logarithms, exact for gaussian peaks
+
+        :returns ndarray: Shifts of all curves relative to curve idx0
+        """
         # TODO: Add normalization flag
         idx0 = params.get('idx0', 0)
         axis = params.get('axis', -1)  # Axis defines direction of curves
         scale = params.get('scale', None)
+        interpolation = params.get('interpolation', None)
 
         if axis < 0:
             rows, cols = image.shape
@@ -196,15 +391,25 @@ class Alignment(ImageOp):
         else:
             raise ValueError('Alignment instance -- Axis must be either -1, 0 or 1')
 
-        shiftList = [float('NaN')] * nCurves
-
-        pos0 = curves[idx0].argmax()
-
-        for idx, y in enumerate(curves):
-            shift = pos0 - y.argmax()
-            shiftList[idx] = shift
-
-        shiftArray = numpy.asarray(shiftList)
+        idxMax = curves.argmax(axis=1)
+        positions = numpy.float64(idxMax)
+
+        if interpolation is not None:
+            if interpolation not in ('parabolic', 'gaussian'):
+                raise ValueError("Alignment.maxAlignment -- Unknown interpolation '%s'" % str(interpolation))
+            # Maxima at the curve ends are not refined
+            inner = numpy.clip(idxMax, 1, max(nPoints - 2, 1))
+            curveIdx = numpy.arange(nCurves)
+            with numpy.errstate(invalid='ignore', divide='ignore'):
+                yl, yc, yr = [numpy.float64(curves[curveIdx, numpy.clip(inner + offset, 0, nPoints - 1)])
+                              for offset in (-1, 0, 1)]
+                if interpolation == 'gaussian':
+                    yl, yc, yr = numpy.log(yl), numpy.log(yc), numpy.log(yr)
+                delta = .5 * (yl - yr) / (yl - 2. * yc + yr)
+            valid = (idxMax == inner) & numpy.isfinite(delta) & (numpy.abs(delta) <= .5)
+            positions += numpy.where(valid, delta, 0.)
+
+        shiftArray = positions[idx0] - positions
         if scale:
             shiftArray *= numpy.average(numpy.diff(scale))
 
@@ -241,54 +446,50 @@ class Alignment(ImageOp):
         else:
             raise ValueError('Alignment instance -- Axis must be either -1, 0 or 1')
 
-        shiftList = nCurves * [float('NaN')]
-
-        y0 = curves[idx0]
-        pos0 = y0.argmax()
-        ymin0, ymax0 = y0.min(), y0.max()
-        normFactor = ymax0 - ymin0
-        if float(normFactor) <= 0.:
-            # Curve is constant
+        #
+        # Normalize all curves betw. zero and one, constant curves are flagged
+        #
+        curves = numpy.asarray(curves, dtype=numpy.float64)
+        ymin = curves.min(axis=1)
+        normFactor = curves.max(axis=1) - ymin
+        constant = normFactor <= 0.
+        if constant[idx0]:
             raise ZeroDivisionError('Alignment.centerOfMass -- Trying to align on constant curve')
-        ynormed0 = (y0 - ymin0) / normFactor
-
-        threshold = portion * float(ynormed0[pos0])
-        left, right = pos0, pos0
-        while  ynormed0[left] > threshold:
-            left -= 1
-        while  ynormed0[right] > threshold:
-            right += 1
-        if left < 0 or right >= nPoints:
-            raise IndexError('Alignment.centerOfMassAlignment: 0-th index out of range (left: %d, right: %d)' % (left, right))
-        mask = numpy.arange(left, right + 1, dtype=int)
-        pos0 = numpy.trapz(ynormed0[mask] * mask) / numpy.trapz(ynormed0[mask])
-
-        for idx, y in enumerate(curves):
-            # Normalize betw. zero an one
-            ymin, ymax = y.min(), y.max()
-            normFactor = ymax - ymin
-            if float(normFactor) <= 0.:
-                # Curve is constant
-                continue
-            ynormed = (y - ymin) / normFactor
-
-            idxMax = ynormed.argmax()
-            left, right = idxMax, idxMax
-            while ynormed[left] > threshold:
-                left -= 1
-            while ynormed[right] > threshold:
-                right += 1
-            if left < 0 or right >= nPoints:
-                raise IndexError('Alignment.centerOfMassAlignment: index out of range (left: %d, right: %d)' % (left, right))
-            mask = numpy.arange(left, right + 1, dtype=int)
-            if DEBUG >= 1:
-                print('mask:', mask)
-            shift = pos0 - numpy.trapz(ynormed[mask] * mask) / numpy.trapz(ynormed[mask])
-            if DEBUG >= 1:
-                print('\t%d\t%f' % (idx, shift))
-            shiftList[idx] = shift
+        ynormed = (curves - ymin[:, numpy.newaxis]) / numpy.where(constant, 1., normFactor)[:, numpy.newaxis]
+
+        #
+        # Find the threshold crossings left and right of every maximum. Curves
+        # without crossing inside the curve are out of range and flagged.
+        #
+        threshold = portion  # Normalized maximum of the 0-th curve is one
+        channels = numpy.arange(nPoints)
+        idxMax = ynormed.argmax(axis=1)[:, numpy.newaxis]
+        below = ynormed <= threshold
+        left = numpy.where(below & (channels <= idxMax), channels, -1).max(axis=1)
+        right = numpy.where(below & (channels >= idxMax), channels, nPoints).min(axis=1)
+        outOfRange = (left < 0) | (right >= nPoints)
+        if outOfRange[idx0]:
+            raise IndexError('Alignment.centerOfMassAlignment: 0-th index out of range (left: %d, right: %d)' %
+                             (left[idx0], right[idx0]))
+        left = numpy.where(outOfRange, 0, left)
+        right = numpy.where(outOfRange, 0, right)
 
-        shiftArray = numpy.asarray(shiftList)
+        #
+        # Centroids of all curves: Trapezoidal rule between the crossings
+        #
+        curveIdx = numpy.arange(nCurves)
+        yLeft, yRight = ynormed[curveIdx, left], ynormed[curveIdx, right]
+        inside = (channels >= left[:, numpy.newaxis]) & (channels <= right[:, numpy.newaxis])
+        weights = numpy.where(inside, ynormed, 0.)
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            centroids = (numpy.dot(weights, numpy.float64(channels)) - .5 * (yLeft * left + yRight * right)) / \
+                        (weights.sum(axis=1) - .5 * (yLeft + yRight))
+        centroids[constant | outOfRange] = float('NaN')
+        if DEBUG >= 1:
+            for idx in numpy.nonzero(outOfRange)[0]:
+                print('Alignment.centerOfMassAlignment: curve %d out of range' % idx)
+
+        shiftArray = centroids[idx0] - centroids
         if scale:
             shiftArray *= numpy.average(numpy.diff(scale))
         # ddict = {
@@ -310,7 +511,7 @@ class Alignment(ImageOp):
         # Determine which axis defines curves
         if axis < 0:
             # If axis not specified..
-            rows, cols = image.shape
+            rows, cols = image.shape[-2:]
             # ..align along smaller axis
             if rows < cols:
                 axis = 0
@@ -318,101 +519,86 @@ class Alignment(ImageOp):
                 axis = 1
 
         if axis == 0:
-            nCurves, nPoints = image.shape
+            nCurves, nPoints = image.shape[-2:]
             curves = image
         elif axis == 1:
-            nPoints, nCurves = image.shape
-            curves = image.T
+            nPoints, nCurves = image.shape[-2:]
+            curves = numpy.swapaxes(image, -2, -1)
         else:
             raise ValueError('Alignment instance -- Axis must be either -1, 0 or 1')
 
         # Determine, if a window is defined
         if maxChannel < 0:
             maxChannel = nPoints - 1
-        window = numpy.arange(
-            start=minChannel,
-            stop=maxChannel,
-            step=1,
-            dtype=numpy.uint16
-        )
-        # print('fftAlignment -- window: %s' % str(window))
+        windowed = curves[..., minChannel:maxChannel]
+        nChannels = windowed.shape[-1]
         if DEBUG >= 1:
-            print('fftAlignment -- window.shape: %s' % str(window.shape))
+            print('fftAlignment -- windowed.shape: %s' % str(windowed.shape))
+
+        #
+        # Cross correlation of all curves with the reference curve idx0. The transforms
+        # of all curves are calculated in one call, the product with the reference
+        # spectrum is broadcasted over the curves. In a stack, every image has its own
+        # reference curve. Afterwards the curves of all images are treated alike.
+        #
+        fft0 = numpy.fft.rfft(numpy.take(windowed, [idx0], axis=-2), axis=-1)
+        ffty = numpy.fft.rfft(windowed, axis=-1)
+        numpy.conjugate(ffty, out=ffty)
+        ffty *= fft0
+        shiftTmp = numpy.fft.irfft(ffty, n=nChannels, axis=-1).reshape(-1, nChannels)
 
-        shiftList = nCurves * [float('NaN')]
+        # Zero shift is moved to the center channel m
+        m = nChannels // 2
+        shiftPhase = numpy.roll(shiftTmp, m, axis=1)
 
-        # y0 = curves[idx0]
-        y0 = curves[idx0][window]
+        #
+        # Thresholding: The threshold is given relative to the range of shiftPhase. The
+        # noisier the data is, the more likely it is for the normalization to be
+        # ineffective, i.e. the whole range of shiftPhase is used later on.
+        #
+        rows = numpy.arange(len(shiftPhase))
+        idxMax = shiftPhase.argmax(axis=1)
+        shiftPhaseMin = shiftPhase.min(axis=1)
+        normFactor = shiftPhase[rows, idxMax] - shiftPhaseMin
+        valid = normFactor > 0.
         if DEBUG >= 1:
-            print('fftAlignment -- y0.shape: %s' % str(y0.shape))
-        fft0 = numpy.fft.fft(y0)
+            print('fftAlignment -- normFactor is zero for %d curves' % numpy.count_nonzero(~valid))
+        threshold = shiftPhaseMin + portion * normFactor
+        below = shiftPhase < threshold[:, numpy.newaxis]
 
-        for idx, y in enumerate(curves):
-            if DEBUG >= 1:
-                print('fftAlignment -- y.shape: %s' % str(y.shape))
-            data = y[window]
-            if DEBUG >= 1:
-                print('fftAlignment -- data.shape: %s' % str(data.shape))
-            ffty = numpy.fft.fft(data)
-            # ffty = numpy.fft.fft(y)
-            shiftTmp = numpy.fft.ifft(fft0 * ffty.conjugate()).real
-            shiftPhase = numpy.zeros(shiftTmp.shape, dtype=shiftTmp.dtype)
-            m = shiftTmp.size // 2
-            shiftPhase[m:] = shiftTmp[:-m]
-            shiftPhase[:m] = shiftTmp[-m:]
-
-            # Normalize shiftPhase between 0 and 1 to standardize thresholding
-            shiftPhaseMin = shiftPhase.min()
-            shiftPhaseMax = shiftPhase.max()
-            normFactor = shiftPhaseMax - shiftPhaseMin
-            if float(normFactor) <= 0.:
-                if DEBUG >= 1:
-                    print('fftAlignment -- normFactor is zero')
-                continue
-            if DEBUG >= 1:
-                print('fftAlignment -- \n\t\t\tshiftPhaseMin: %f\n\t\t\tshiftPhaseMax: %f' % (shiftPhaseMin, shiftPhaseMax))
-            shiftPhase = (shiftPhase - shiftPhaseMin) / normFactor
-
-            # Thresholding: The noisier the data is, the more likely it is for the
-            # normalization to be ineffective, i.e. the whole range of shiftPhase
-            # is used later on.
-            idxMax = shiftPhase.argmax()
-            left, right = idxMax, idxMax
-            threshold = portion
-            while shiftPhase[left] >= threshold:
-                if left <= 0:
-                    if DEBUG >= 1:
-                        print('fftAlignment -- reached left limit')
-                    left = 0
-                    break
-                left -= 1
-            while shiftPhase[right] >= threshold:
-                if right >= len(shiftPhase) - 1:
-                    if DEBUG >= 1:
-                        print('fftAlignment -- reached right limit')
-                    right = len(shiftPhase) - 1
-                    break
-                right += 1
+        #
+        # The peak region around idxMax reaches from the closest channel below the threshold
+        # on the left to the closest channel below the threshold on the right, both included.
+        # If there is no such channel, the region extends to the limits of the window.
+        # Counting the channels below the threshold labels the regions between them.
+        #
+        regions = numpy.cumsum(below, axis=1, dtype=numpy.int32)
+        peakRegion = regions[rows, idxMax][:, numpy.newaxis]
+        inPeak = regions == peakRegion
+        inPeak |= (regions == peakRegion + 1) & below
+        single = below[rows, idxMax]
+        if numpy.any(single):
+            # Threshold above maximum, only idxMax is used
+            inPeak[single] = numpy.arange(nChannels) == idxMax[single][:, numpy.newaxis]
 
-            mask = numpy.arange(left, right + 1, 1, dtype=numpy.uint16)
-            if DEBUG >= 1:
-                print('fftAlignment -- mask: %s' % str(mask))
-            # The shift is determined by center-of-mass around idxMax
-            shiftTmp = numpy.sum((shiftPhase[mask] * mask / shiftPhase[mask].sum()))
-            # shift = (shiftTmp - m) * (x[1] - x[0])
-            # x-range is pixel count..
-            shift = (shiftTmp - m)
-            shiftList[idx] = shift
-            if DEBUG >= 1:
-                print('fftAlignment -- shiftList[%d]: %s' % (idx, str(shift)))
+        #
+        # The shift is determined by center-of-mass around idxMax. Weights are the
+        # values of shiftPhase relative to its minimum.
+        #
+        shiftPhase -= shiftPhaseMin[:, numpy.newaxis]
+        shiftPhase *= inPeak
+        weightSum = shiftPhase.sum(axis=1)
+        weightSum[~valid] = 1.
+        channels = numpy.arange(nChannels, dtype=shiftPhase.dtype)
+        # shift = (shiftTmp - m) * (x[1] - x[0])
+        # x-range is pixel count..
+        shiftArray = numpy.dot(shiftPhase, channels) / weightSum - m
+        shiftArray[~valid] = float('NaN')
+        shiftArray = shiftArray.reshape(image.shape[:-2] + (nCurves,))
+        if DEBUG >= 1:
+            print('fftAlignment -- shiftArray: %s' % str(shiftArray))
 
-        # ddict = {
-        #    'op': 'fftAlignment',
-        #    'shiftList': shiftList
-        # }
-        # return ddict
-        # return shiftList
-        return numpy.ascontiguousarray(shiftList)
+        return numpy.ascontiguousarray(shiftArray)
 
     @staticmethod
     def fitAlignment(image, params):
@@ -451,88 +637,66 @@ class Alignment(ImageOp):
             snipWidth = max(imRows, imCols) // 10
         specfitObj = SF.SpecfitFunctions()
 
-        background = numpy.zeros(shape=curves.shape,
-                                 dtype=numpy.float64)
-        for idx, curve in enumerate(curves):
-            background[idx] = SNIP.getSnip1DBackground(curve, snipWidth)
-        subtracted = curves - background
+        subtracted = Filter.snip(curves, {'width': snipWidth})
         normResult = Normalization.zeroToOne(image=subtracted,
                                              params={})
         normalized = normResult['image']
 
         #
-        # Loop through curves: Find peak (max..), Estimate fit params, Perform Gaussian fit
+        # Estimate fit params: Find peak (max..), height and FWHM
         #
-        fitList = nCurves * [float('NaN')]
-        if DEBUG >= 1:
-            print('Alignment.fitAlignment -- fitting..')
-        for idx, y in enumerate(subtracted):
-            #
-            # Peak search
-            #
-            if peakSearch:
+        if peakSearch:
+            peakIdx = numpy.empty(shape=(nCurves,), dtype=int)
+            for idx, y in enumerate(subtracted):
                 try:
                     # Calculate array with all peak indices
-                    peakIdx = numpy.asarray(specfitObj.seek(y, yscaling=100.),
-                                            dtype=int)
+                    candidates = numpy.asarray(specfitObj.seek(y, yscaling=100.),
+                                               dtype=int)
                     # Extract highest feature
-                    maxIdx = y[peakIdx].argsort()[-1]
-                except IndexError:
+                    peakIdx[idx] = candidates[y[candidates].argmax()]
+                except (IndexError, ValueError):
                     if DEBUG >= 1:
                         print('Alignment.fitAlignment -- No peaks found..')
                     return None
                 except SystemError:
                     if DEBUG >= 1:
                         print('Alignment.fitAlignment -- Peak search failed. Continue with y maximum')
-                    peakIdx = [y.argmax()]
-                    maxIdx = 0
-            else:
-                peakIdx = [y.argmax()]
-                maxIdx = 0
-            height = float(y[peakIdx][maxIdx]) + curves[idx].min()
-            pos = float(peakIdx[maxIdx])
-
-            #
-            # Estimate FWHM
-            #
-            fwhmIdx = numpy.nonzero(y >= .5 * normalized[idx])[0]
-            # Underestimates FWHM, since carried out on normalized image
-            fwhm = float(fwhmIdx.max() - fwhmIdx.min())
-
-            #
-            # Peak fit: Uses actual data
-            #
-            # xrange = numpy.arange(0, len(y), dtype=y.dtype) # Full range
-            mask = numpy.nonzero(y >= .1 * normalized[idx])[0]
-            ydata = curves[idx, mask]
-            # ydata -= ydata.min()
-            try:
-                fitp, chisq, sigma = LSF(gaussianModel,
-                                         numpy.asarray([height, pos, fwhm]),
-                                         xdata=mask,
-                                         ydata=(ydata - ydata.min()))
-                if DEBUG >= 1:
-                    print('\tCurve %d -- fitp: %s' % (idx, str(fitp)))
-                    print('\tCurve %d -- chisq: %s' % (idx, str(chisq)))
-                    print('\tCurve %d -- sigma: %s' % (idx, str(sigma)))
-            except numpy.linalg.linalg.LinAlgError:
-                fitp, chisq, sigma = [None, None, None], \
-                                     float('Nan'), \
-                                     float('Nan')
-                if DEBUG >= 1:
-                    print('\tCurve %d -- Fit failed!' % idx)
-            fitList[idx] = fitp  # ftip is 3-tuple..
-
-        posIdx = 1  # ..2nd argument of fitp is peak position
-        shift0 = fitList[idx0][posIdx]
-        shiftList = [shift0 - fit[posIdx] for fit in fitList]
+                    peakIdx[idx] = y.argmax()
+        else:
+            peakIdx = subtracted.argmax(axis=1)
+        curveIdx = numpy.arange(nCurves)
+        height = subtracted[curveIdx, peakIdx] + curves.min(axis=1)
+        pos = numpy.float64(peakIdx)
+
+        # Underestimates FWHM, since carried out on normalized image
+        aboveHalf = subtracted >= .5 * normalized
+        first = aboveHalf.argmax(axis=1)
+        last = nPoints - 1 - aboveHalf[:, ::-1].argmax(axis=1)
+        fwhm = numpy.maximum(numpy.float64(last - first), 1.)
+
+        #
+        # Peak fit: Uses actual data, all curves are fitted at once
+        #
+        mask = subtracted >= .1 * normalized
+        ydata = curves - numpy.where(mask, curves, numpy.inf).min(axis=1)[:, numpy.newaxis]
+        if DEBUG >= 1:
+            print('Alignment.fitAlignment -- fitting..')
+        fitp, chisq, sigma = Fit.gaussians(ydata,
+                                           estimates=numpy.column_stack((height, pos, fwhm)),
+                                           weights=mask)
+        if DEBUG >= 1:
+            for idx in numpy.nonzero(numpy.isnan(chisq))[0]:
+                print('\tCurve %d -- Fit failed!' % idx)
+
+        posIdx = 1  # ..2nd column of fitp is peak position
+        shiftArray = fitp[idx0, posIdx] - fitp[:, posIdx]
 
         # ddict = {
         #    'op': 'fitAlignment',
-        #    'shiftList': shiftList
+        #    'shiftList': shiftArray
         # }
         # return ddict
-        return shiftList
+        return shiftArray
 
 
 class Interpolation(ImageOp):
@@ -571,40 +735,74 @@ class Integration(ImageOp):
         axis = params.get('axis', -1)
         if axis < 0:
             # If axis not specified..
-            rows, cols = image.shape
+            rows, cols = image.shape[-2:]
             # ..sum along smaller axis
             if rows < cols:
                 axis = 0
             else:
                 axis = 1
-        return numpy.sum(image, axis=axis)
+        return numpy.sum(image, axis=ImageOp.arrayAxis(image, axis))
 
     @staticmethod
     def sliceAndSum(image, params):
-        sumAxis = params.get('sumAxis', 1)
+        """
+        :param ndarray image: Two dimensional numpy.ndarray or stack of images
+        :param dict params: Contains parameters binWidth, sliceAxis, sumAxis and mode
+
+        Divides the image along an axis into bins of a given width and sums up the lines in every bin.
+        Possible parameters are
+
+        binWidth
+            number of rows or columns per bin (default: 8)
+
+        sliceAxis
+            axis along which the image is divided (default: 1)
+
+        sumAxis
+            axis along which the bins are summed up, must be equal to sliceAxis (default: 1)
+
+        mode
+            'strict' neglects surplus lines at the end of the image, 'relaxed' sums them up in a
+            last, partial bin (default: 'strict')
+
+        The image is reshaped into a view of shape (rows, bins, binWidth) respectively (bins, binWidth, cols)
+        that is reduced in a single call, no copies of the slices are made. Stacks keep their leading axis.
+
+        :returns ndarray: Summed slices, the result has the type of the image
+        :raises ValueError: if the mode is unknown or sumAxis differs from sliceAxis
+        """
+        binWidth = params.get('binWidth', 8)
         sliceAxis = params.get('sliceAxis', 1)
-        params['axis'] = sliceAxis
-        slices = Manipulation.slice(image, params)
-        # result = [slice_.sum(axis=sumAxis) for slice_ in slices]
+        sumAxis = params.get('sumAxis', 1)
+        mode = params.get('mode', 'strict')
+        if mode not in ['strict', 'relaxed']:
+            raise ValueError('Integration.sliceAndSum -- Unknown mode %s' % mode)
+        if sumAxis != sliceAxis:
+            raise ValueError('Integration.sliceAndSum -- sumAxis (%d) must equal sliceAxis (%d)' % (sumAxis, sliceAxis))
+
+        nRows, nCols = image.shape[-2:]
+        stackShape = image.shape[:-2]
+        numberOfBins, surplus = divmod(image.shape[ImageOp.arrayAxis(image, sliceAxis)], binWidth)
+        limit = numberOfBins * binWidth
+        if mode == 'relaxed' and surplus:
+            resultBins = numberOfBins + 1
+        else:
+            resultBins = numberOfBins
 
-        nRows, nCols = image.shape
         if sliceAxis == 1:
             # Slice along columns
-            result = numpy.zeros((nRows, len(slices)), dtype=image.dtype)
+            result = numpy.empty(stackShape + (nRows, resultBins), dtype=image.dtype)
+            binned = image[..., :limit].reshape(stackShape + (nRows, numberOfBins, binWidth))
+            binned.sum(axis=-1, out=result[..., :numberOfBins])
+            if resultBins > numberOfBins:
+                image[..., limit:].sum(axis=-1, out=result[..., numberOfBins])
         else:
             # Slice along rows
-            result = numpy.zeros((len(slices), nCols), dtype=image.dtype)
-        for idx, slice_ in enumerate(slices):
-            if sliceAxis == 1:
-                result[:, idx] = slice_.sum(axis=sumAxis)
-            else:
-                result[idx, :] = slice_.sum(axis=sumAxis)
-        # result = numpy.asarray([slice_.sum(axis=sumAxis) for slice_ in slices], dtype=image.dtype)
-        # ddict = {
-        #    'op': 'sliceAndSum',
-        #    'summedSlices': result
-        # }
-        # return ddict
+            result = numpy.empty(stackShape + (resultBins, nCols), dtype=image.dtype)
+            binned = image[..., :limit, :].reshape(stackShape + (numberOfBins, binWidth, nCols))
+            binned.sum(axis=-2, out=result[..., :numberOfBins, :])
+            if resultBins > numberOfBins:
+                image[..., limit:, :].sum(axis=-2, out=result[..., numberOfBins, :])
         if DEBUG >= 1:
             print('Integration.sliceAndSum -- result.shape: %s' % str(result.shape))
         return result
@@ -619,18 +817,24 @@ class Normalization(ImageOp):
 
     @staticmethod
     def zeroToOne(image, params):
-        offset = image.min()
-        maximum = image.max()
+        if image.ndim > 2:
+            # Every image of a stack is normalized separately
+            offset = image.min(axis=(-2, -1), keepdims=True)
+            maximum = image.max(axis=(-2, -1), keepdims=True)
+        else:
+            offset = image.min()
+            maximum = image.max()
         normFactor = maximum - offset
 
         if DEBUG >= 1:
-            print('zeroToOne, before -- min: %.3f, max: %.3f' % (offset, maximum))
+            print('zeroToOne, before -- min: %.3f, max: %.3f' % (offset.min(), maximum.max()))
 
-        if normFactor == 0.:
+        if not numpy.any(normFactor):
             normalized = numpy.zeros(shape=image.shape,
                                      dtype=image.dtype)
         else:
-            normalized = (image - offset) / normFactor
+            # Constant images are set to zero
+            normalized = (image - offset) / numpy.where(normFactor == 0, 1, normFactor)
         if DEBUG >= 1:
             print('zeroToOne, after  -- min: %.3f, max: %.3f' % (normalized.min(), normalized.max()))
         ddict = {
@@ -644,111 +848,147 @@ class Manipulation(ImageOp):
     def __init__(self):
         ImageOp.__init__(self)
         self._ops = {
+            'flip': self.flip,
             'slice': self.slice
         }
 
+    @staticmethod
+    def flip(image, params):
+        """
+        :param ndarray image: Two dimensional numpy.ndarray
+        :param dict params: Not used
+
+        Flips the image upside down, i.e. along the rows. Images of a stack are flipped individually.
+
+        :returns ndarray: View on the flipped image
+        """
+        return image[..., ::-1, :]
+
     @staticmethod
     def skewAlongAxis(image, params):
-        nRows, nCols = image.shape
+        """
+        :param ndarray image: Two dimensional numpy.ndarray or stack of images
+        :param dict params: Contains parameters shiftArray, axis, oversampling and out
+
+        Shifts every line of the image along an axis using linear interpolation. Possible parameters are
+
+        shiftArray
+            shift for every line, i.e. one value per row or column (mandatory). For stacks either the same
+            shifts for all images or one row of shifts per image, c.f. :py:func:`Alignment.fftAlignment`
+
+        axis
+            axis along which the lines are shifted (default: larger axis)
+
+        oversampling
+            factor by which the number of points along axis is increased (default: 1). The values are
+            divided by this factor
+
+        out
+            preallocated array of the result shape the result is written to (default: None)
 
-        axis = params.get('foobar', None)
-        # if axis is specified, skew along longer axis
-        # i.e. loop along shorter axis
+        Points that are shifted out of the image are set to zero. The sampling grid spans the full length of
+        the lines, independent of the detector size.
+
+        :returns ndarray: Skewed image
+        :raises ValueError: if shiftArray is missing or any of the shapes does not match
+        """
+        nRows, nCols = image.shape[-2:]
+        stackShape = image.shape[:-2]
+
+        # If axis is not specified, skew along longer axis
+        axis = params.get('axis', None)
         if axis is None:
             if nRows > nCols:
-                axis = 1
-                longAxis = 0
-                shortAxis = 1
+                axis = 0
             else:
-                longAxis = 1
-                shortAxis = 0
+                axis = 1
+        if axis == 0:
+            curves = numpy.swapaxes(image, -2, -1)
+        elif axis == 1:
+            curves = image
+        else:
+            raise ValueError('Manipulation.skewAlongAxis -- Axis must be either 0 or 1')
+        nCurves, nPoints = curves.shape[-2:]
 
         shiftArray = params.get('shiftArray', None)
         if shiftArray is None:
             raise ValueError('Manipulation.skewAlongAxis -- must provide shiftArray')
-        if not isinstance(shiftArray, numpy.ndarray):
-            shiftArray = numpy.ascontiguousarray(shiftArray)
+        shiftArray = numpy.asarray(shiftArray, dtype=numpy.float64)
+        if shiftArray.shape not in [(nCurves,), stackShape + (nCurves,)]:
+            raise ValueError('Manipulation.skewAlongAxis -- shiftArray must contain %d values' % nCurves +
+                             (' per image' if stackShape else ''))
+        shiftArray = numpy.broadcast_to(shiftArray, stackShape + (nCurves,))
 
         oversampling = params.get('oversampling', 1)
-        if shortAxis == 0:
-            resultShape = (nRows, oversampling * nCols)
+        nSamples = oversampling * nPoints
+        if axis == 0:
+            resultShape = stackShape + (nSamples, nCurves)
         else:
-            resultShape = (oversampling * nRows, nCols)
-        result = numpy.zeros(resultShape)
-        interpRange = numpy.linspace(0, 2047, result.shape[longAxis])
-        if shortAxis == 0:
-            points = numpy.arange(0, image.shape[1], 1, dtype=numpy.uint16)
+            resultShape = stackShape + (nCurves, nSamples)
+        out = params.get('out', None)
+        if out is None:
+            out = numpy.empty(resultShape, dtype=numpy.float64)
+        elif out.shape != resultShape:
+            raise ValueError('Manipulation.skewAlongAxis -- out must have shape %s' % str(resultShape))
+        if axis == 0:
+            result = numpy.swapaxes(out, -2, -1)
         else:
-            points = numpy.arange(0, image.shape[0], 1, dtype=numpy.uint16)
-
-        # print(shortAxis)
-        # print(longAxis)
-        # print(image.shape)
-        # print(result.shape)
-        # print(len(interpRange))
-        # print(len(points))
-
-        for idx in range(image.shape[shortAxis]):
-            if shortAxis == 0:
-                vector = image[idx, :]
-            else:
-                vector = image[:, idx]
-            shift = shiftArray[idx]
-
-            #
-            # Perform interpolation. Values outside the function range are set to not-a-number values
-            #
-            interpolated = numpy.interp(
-                x=interpRange - shift,
+            result = out
+
+        #
+        # Perform interpolation directly into the result. numpy.interp is implemented in C and
+        # outperforms an interpolation kernel built from numpy array operations, which needs
+        # about a dozen passes over image sized temporaries. Values outside the function range
+        # are set to zero.
+        #
+        interpRange = numpy.linspace(0, nPoints - 1, nSamples)
+        points = numpy.arange(nPoints, dtype=numpy.float64)
+        for idx in numpy.ndindex(*shiftArray.shape):
+            result[idx] = numpy.interp(
+                x=interpRange - shiftArray[idx],
                 xp=points,
-                fp=vector,
-                right=float('NaN'),
-                left=float('NaN')
+                fp=curves[idx],
+                left=0.,
+                right=0.
             )
-            interpolated /= float(oversampling)
 
-            #
-            # Remove not-a-number values
-            #
-            if numpy.any(numpy.isfinite(interpolated)):
-                interpolated = numpy.nan_to_num(interpolated)
+        if oversampling != 1:
+            out /= float(oversampling)
 
-            if shortAxis == 0:
-                result[idx, :] = interpolated
-            else:
-                result[:, idx] = interpolated
-
-        return result
+        return out
 
     @staticmethod
     def slice(image, params):
+        """
+        :param ndarray image: Two dimensional numpy.ndarray
+        :param dict params: Contains parameters binWidth, axis and mode
+
+        Divides the image along axis into slices of binWidth rows or columns. In 'strict' mode surplus
+        lines at the end of the image are neglected, in 'relaxed' mode they form a last, smaller slice.
+
+        :returns list: Views on the slices of the image
+        :raises ValueError: if the mode is unknown
+        """
         binWidth = params.get('binWidth', 8)
         axis = params.get('axis', 1)
         mode = params.get('mode', 'strict')
-        if axis:
-            size = (image.shape[0], binWidth)
-        else:
-            size = (binWidth, image.shape[1])
+        if mode not in ['strict', 'relaxed']:
+            raise ValueError('Manipulation.slice: Unknown mode %s' % mode)
         lim = image.shape[axis]
-        if mode not in ['strict']:  # TODO: implement mode that puts surplus cols rows as last element in tmpList
-            raise ValueError('Integration.binning: Unknown mode %s' % mode)
-        if lim % binWidth and mode == 'relaxed':
-            raise Warning('Binning neglects curves at the end')
         numberOfBins = lim // binWidth
-        tmpList = numberOfBins * [numpy.zeros(size, dtype=image.dtype)]
-        for idx in range(numberOfBins):
-            lower = idx * binWidth
-            upper = lower + binWidth
-            if upper > lim:
-                break
+        bounds = [idx * binWidth for idx in range(numberOfBins + 1)]
+        if lim % binWidth and mode == 'relaxed':
+            bounds += [lim]
+        tmpList = []
+        for lower, upper in zip(bounds[:-1], bounds[1:]):
             if axis:
                 # Slice along cols (axis==1)
-                tmpList[idx] = numpy.copy(image[:, lower:upper])
+                tmpList += [image[:, lower:upper]]
             else:
                 # Slice along rows (axis==0)
-                tmpList[idx] = numpy.copy(image[lower:upper, :])
+                tmpList += [image[lower:upper, :]]
             if DEBUG >= 1:
-                print('Manipulation.slice -- tmpList[%d].shape: %s' % (idx, str(tmpList[idx].shape)))
+                print('Manipulation.slice -- tmpList[%d].shape: %s' % (len(tmpList) - 1, str(tmpList[-1].shape)))
 
         return tmpList
 
@@ -760,15 +1000,55 @@ class SlopeCorrection(object):
         self.smileFunction = None
 
     @staticmethod
-    def alignImage(image, smileFunction):
+    def createSmileFunction(a, b, c):
+        """
+        :param float a: Quadratic coefficient
+        :param float b: Linear coefficient
+        :param float c: Constant coefficient
+
+        :returns FunctionItem smileFunction: Quadratic y = a * x**2 + b * x + c
+        """
+        function = FunctionItem('Slope Function', '')
+        function.setExpression('lambda x, a, b, c: a * x ** 2 + b * x + c')
+        function.setParameters({
+            'a': a,
+            'b': b,
+            'c': c
+        })
+        return function
+
+    @staticmethod
+    def smileCorrection(image, params):
+        """
+        :param ndarray image: Uncorrected RIXS image
+        :param dict params: Contains the coefficients a, b and c of the smile function and optionally a
+         preallocated result array out
+
+        Convenience function that applies :py:func:`alignImage` using a quadratic smile function
+        y = a * x**2 + b * x + c. Missing coefficients default to zero.
+
+        :returns ndarray: Corrected image
+        """
+        smileFunction = SlopeCorrection.createSmileFunction(
+            a=params.get('a', 0.),
+            b=params.get('b', 0.),
+            c=params.get('c', 0.)
+        )
+        return SlopeCorrection.alignImage(image, smileFunction, params.get('out', None))
+
+    @staticmethod
+    def alignImage(image, smileFunction, out=None):
         """
         :param ndarray image: Uncorrected RIXS image
         :param FunctionItem smileFunction: smile function
+        :param ndarray out: Preallocated array for the result (default: None). Its shape is the shape of the
+         image with the larger axis oversampled by a factor of two.
 
-        Applies
+        Applies the smile function as shift per line along the larger axis of the image, c.f.
+        :py:func:`Manipulation.skewAlongAxis`
         """
         # Larger axis is shiftAxis, small is sumAxis
-        nRows, nCols = image.shape
+        nRows, nCols = image.shape[-2:]
         if nRows > nCols:
             shiftAxis = 0  # ..rows
         else:
@@ -784,7 +1064,8 @@ class SlopeCorrection(object):
             params={
                 'axis': shiftAxis,
                 'oversampling': 2,
-                'shiftArray': shiftPerColumn
+                'shiftArray': shiftPerColumn,
+                'out': out
             }
         )
 
@@ -815,6 +1096,7 @@ class SlopeCorrection(object):
         # Slice the image by a given binning
         #
         sliceParams = {
+            'sliceAxis': sumAxis,
             'sumAxis': sumAxis,
             'binWidth': binWidth
         }
@@ -0,0 +1,97 @@
+#/*##########################################################################
+# Copyright (C) 2014 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# This toolkit is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2 of the License, or (at your option)
+# any later version.
+#
+# PyMca is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyMca; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# PyMca follows the dual licensing model of Riverbank's PyQt and cannot be
+# used as a free plugin for a non-free program.
+#
+# Please contact the ESRF industrial unit (industry@esrf.fr) if this license
+# is a problem for you.
+#############################################################################*/
+__author__ = "Tonn Rueter - ESRF Data Analysis Unit"
+__doc__ = """Module provides an executor that distributes independent tasks, e.g. the processing of images, over a
+pool of worker processes or threads."""
+
+from multiprocessing import Pool, cpu_count
+from multiprocessing.pool import ThreadPool
+
+DEBUG = 0
+
+
+class ParallelExecutor(object):
+    __doc__ = """The :py:class:`ParallelExecutor` maps a function over a sequence of arguments using a pool of worker
+    processes. The results are returned in the order of the arguments. Since arguments, function and results are
+    passed between processes, all of them must be picklable, i.e. the function must be defined on module level.
+
+    Tasks that mostly wait for I/O, e.g. reading files from a network file system, are better served by a pool of
+    threads. In this case nothing needs to be pickled.
+
+    .. py:attribute:: processes
+
+        Number of workers. None uses all available cores (processes) respectively a multiple of them (threads),
+        1 disables the pool
+
+    .. py:attribute:: useThreads
+
+        Use a pool of threads instead of processes"""
+
+    def __init__(self, processes=None, useThreads=False):
+        self.processes = processes
+        self.useThreads = useThreads
+
+    def workerCount(self, taskCount):
+        """
+        :param int taskCount: Number of tasks to be distributed
+
+        :returns int: Number of workers that are actually used
+        """
+        processes = self.processes
+        if processes is None:
+            if self.useThreads:
+                # Threads mostly wait for I/O, use more of them than there are cores
+                processes = min(32, 4 * cpu_count())
+            else:
+                processes = cpu_count()
+        return max(1, min(processes, taskCount))
+
+    def map(self, function, argumentList):
+        """
+        :param function function: Module level function taking a single argument
+        :param list argumentList: Arguments
+
+        :returns list: Results in the order of the argument list
+        """
+        argumentList = list(argumentList)
+        processes = self.workerCount(len(argumentList))
+        if DEBUG >= 1:
+            print('ParallelExecutor.map -- %d tasks, %d processes' % (len(argumentList), processes))
+        if processes <= 1:
+            return [function(argument) for argument in argumentList]
+        if self.useThreads:
+            pool = ThreadPool(processes)
+        else:
+            pool = Pool(processes)
+        try:
+            # Small chunks keep the workers busy even if the task durations vary
+            chunkSize = max(1, len(argumentList) // (4 * processes))
+            result = pool.map(function, argumentList, chunkSize)
+        finally:
+            pool.close()
+            pool.join()
+        return result
@@ -0,0 +1,349 @@
+#/*##########################################################################
+# Copyright (C) 2014 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# This toolkit is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2 of the License, or (at your option)
+# any later version.
+#
+# PyMca is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyMca; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# PyMca follows the dual licensing model of Riverbank's PyQt and cannot be
+# used as a free plugin for a non-free program.
+#
+# Please contact the ESRF industrial unit (industry@esrf.fr) if this license
+# is a problem for you.
+#############################################################################*/
+__author__ = "Tonn Rueter - ESRF Data Analysis Unit"
+__doc__ = """Module provides the :py:class:`Pipeline`, the GUI independent description of how images are reduced. The
+same pipeline is edited in the image view, applied by the batch reduction (c.f. :py:mod:`RixsTool.Batch`) and stored
+in JSON or YAML files."""
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+import json
+import hashlib
+import numpy
+from os.path import splitext as OsPathSplitext
+
+from RixsTool.IO import IODict
+from RixsTool.Items import DataItem
+from RixsTool.Operations import Filter, Integration, Manipulation, SlopeCorrection
+
+DEBUG = 0
+
+#
+# Parameters of the operations that take a reference to a dark map instead of the map, c.f. Pipeline.resolve
+#
+REFERENCE_PARAMETERS = {
+    'bandpass': 'offset',
+    'bandpassID32': 'dark'
+}
+
+
+class Pipeline(object):
+    __doc__ = """A :py:class:`Pipeline` is an ordered list of processing stages. Every stage is a pair of operation
+    name and parameter dictionary, c.f. :py:attr:`operations`. Pipelines are values: They compare equal and have the
+    same hash if their stages are equal, which makes them usable as cache keys. Pipelines are concatenated using +.
+
+    Pipelines are stored as JSON or YAML, for example::
+
+        {
+            "stages": [
+                ["flip", {}],
+                ["bandpassID32", {"energy": 932.0, "binning": 4, "preset": 300}],
+                ["smileCorrection", {"a": -5.25e-5, "b": 0.18877, "c": 0.0}],
+                ["axisSum", {"axis": 1}]
+            ]
+        }
+
+    All operations accept an image as well as a stack of images, c.f. :py:class:`RixsTool.Operations.ImageOp`.
+
+    Dark maps are not stored in the file. Instead the parameters listed in :py:data:`REFERENCE_PARAMETERS` take a
+    reference, i.e. a project key or a file name, that is replaced by the map in :func:`resolve`::
+
+        ["bandpassID32", {"energy": 932.0, "binning": 4, "preset": 300, "dark": "darks/dark_300s.edf"}]
+    """
+
+    operations = {
+        'flip': Manipulation.flip,
+        'bandpass': Filter.bandPassFilter,
+        'bandpassID32': Filter.bandPassFilterID32,
+        'snip': Filter.snip,
+        'smileCorrection': SlopeCorrection.smileCorrection,
+        'axisSum': Integration.axisSum,
+        'sliceAndSum': Integration.sliceAndSum
+    }
+
+    def __init__(self, stages=(), references=None):
+        """
+        :param list stages: Pipeline or list of (name, parameters) pairs
+        :param dict references: Maps the position of a resolved stage to the reference it was resolved from,
+         c.f. :func:`resolve`
+
+        :raises ValueError: if a stage name is unknown
+        """
+        if isinstance(stages, Pipeline):
+            if references is None:
+                references = stages._references
+            stages = stages._stages
+        stageList = []
+        for name, parameters in stages:
+            if name not in self.operations:
+                raise ValueError("Pipeline -- Unknown operation '%s'" % name)
+            stageList += [(str(name), dict(parameters))]
+        self._stages = tuple(stageList)
+        self._references = dict(references) if references else {}
+        self._key = tuple((name, parameterKey(parameters)) for name, parameters in self._stages)
+
+    def __repr__(self):
+        return 'Pipeline(%s)' % ', '.join(name for name, parameters in self._stages)
+
+    def __len__(self):
+        return len(self._stages)
+
+    def __iter__(self):
+        # Parameters are copied, the stages of a pipeline can not be changed
+        for name, parameters in self._stages:
+            yield name, dict(parameters)
+
+    def __getitem__(self, idx):
+        name, parameters = self._stages[idx]
+        return name, dict(parameters)
+
+    def __add__(self, other):
+        other = Pipeline(other)
+        references = dict(self._references)
+        references.update((idx + len(self), reference) for idx, reference in other._references.items())
+        return Pipeline(self._stages + other._stages, references)
+
+    def __eq__(self, other):
+        return isinstance(other, Pipeline) and self._key == other._key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def key(self, stop=None):
+        """
+        :param int stop: Number of leading stages the key is calculated for (default: None, i.e. all stages)
+
+        :returns tuple: Hashable representation of the stages. Keys of leading stages identify intermediate results.
+        """
+        return self._key[:stop]
+
+    def runStage(self, idx, data):
+        """
+        :param int idx: Position of the stage
+        :param ndarray data: Image or stack of images
+
+        :returns ndarray: Result of the stage
+        """
+        name, parameters = self[idx]
+        if _isReference(parameters.get(REFERENCE_PARAMETERS.get(name))):
+            raise ValueError("Pipeline.runStage -- Unresolved reference '%s' in stage '%s', c.f. Pipeline.resolve" %
+                             (parameters[REFERENCE_PARAMETERS[name]], name))
+        return self.operations[name](data, parameters)
+
+    def run(self, data):
+        """
+        :param data: Image, stack of images or :py:class:`RixsTool.Items.DataItem`
+
+        Applies all stages in order.
+
+        :returns ndarray: Result of the last stage
+        """
+        if isinstance(data, DataItem):
+            data = data.array
+        for idx in range(len(self)):
+            data = self.runStage(idx, data)
+        return data
+
+    def resolve(self, resolver=None):
+        """
+        :param resolver: Callable that returns the dark map for a reference, e.g.
+         :py:func:`RixsTool.Project.RixsProject.darkOffset` (default: None, i.e. :func:`loadDark`)
+
+        Replaces the references to dark maps by the maps, c.f. :py:data:`REFERENCE_PARAMETERS`. One dimensional
+        maps of the parameter offset are per row levels and are applied to the rows of the image. The resolved
+        pipeline remembers the references and is stored with them instead of the maps.
+
+        :returns Pipeline: Pipeline without references
+        """
+        if resolver is None:
+            resolver = loadDark
+        stageList = []
+        references = dict(self._references)
+        for idx, (name, parameters) in enumerate(self):
+            parameter = REFERENCE_PARAMETERS.get(name)
+            reference = parameters.get(parameter)
+            if _isReference(reference):
+                dark = numpy.asarray(resolver(reference))
+                if parameter == 'offset' and dark.ndim == 1:
+                    dark = dark[:, numpy.newaxis]
+                parameters[parameter] = dark
+                references[idx] = reference
+            stageList += [(name, parameters)]
+        return Pipeline(stageList, references)
+
+    def toDict(self):
+        """
+        :returns dict: Stages in a form that can be serialized. Resolved dark maps are replaced by their references,
+         other numpy arrays are converted to lists
+        """
+        return json.loads(self.toJSON())
+
+    def toJSON(self, indent=None):
+        """
+        :param int indent: Indentation of the JSON string (default: None, i.e. single line)
+
+        :returns str: JSON representation of the pipeline
+        """
+        stageList = []
+        for idx, (name, parameters) in enumerate(self._stages):
+            if idx in self._references:
+                parameters = dict(parameters)
+                parameters[REFERENCE_PARAMETERS[name]] = self._references[idx]
+            stageList += [[name, parameters]]
+        return json.dumps({'stages': stageList}, default=_jsonDefault, indent=indent, sort_keys=True)
+
+    @staticmethod
+    def fromDict(ddict):
+        """
+        :param dict ddict: Dictionary containing the list of stages under the key 'stages'
+
+        :returns Pipeline: Pipeline
+        :raises ValueError: if a stage name is unknown
+        """
+        return Pipeline(ddict['stages'])
+
+    @staticmethod
+    def fromJSON(string):
+        return Pipeline.fromDict(json.loads(string))
+
+    def save(self, fileName):
+        """
+        :param str fileName: Files with extension .yaml or .yml are written as YAML, all others as JSON
+
+        :raises ImportError: if YAML is requested but PyYAML is not available
+        """
+        if _isYaml(fileName):
+            _checkYaml()
+            content = yaml.safe_dump(self.toDict(), default_flow_style=None)
+        else:
+            content = self.toJSON(indent=4)
+        with open(fileName, 'w') as fileHandle:
+            fileHandle.write(content)
+
+    @staticmethod
+    def fromFile(fileName):
+        """
+        :param str fileName: JSON or YAML file, c.f. :func:`save`
+
+        :returns Pipeline: Pipeline defined in the file
+        :raises ImportError: if the file is YAML but PyYAML is not available
+        :raises ValueError: if a stage name is unknown
+        """
+        with open(fileName, 'r') as fileHandle:
+            if _isYaml(fileName):
+                _checkYaml()
+                ddict = yaml.safe_load(fileHandle)
+            else:
+                ddict = json.load(fileHandle)
+        return Pipeline.fromDict(ddict)
+
+
+def parameterKey(parameters):
+    """
+    :param dict parameters: Parameters of a stage
+
+    :returns tuple: Hashable representation of the parameters, independent of the order of the keys. Numeric arrays
+     and lists are represented by shape, kind of number and a digest of their content, so that an array and the list
+     it is serialized to have the same key.
+    """
+    return tuple(sorted((key, _valueKey(value)) for key, value in parameters.items()))
+
+
+def loadDark(fileName):
+    """
+    :param str fileName: .npy file or image file readable by :py:mod:`RixsTool.IO`, e.g. EDF
+
+    Default resolver of :func:`Pipeline.resolve`. Of image files the first image is used.
+
+    :returns ndarray: Dark map
+    :raises ValueError: if the file type is unknown or the file contains no data
+    """
+    fileType = OsPathSplitext(fileName)[1].replace('.', '').lower()
+    if fileType == 'npy':
+        return numpy.load(fileName)
+    inputReaders = IODict.inputReaderDict()
+    if fileType not in inputReaders:
+        raise ValueError("Pipeline.loadDark -- Unknown file type '%s'" % fileType)
+    itemList = inputReaders[fileType].itemize(fileName)
+    if not itemList:
+        raise ValueError("Pipeline.loadDark -- No data in '%s'" % fileName)
+    return numpy.array(itemList[0].array, dtype=numpy.float64)
+
+
+#
+# Numbers are compared by kind, e.g. float32 arrays equal the lists of floats they are serialized to
+#
+CANONICAL_TYPES = {
+    'b': numpy.bool_,
+    'i': numpy.int64,
+    'u': numpy.int64,
+    'f': numpy.float64,
+    'c': numpy.complex128
+}
+
+
+def _valueKey(value):
+    if isinstance(value, numpy.generic) or (isinstance(value, numpy.ndarray) and not value.ndim):
+        value = value.item()
+    if isinstance(value, (list, tuple)):
+        array = numpy.asarray(value)
+        if array.dtype.kind not in CANONICAL_TYPES:
+            # Tuples become lists when serialized
+            return repr(list(value))
+        value = array
+    if isinstance(value, numpy.ndarray) and value.dtype.kind in CANONICAL_TYPES:
+        array = numpy.ascontiguousarray(value, dtype=CANONICAL_TYPES[value.dtype.kind])
+        digest = hashlib.sha1(array.data).hexdigest()
+        return 'ndarray', value.shape, value.dtype.kind, digest
+    return repr(value)
+
+
+def _isReference(value):
+    return isinstance(value, (str, type(u'')))
+
+
+def _jsonDefault(value):
+    if isinstance(value, numpy.ndarray):
+        return value.tolist()
+    if isinstance(value, numpy.generic):
+        return value.item()
+    raise TypeError('Pipeline -- Can not serialize %s' % type(value))
+
+
+def _isYaml(fileName):
+    return OsPathSplitext(fileName)[1].lower() in ['.yaml', '.yml']
+
+
+def _checkYaml():
+    if yaml is None:
+        raise ImportError('Pipeline -- PyYAML is required to read and write YAML files')
@@ -33,7 +33,10 @@ from os import walk as OsWalk
 from RixsTool.ItemContainer import ItemContainer
 
 from RixsTool.IO import IODict
-from RixsTool.Items import SpecItem, ScanItem, ImageItem, StackItem
+from RixsTool.Items import SpecItem, ScanItem, ImageItem, StackItem, DarkItem
+from RixsTool.Parallel import ParallelExecutor
+from RixsTool.HDF5Backend import saveProject, loadProject
+from functools import partial
 
 DEBUG = 0
 
@@ -46,10 +49,10 @@ class RixsProject(object):
     The tree itself consists of nodes of type :py:class:`datahandling.ItemContainer`.
 
     On the top level, the tree divides the data items in containers depeding on the  dimensionality of their data.
-    Two dimensional input for example is treated as an image.
+    Two dimensional input for example is treated as an image. Dark levels of the detector
+    (:py:class:`Items.DarkItem`) are kept in the group 'Darks'.
 
-    **TODO**:
-        * Implement HDF Backend..
+    Projects are saved to and loaded from HDF5 files, c.f. :py:mod:`RixsTool.HDF5Backend`.
     """
 
     def __init__(self):
@@ -59,10 +62,30 @@ class RixsProject(object):
         self.inputReaders = IODict.inputReaderDict()
 
         #
-        # Identifier dict
+        # Pool of worker processes used to process images, None uses all cores
+        #
+        self.executor = ParallelExecutor()
+
+        #
+        # Pool of threads used to read files. Reading is mostly waiting for I/O
+        #
+        self.readExecutor = ParallelExecutor(useThreads=True)
+
+        #
+        # Persistent cache of read files, None disables the cache (c.f. RixsTool.Cache.FileCache)
+        #
+        self.fileCache = None
+
+        #
+        # Identifier dict, maps keys to identifiers
         #
         self.__idDict = {}
 
+        #
+        # Container dict, maps identifiers to the containers in the tree
+        #
+        self.__containerDict = {}
+
         #
         # Data tree
         #
@@ -70,22 +93,15 @@ class RixsProject(object):
         #self.projectRoot.addChildren(
         #    [ItemContainer(parent=self.projectRoot, label=key)\
         #     for key in ['Spectra', 'Images', 'Stacks']])
-        for label in ['Spectra', 'Images', 'Stacks']:
+        for label in ['Spectra', 'Images', 'Stacks', 'Darks']:
             self.addGroup(label)
         if DEBUG >= 1:
             print('RixsProject.__init__ -- projectRoot.childCount: %d' % self.projectRoot.childCount())
             print('RixsProject.__init__ -- projectRoot.__idDict: %s' % str(self.__idDict))
 
     def __getitem__(self, key):
-        result = None
         identifier = self.__idDict[key]
-        for container in self._traverseDFS(self.projectRoot):
-            if container.getID() == identifier:
-                result = container
-                break
-        if not result:
-            raise KeyError()
-        return result
+        return self.__containerDict[identifier]
 
     def __contains__(self, item):
         """
@@ -100,13 +116,11 @@ class RixsProject(object):
         :raises ValueError: If the provided item is neither of type string nor an ItemContainer
         """
         if isinstance(item, str):
-            llist = self.__idDict.keys()
+            return item in self.__idDict
         elif isinstance(item, ItemContainer):
-            item = item.getID()
-            llist = self.__idDict.values()
+            return item.getID() in self.__containerDict
         else:
             raise ValueError('RixsProject.__contains__ -- Argument must be of type string or ItemContainer')
-        return item in llist
 
     def getIdDict(self):
         # TODO: Function for debugging purposes
@@ -145,6 +159,27 @@ class RixsProject(object):
         """
         raise NotImplementedError('RixsProject.spectrum -- ..to be implemented')
 
+    def darkKeys(self):
+        """
+        :returns list: Keys of the dark maps in the group 'Darks'
+        """
+        return [container.item().key() for container in self['Darks'].children if container.hasItem()]
+
+    def darkOffset(self, key):
+        """
+        :param str key: Key of a :py:class:`Items.DarkItem`
+
+        Resolver for the references to dark maps in a :py:class:`RixsTool.Pipeline.Pipeline`, c.f.
+        :py:func:`RixsTool.Pipeline.Pipeline.resolve`.
+
+        :returns ndarray: Dark level that broadcasts against an image, c.f. :py:func:`Items.DarkItem.offset`
+        :raises KeyError: if the project contains no dark map with the given key
+        """
+        item = self[key].item() if key in self else None
+        if not isinstance(item, DarkItem):
+            raise KeyError("RixsProject.darkOffset -- No dark map '%s'" % key)
+        return item.offset()
+
     def addItem(self, item):
         """
         :param DataItem item: Item to be inserted into the project tree
@@ -165,11 +200,13 @@ class RixsProject(object):
         if item.key() in self.__idDict:
             raise ValueError("RixsProject.addItem -- Item key '%s' already present" % item.key())
         if isinstance(item, ScanItem) or isinstance(item, SpecItem):
-            node = self.projectRoot.children[0]
+            node = self['Spectra']
         elif isinstance(item, ImageItem):
-            node = self.projectRoot.children[1]
+            node = self['Images']
         elif isinstance(item, StackItem):
-            node = self.projectRoot.children[2]
+            node = self['Stacks']
+        elif isinstance(item, DarkItem):
+            node = self['Darks']
         else:
             raise TypeError("RixsProject.addItem -- unknown item type '%s'" % type(item))
         container = ItemContainer(
@@ -178,8 +215,23 @@ class RixsProject(object):
         )
         node.addChildren([container])
         self.__idDict[item.key()] = container.getID()
+        self.__containerDict[container.getID()] = container
         return container
 
+    def addItems(self, itemList):
+        """
+        :param list itemList: Items to be inserted into the project tree
+
+        Inserts a batch of items, c.f. :func:`addItem`. Subclasses can reimplement the method to
+        handle the insertion of the whole batch at once.
+
+        :returns: Containers of the items
+        :rtype: list
+        :raises TypeError: if an item type is unknown
+        :raises ValueError: if an item.key() is already present
+        """
+        return [self.addItem(item) for item in itemList]
+
     def addGroup(self, label, node=None):
         """
         :param str label: Unique label for the container
@@ -204,19 +256,45 @@ class RixsProject(object):
         )
         node.addChildren([container])
         self.__idDict[container.label] = container.getID()
+        self.__containerDict[container.getID()] = container
         return container
 
     def removeContainer(self, label):
         container = self.__getitem__(label)
-        if container.childCount():
-            if DEBUG >= 1:
-                print('RixsProject.removeContainer -- Has children')
-            for child in container.children:
-                self.removeContainer(child.label)
+        if DEBUG >= 1 and container.childCount():
+            print('RixsProject.removeContainer -- Has children')
+        # Remove the container and all its descendants from the index
+        for descendant in self._traverseDFS(container):
+            del(self.__idDict[descendant.label])
+            del(self.__containerDict[descendant.getID()])
         parentContainer = container.parent
         idx = container.childNumber()
         del(parentContainer.children[idx])
-        del(self.__idDict[label])
+
+    def save(self, fileName):
+        """
+        :param str fileName: Name of the HDF5 file
+
+        Writes the project tree including the data of all items to a single HDF5 file, c.f.
+        :py:func:`RixsTool.HDF5Backend.saveProject`
+
+        :raises ImportError: if h5py is not available
+        """
+        saveProject(self, fileName)
+
+    def load(self, fileName):
+        """
+        :param str fileName: Name of the HDF5 file
+
+        Adds groups and items from a file written by :func:`save` to the project. The data of the items is only
+        read when it is accessed, c.f. :py:func:`RixsTool.HDF5Backend.loadProject`
+
+        :returns: Loaded items
+        :rtype: list
+        :raises ImportError: if h5py is not available
+        :raises ValueError: if an item key is already present
+        """
+        return loadProject(self, fileName)
 
     def read(self, fileName):
         """
@@ -225,6 +303,8 @@ class RixsProject(object):
         RixsProject stores a number of different reader for all sorts of file formats. The file stored under
         file name is registered with a matching reader.
 
+        If a :py:attr:`fileCache` is set, it is consulted first and files that are read are stored in it.
+
         :returns: List of raw data wrapped in :class:`datahandling.ItemContainer`
         :rtype: list
         :raises TypeError: if the item type is unknown
@@ -238,34 +318,109 @@ class RixsProject(object):
             reader = self.inputReaders[fileType]
         else:
             raise TypeError("RixsProject.read -- Unknown file type '%s'" % fileType)
+        if self.fileCache is not None:
+            itemList = self.fileCache.get(fileName)
+            if itemList is not None:
+                return itemList
         itemList = reader.itemize(fileName)
+        if self.fileCache is not None:
+            cacheFile(self.fileCache, fileName, itemList)
         return itemList
 
+    def readFiles(self, fileNameList):
+        """
+        :param list fileNameList: File names including path to the files
+
+        Reads the files concurrently using :py:attr:`readExecutor`. A file that can not be read does not abort
+        the others, its error is reported instead. If a :py:attr:`fileCache` is set, it is consulted first.
+
+        :returns: List of raw data items and list of (file name, error message) pairs for the files that failed
+        :rtype: tuple
+        """
+        itemList = []
+        errorList = []
+        for fileName, items, error in self.readExecutor.map(partial(readFile, cache=self.fileCache), fileNameList):
+            if error is not None:
+                if DEBUG >= 1:
+                    print("RixsProject.readFiles -- Failed to read '%s': %s" % (fileName, error))
+                errorList += [(fileName, error)]
+                continue
+            itemList += items
+        if self.fileCache is not None:
+            # Once per batch, since worker processes only track the size of their copy of the cache
+            self.fileCache.evict()
+        return itemList, errorList
+
     def crawl(self, directory):
         """
         :param str directory: Root directory for the crawler to start
 
         Reads every file of known file type contained in directory and its subdirectories and adds it
-        to the project.
+        to the project. Files are filtered by the extensions of the :py:attr:`inputReaders` before they are
+        opened and read concurrently, c.f. :func:`readFiles`. The items are added to the project in one batch.
+
+        :returns: List of (file name, error message) pairs for the files that could not be read
+        :rtype: list
         """
         walk = OsWalk(OsAbsPath(directory))
         if DEBUG >= 1:
             print("RixsProject.crawl -- crawling '%s'" % directory)
+        fileNameList = []
         for path, dirs, files in walk:
             if DEBUG >= 1:
                 print('RixsProject.crawl -- current path: %s' % path)
             for ffile in files:
-                absName = OsPathJoin(path, ffile)
-                try:
-                    itemList = self.read(absName)
-                except TypeError:
-                    if DEBUG >= 1:
-                        print("RixsProject.crawl -- unkown filetype '%s'" % absName)
-                    continue
-                for item in itemList:
-                    if DEBUG >= 1:
-                        print("RixsProject.crawl -- adding Item '%s'" % str(item))
-                    self.addItem(item)
+                name, ext = OsPathSplitext(ffile)
+                if ext.replace('.', '').lower() in self.inputReaders:
+                    fileNameList += [OsPathJoin(path, ffile)]
+        itemList, errorList = self.readFiles(fileNameList)
+        if DEBUG >= 1:
+            print("RixsProject.crawl -- adding %d items, %d files failed" % (len(itemList), len(errorList)))
+        self.addItems(itemList)
+        return errorList
+
+
+def readFile(fileName, cache=None):
+    """
+    :param str fileName: File name including path to file
+    :param FileCache cache: Persistent cache consulted before the file is read, None disables the cache
+
+    Worker function for :py:class:`RixsTool.Parallel.ParallelExecutor`, c.f. :func:`RixsProject.read`. Errors are
+    returned instead of raised, so that a single defective file does not abort the others.
+
+    :returns tuple: File name, list of raw data items and error message (None on success)
+    """
+    name, ext = OsPathSplitext(fileName)
+    fileType = ext.replace('.', '').lower()
+    inputReaders = IODict.inputReaderDict()
+    if fileType not in inputReaders:
+        return fileName, [], "Unknown file type '%s'" % fileType
+    try:
+        if cache is not None:
+            itemList = cache.get(fileName)
+            if itemList is not None:
+                return fileName, itemList, None
+        itemList = inputReaders[fileType].itemize(fileName)
+    except Exception as error:
+        return fileName, [], str(error)
+    if cache is not None:
+        cacheFile(cache, fileName, itemList)
+    return fileName, itemList, None
+
+
+def cacheFile(cache, fileName, itemList):
+    """
+    :param FileCache cache: Persistent cache
+    :param str fileName: File name including path to file
+    :param list itemList: Items read from the file
+
+    Stores the items in the cache. Since the items are already read, failures are only reported.
+    """
+    try:
+        cache.put(fileName, itemList)
+    except Exception as error:
+        if DEBUG >= 1:
+            print("cacheFile -- Failed to cache '%s': %s" % (fileName, error))
 
 
 def unitTest_RixsProject():
@@ -0,0 +1,342 @@
+#/*##########################################################################
+# Copyright (C) 2014 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# This toolkit is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2 of the License, or (at your option)
+# any later version.
+#
+# PyMca is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyMca; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# PyMca follows the dual licensing model of Riverbank's PyQt and cannot be
+# used as a free plugin for a non-free program.
+#
+# Please contact the ESRF industrial unit (industry@esrf.fr) if this license
+# is a problem for you.
+#############################################################################*/
+__author__ = "Tonn Rueter - ESRF Data Analysis Unit"
+__doc__ = """Headless reduction of images while they are recorded. An acquisition folder is watched for new files that
+are reduced to spectra by a :py:class:`RixsTool.Pipeline.Pipeline` as soon as they are completely written. The
+spectra are appended to a SPEC or HDF5 file (c.f. scripts/rixswatch)."""
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+import sys
+import time
+import argparse
+import threading
+import numpy
+
+from os import listdir as OsListDir
+from os import stat as OsStat
+from os.path import basename as OsPathBasename
+from os.path import exists as OsPathExists
+from os.path import join as OsPathJoin
+from os.path import splitext as OsPathSplitext
+
+from RixsTool.Batch import BatchReduction
+from RixsTool.Export import formatRows
+from RixsTool.Items import AccumulatorItem
+from RixsTool.Pipeline import Pipeline
+
+DEBUG = 0
+
+
+class FolderIndex(object):
+    __doc__ = """Set based index of the files in a directory. Every poll lists the directory once and compares it to
+    the set of known files. New files are tracked until their size and modification time did not change for a number
+    of polls, i.e. until they are completely written. A reported file is reported again only if it is handed back by
+    :func:`retry`, otherwise it becomes known once it is marked by :func:`done`."""
+
+    def __init__(self, directory, extension='edf', ignoreExisting=False, stablePolls=2, maxRetries=3):
+        """
+        :param str directory: Directory to watch
+        :param str extension: Only files with this extension are indexed
+        :param bool ignoreExisting: Files present at construction time are never reported
+        :param int stablePolls: Number of consecutive polls size and modification time of a file must not change
+        :param int maxRetries: Number of times a file is reported again by :func:`retry`
+        """
+        self.directory = directory
+        self.extension = '.' + extension.lower()
+        self.stablePolls = stablePolls
+        self.maxRetries = maxRetries
+        self._known = set()
+        self._reported = set()
+        self._pending = {}
+        self._retries = {}
+        if ignoreExisting:
+            self._known.update(self._listDirectory())
+
+    def _listDirectory(self):
+        return set(name for name in OsListDir(self.directory)
+                   if OsPathSplitext(name)[1].lower() == self.extension)
+
+    def poll(self):
+        """
+        :returns list: Sorted file names including path of the files that were completed since the last poll
+        """
+        names = self._listDirectory()
+        tracked = names.difference(self._known).difference(self._reported)
+        complete = []
+        for name in tracked:
+            try:
+                stat = OsStat(OsPathJoin(self.directory, name))
+            except OSError:
+                # Removed in the meantime
+                continue
+            signature = (stat.st_size, stat.st_mtime)
+            previous, stableCount = self._pending.get(name, (None, 0))
+            stableCount = stableCount + 1 if signature == previous else 0
+            self._pending[name] = (signature, stableCount)
+            # Files that failed before have to be stable for longer
+            if stat.st_size > 0 and stableCount >= self.stablePolls * 2 ** self._retries.get(name, 0):
+                complete += [name]
+        self._reported.update(complete)
+        # Forget files that are reported or have been removed
+        for name in set(self._pending).difference(tracked).union(complete):
+            del(self._pending[name])
+        return [OsPathJoin(self.directory, name) for name in sorted(complete)]
+
+    def done(self, fileName):
+        """
+        :param str fileName: File reported by :func:`poll`
+
+        Marks the file as processed, it is not reported again.
+        """
+        name = OsPathBasename(fileName)
+        self._reported.discard(name)
+        self._retries.pop(name, None)
+        self._known.add(name)
+
+    def retry(self, fileName):
+        """
+        :param str fileName: File reported by :func:`poll`
+
+        Hands a file that could not be processed back to the index, e.g. because it was still being written. It is
+        reported again once it was stable for twice as many polls as before, at most :py:attr:`maxRetries` times.
+
+        :returns bool: False if the file is given up and marked as done
+        """
+        name = OsPathBasename(fileName)
+        retries = self._retries.get(name, 0) + 1
+        if retries > self.maxRetries:
+            self.done(fileName)
+            return False
+        self._reported.discard(name)
+        self._retries[name] = retries
+        return True
+
+
+class SpecWriter(object):
+    __doc__ = """Appends spectra as scans to a SPEC file. The file is opened for every spectrum, so that it can be read
+    by other programs during the acquisition."""
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.scanNumber = 0
+        if OsPathExists(fileName):
+            # Continue the numbering of an existing file
+            with open(fileName, 'r') as fileHandle:
+                self.scanNumber = sum(1 for line in fileHandle if line.startswith('#S '))
+
+    def append(self, key, spectrum):
+        """
+        :param str key: Name of the spectrum, used as scan title
+        :param ndarray spectrum: One dimensional numpy.ndarray
+        """
+        self.scanNumber += 1
+        with open(self.fileName, 'a') as fileHandle:
+            if self.scanNumber == 1:
+                fileHandle.write('#F %s\n#D %s\n' % (self.fileName, time.ctime()))
+            fileHandle.write('\n#S %d %s\n#D %s\n#N 2\n#L Pixel  Counts\n' % (self.scanNumber, key, time.ctime()))
+            data = numpy.vstack((numpy.arange(len(spectrum)), spectrum)).T
+            fileHandle.write(formatRows(data))
+
+
+class HDF5Writer(object):
+    __doc__ = """Appends spectra to a HDF5 file. The spectra are rows of the resizable dataset spectra, their names are
+    stored in the dataset keys. The file is opened for every spectrum, so that it can be read by other programs during
+    the acquisition."""
+
+    def __init__(self, fileName):
+        """
+        :raises ImportError: if h5py is not available
+        """
+        if h5py is None:
+            raise ImportError('HDF5Writer -- h5py is required to write HDF5 files')
+        self.fileName = fileName
+
+    def append(self, key, spectrum):
+        """
+        :param str key: Name of the spectrum
+        :param ndarray spectrum: One dimensional numpy.ndarray
+
+        :raises ValueError: if the spectrum length differs from the spectra already in the file
+        """
+        with h5py.File(self.fileName, 'a') as h5File:
+            if 'spectra' not in h5File:
+                h5File.create_dataset('spectra', shape=(0, len(spectrum)), maxshape=(None, len(spectrum)),
+                                      chunks=(1, len(spectrum)), dtype=numpy.float64)
+                h5File.create_dataset('keys', shape=(0,), maxshape=(None,), dtype=h5py.special_dtype(vlen=str))
+            spectra, keys = h5File['spectra'], h5File['keys']
+            if spectra.shape[1] != len(spectrum):
+                raise ValueError('HDF5Writer -- Spectrum has %d points, expected %d' % (len(spectrum),
+                                                                                      spectra.shape[1]))
+            count = spectra.shape[0]
+            spectra.resize(count + 1, axis=0)
+            keys.resize(count + 1, axis=0)
+            spectra[count] = spectrum
+            keys[count] = key
+
+
+def outputWriter(fileName):
+    """
+    :param str fileName: Files with extension .h5 or .hdf5 are written as HDF5, all others as SPEC
+
+    :returns: Writer providing the method append(key, spectrum)
+    """
+    if OsPathSplitext(fileName)[1].lower() in ['.h5', '.hdf5']:
+        return HDF5Writer(fileName)
+    return SpecWriter(fileName)
+
+
+class WatchFolderReduction(object):
+    __doc__ = """The :py:class:`WatchFolderReduction` polls a :py:class:`FolderIndex` and reduces every completed file
+    with a pipeline. The resulting spectra are appended to the output file. Files that can not be reduced, e.g. because
+    the detector paused while writing them, are retried by the index. Files that still fail are reported and skipped.
+    Optionally, the spectra are summed up in an :py:class:`RixsTool.Items.AccumulatorItem`."""
+
+    def __init__(self, directory, pipeline, outputFileName, extension='edf', interval=.2, ignoreExisting=False,
+                 accumulate=False, align=False, stablePolls=2, maxRetries=3):
+        """
+        :param str directory: Acquisition folder
+        :param pipeline: Pipeline or list of (name, parameters) pairs, the last stage must produce a spectrum
+        :param str outputFileName: SPEC or HDF5 file, c.f. :py:func:`outputWriter`
+        :param str extension: Extension of the images
+        :param float interval: Time between two polls in seconds
+        :param bool ignoreExisting: Only reduce files that are added after the start
+        :param bool accumulate: Keep the running sum of the spectra in the attribute accumulator
+        :param bool align: Align the spectra on the running mean before they are summed
+        :param int stablePolls: Number of polls a file must not change before it is reduced, c.f. :py:class:`FolderIndex`
+        :param int maxRetries: Number of times a file that can not be reduced is tried again
+        """
+        self.index = FolderIndex(directory, extension, ignoreExisting, stablePolls, maxRetries)
+        self.reduction = BatchReduction(pipeline)
+        self.writer = outputWriter(outputFileName)
+        self.interval = interval
+        self.accumulator = AccumulatorItem('Sum', {}, None, None) if accumulate else None
+        self.align = align
+        self._stopEvent = threading.Event()
+
+    def poll(self):
+        """
+        Reduces the files that were completed since the last poll. A file that can not be reduced is handed back to
+        the index and only reported as failed once it was given up, c.f. :func:`FolderIndex.retry`.
+
+        :returns list: Triples of file name, list of (key, spectrum) pairs and error message (None on success)
+        """
+        resultList = []
+        for fileName in self.index.poll():
+            try:
+                spectra = self.reduction.reduceFile(fileName)
+            except Exception as error:
+                if self.index.retry(fileName):
+                    if DEBUG >= 1:
+                        print("WatchFolderReduction.poll -- Retrying '%s': %s" % (fileName, error))
+                    continue
+                sys.stderr.write("WatchFolderReduction.poll -- Failed to reduce '%s': %s\n" % (fileName, error))
+                resultList += [(fileName, [], str(error))]
+                continue
+            # The file is not retried once its spectra are written, otherwise they would be written twice
+            self.index.done(fileName)
+            try:
+                for key, spectrum in spectra:
+                    self.writer.append(key, spectrum)
+                    if self.accumulator is not None:
+                        self.accumulator.add(spectrum, align=self.align)
+            except Exception as error:
+                sys.stderr.write("WatchFolderReduction.poll -- Failed to write '%s': %s\n" % (fileName, error))
+                resultList += [(fileName, [], str(error))]
+                continue
+            if DEBUG >= 1:
+                print("WatchFolderReduction.poll -- Reduced '%s' (%d spectra)" % (fileName, len(spectra)))
+            resultList += [(fileName, spectra, None)]
+        return resultList
+
+    def run(self, duration=None, callback=None):
+        """
+        :param float duration: Time in seconds after which watching ends (default: None, i.e. until :func:`stop`)
+        :param callback: Called with the result of every poll that reduced at least one file (default: None)
+
+        Polls the folder until stopped.
+        """
+        self._stopEvent.clear()
+        timeStart = time.time()
+        while not self._stopEvent.is_set():
+            pollStart = time.time()
+            resultList = self.poll()
+            if resultList and callback is not None:
+                callback(resultList)
+            if duration is not None and time.time() - timeStart >= duration:
+                break
+            self._stopEvent.wait(max(0., self.interval - (time.time() - pollStart)))
+
+    def stop(self):
+        """
+        Ends :func:`run`, may be called from another thread.
+        """
+        self._stopEvent.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Reduce RIXS images to spectra while they are recorded')
+    parser.add_argument('parameters', help='JSON or YAML file defining the processing stages')
+    parser.add_argument('directory', help='Acquisition folder')
+    parser.add_argument('-o', '--output', default='spectra.spec',
+                        help='SPEC or HDF5 (.h5, .hdf5) file the spectra are appended to (default: spectra.spec)')
+    parser.add_argument('-e', '--extension', default='edf', help='Extension of the images (default: edf)')
+    parser.add_argument('-i', '--interval', type=float, default=.2,
+                        help='Time between two polls of the folder in seconds (default: 0.2)')
+    parser.add_argument('-n', '--new', action='store_true', help='Ignore files present at the start')
+    parser.add_argument('-s', '--sum', default=None,
+                        help='Text file the running sum, mean and standard deviation are written to after every poll')
+    parser.add_argument('-a', '--align', action='store_true', help='Align the spectra before they are summed')
+    args = parser.parse_args(argv)
+
+    watcher = WatchFolderReduction(args.directory, Pipeline.fromFile(args.parameters), args.output,
+                                   args.extension, args.interval, args.new, args.sum is not None, args.align)
+
+    def report(resultList):
+        for fileName, spectra, error in resultList:
+            if error is None:
+                print("Reduced '%s' (%d spectra)" % (fileName, len(spectra)))
+        accumulator = watcher.accumulator
+        if accumulator is not None and accumulator.count:
+            data = numpy.vstack((numpy.arange(len(accumulator.mean())), accumulator.array, accumulator.mean(),
+                                 numpy.sqrt(accumulator.variance()))).T
+            numpy.savetxt(args.sum, data, fmt='%.6f', delimiter=' ',
+                          header='%d spectra\nPixel  Sum  Mean  StdDev' % accumulator.count)
+
+    print("Watching '%s', press Ctrl+C to stop" % args.directory)
+    try:
+        watcher.run(callback=report)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -44,22 +44,24 @@ from PyMca5.PyMcaGui import PyMcaQt as qt
 # IMPORTS FROM RixsTool
 #
 from .widgets.Models import ProjectModel
-from .Items import SpecItem, ScanItem, ImageItem
+from .Items import SpecItem, ScanItem, ImageItem, StackItem, DarkItem
 from .ItemContainer import ItemContainer
 from .UiPaths import UiPaths
+from .Batch import reduceImage
+from .Pipeline import Pipeline
+from .Export import exportSpectra
+from .Operations import darkMap
 
 import numpy
 import platform
-from cStringIO import StringIO
 # from os import linesep as OsLineSep
-from os.path import splitext as OsPathSplitExt
+from os.path import isfile as OsPathIsFile
 
 import logging
 logger = logging.getLogger("mainwindow")
 
 DEBUG = 0
 PLATFORM = platform.system()
-NEWLINE = '\n'  # instead of OsLineSep
 
 
 class RIXSMainWindow(qt.QMainWindow):
@@ -92,6 +94,14 @@ class RIXSMainWindow(qt.QMainWindow):
         #
         self.projectBrowser.showSignal.connect(self._handleShowSignal)
 
+        #
+        # DARK MAPS
+        # Images selected in the project can be averaged to a dark map. The filters refer to dark maps
+        # by their key in the project.
+        #
+        self.projectBrowser.darkSignal.connect(self.createDark)
+        self.imageView.setDarkResolver(self.currentProject.darkOffset)
+
         #
         # SIGNALS FROM
         # Tool windows from RixsTool allow interaction with the displayed data. They can be divided into
@@ -138,48 +148,74 @@ class RIXSMainWindow(qt.QMainWindow):
     def exportingImages(self, itemContainerList):
         # def imageToSpectrum(self, imageItemList):
         logger.debug('ProjectView.exportingImages -- Received %d item' % len(itemContainerList))
-        toolList = self.imageView.toolList
         exportWidget = self.imageView.exportWidget
-        # specContainer = self.currentProject['Spectra']
 
+        #
+        # HERE BE PROCESSING.. Apply filter and alignment to all images. The active tools
+        # form a pipeline that can be passed to the worker processes
+        #
+        pipeline = self.imageView.pipeline() + Pipeline([exportWidget.getStage()])
+
+        itemList = []
+        argumentList = []
         for container in filter(ItemContainer.hasItem, itemContainerList):
             if container in self.currentProject:
                 item = container.item()
-                data = item.array
-
                 logger.debug('ProjectView.exportingImages -- Found it! %s' % container.label)
-                for step in toolList:
-                    #
-                    # HERE BE PROCESSING.. Apply filter and alignment to all images
-                    #
-                    if not step.active():
-                        continue
-                    parameters = step.getValues()
-                    data = step.process(data, parameters)
-
-                #
-                # Build new tree item
-                #
-                result = exportWidget.process(data, {})
-
-                key = item.key()
-                newKey = key.replace('.edf', '.dat')
-
-                newItem = SpecItem(
-                    key=newKey,
-                    header=item.header,
-                    array=result,
-                    fileLocation=''
-                )
-
-                # newContainer = ItemContainer(
-                #    item=newItem,
-                #    parent=specContainer,
-                #    label=None  # is set automatically
-                # )
+                if item.fileLocation and OsPathIsFile(item.fileLocation):
+                    # Let the worker read the image itself
+                    source = (item.key(), item.fileLocation)
+                else:
+                    source = item.array
+                itemList += [item]
+                argumentList += [(source, pipeline)]
 
-                self.currentProject.addItem(newItem)
+        resultList = self.currentProject.executor.map(reduceImage, argumentList)
 
+        #
+        # Build new tree items
+        #
+        newItemList = []
+        for item, result in zip(itemList, resultList):
+            key = item.key()
+            newKey = key.replace('.edf', '.dat')
+
+            newItem = SpecItem(
+                key=newKey,
+                header=item.header,
+                array=result,
+                fileLocation=''
+            )
+            newItemList += [newItem]
+
+        self.currentProject.addItems(newItemList)
+
+    def createDark(self, itemList):
+        """
+        :param list itemList: List of :py:class:`RixsTool.Items.ProjectItem`
+
+        Averages the selected images and stacks to a :py:class:`RixsTool.Items.DarkItem` and adds it to the project.
+        """
+        images = []
+        for item in itemList:
+            if isinstance(item, ImageItem):
+                images += [item.array]
+            elif isinstance(item, StackItem):
+                images += list(item.array)
+        if not images:
+            logger.debug('RIXSMainWindow.createDark -- No images selected')
+            return
+
+        darkItem = DarkItem(
+            key='dark_' + itemList[0].key(),
+            header={},
+            array=darkMap(images),
+            fileLocation='',
+            count=len(images)
+        )
+        self.currentProject.addItem(darkItem)
+        self.imageView.setDarkKeys(self.currentProject.darkKeys())
+
     def handleMaskImageSignal(self, ddict):
         logger.debug("RIXSMainWindow.handleMaskImageSignal -- ddict: %s" % str(ddict))
 
@@ -264,7 +300,7 @@ class RIXSMainWindow(qt.QMainWindow):
         Save routine that writes exports all spectra of the 'Spectra' node in a text file.
         """
         try:
-            (fileNameList, singleFile, comment) = RixsSaveSpectraDialog.\
+            (fileNameList, singleFile, comment, binaryFormat) = RixsSaveSpectraDialog.\
                 getSaveFileName(parent=self,
                                 caption='Save spectra',
                                 directory=str(qt.QDir.home().absolutePath()))
@@ -280,113 +316,32 @@ class RIXSMainWindow(qt.QMainWindow):
         # return
 
         #
-        # Loop through all spectra in the top level of 'Spectra' group
+        # Export all spectra in the top level of 'Spectra' group
         #
         specNode = self.currentProject['Spectra']
-        specString = StringIO()
-        specString.write(NEWLINE)
-
         itemList = [node.item() for node in specNode.children if node.hasItem]
-        for idx, item in enumerate(itemList):
-            #
-            # Determine data shall be written
-            #
-            if isinstance(item, ScanItem):
-                data = numpy.vstack((item.scale(), item.array)).T  # Stack and transpose
-            elif isinstance(item, SpecItem):
-                #
-                # SpecItem does not have a scale, generate one by
-                #
-                scale = numpy.arange(
-                    start=0,
-                    stop=len(item.array),
-                    dtype=item.array.dtype)
-                data = numpy.vstack((scale, item.array)).T  # Stack and transpose
-            else:
-                raise NotImplementedError('RIXSMainWindow.saveSpectra -- Unknown item type: %s' % type(item))
-
-            if data.ndim == 1:
-                nRows, nCols = data.shape[0], 1
-            elif data.ndim == 2:
-                nRows, nCols = data.shape
-            else:
-                raise NotImplementedError('RIXSMainWindow.saveSpectra -- Can write item with dimensionality > 2')
-
-            scanNo = 1
-
-            #
-            # Start to write spec file header...
-            #
-            specString.write('#S %d %s' % (scanNo, item.key()) + NEWLINE)
-
-            #
-            # Write EDF header in #U comments
-            #
-            logger.debug("RIXSMainWindow.saveSpectra -- header: type(header):%s\n'%s'" % (type(item.header),
-                                                                                       item.header))
-            # headerLines = item.header.split('\n')
-            # # Determine order of magnitude
-            # if len(headerLines) > 0 and len(item.header) > 0:
-            #    magnitude = len(str(len(headerLines)))
-            #    for jdx, line in enumerate(headerLines):
-            #        # Format string explanation:
-            #        # #U              -> prefix, indicates header in spec file
-            #        # {idx:0>{width}} -> write value 'idx' in a string with 'width' letters,
-            #        #                    align value of 'idx' on the right and fill the
-            #        #                    remaining space with zeros (i.e. leading zeros)
-            #        # {line}          -> place value 'line' here
-            #        specString.write(
-            #            '#U{idx:0>{width}} {line}'.format(idx=jdx, width=magnitude, line=line) + NEWLINE
-            #        )
-
-            #
-            # .. finish to write spec file header
-            #
-            specString.write('#N %d' % nCols + NEWLINE)  # Number of columns
-            specString.write('#L PixelNo  Counts' + NEWLINE)  # Column labels
-
-            #
-            # Write data using numpy.savetxt, parameter fname can be file handle
-            #
-            numpy.savetxt(
-                fname=specString,
-                X=data,
-                fmt='%.6f',
-                delimiter=' ',
-                newline=NEWLINE
-            )
 
-            specString.write(NEWLINE)
+        progress = qt.QProgressDialog('Saving spectra...', 'Close', 0, len(itemList), self)
+        progress.setCancelButton(None)
+        progress.setWindowModality(qt.Qt.WindowModal)
 
-            if not singleFile:
-                #
-                # File names feature indexation
-                #
-                path, ext = OsPathSplitExt(fileName)
-                numberedPath = '{path}_{idx:0>{width}}{ext}'.format(
-                    path=path,
-                    idx=idx,
-                    width=len(itemList),
-                    ext=ext
-                )
-                with open(numberedPath, 'wb') as fileHandle:
-                    fileHandle.write(specString.getvalue())
+        def updateProgress(count, total):
+            progress.setValue(count)
+            qt.QApplication.processEvents()
 
-                #
-                # Reset StringIO
-                #
-                specString = StringIO()
-
-        if singleFile:
-            with open(fileName, 'wb') as fileHandle:
-                fileHandle.write(specString.getvalue())
+        try:
+            exportSpectra(itemList, fileName, singleFile, binaryFormat, callback=updateProgress)
+        finally:
+            progress.close()
 
         logger.debug('RIXSMainWindow.saveSpectra -- Done!')
 
     def openBandPassTool(self):
+        self.imageView.setDarkKeys(self.currentProject.darkKeys())
         self.imageView.setCurrentFilter('bandpass')
 
     def openBandPassID32Tool(self):
+        self.imageView.setDarkKeys(self.currentProject.darkKeys())
         self.imageView.setCurrentFilter('bandpassID32')
 
     def showProjectView(self):
@@ -415,6 +370,8 @@ class RixsSaveSpectraDialog(qt.QFileDialog):
         self.singleFile = qt.QRadioButton('Save spectra in one single file', self)
         self.individualFiles = qt.QRadioButton('Save spectra in individual files', self)
         self.singleFile.setChecked(True)
+        self.binaryFormat = qt.QComboBox(self)
+        self.binaryFormat.addItems(['No binary copy', 'Binary copy (npz)', 'Binary copy (HDF5)'])
 
         saveOptsBG.addButton(self.individualFiles)
         saveOptsBG.addButton(self.singleFile)
@@ -424,6 +381,7 @@ class RixsSaveSpectraDialog(qt.QFileDialog):
         optsLayout = qt.QGridLayout()
         optsLayout.addWidget(self.individualFiles, 0, 0)
         optsLayout.addWidget(self.singleFile, 1, 0)
+        optsLayout.addWidget(self.binaryFormat, 2, 0)
         saveOptsGB.setLayout(optsLayout)
         mainLayout.addWidget(saveOptsGB, 4, 0, 1, 3)
 
@@ -433,11 +391,13 @@ class RixsSaveSpectraDialog(qt.QFileDialog):
         dial.setAcceptMode(qt.QFileDialog.AcceptSave)
         singleFile = None
         comment = None
+        binaryFormat = None
         fileNameList = []
         if dial.exec_():
             singleFile = dial.singleFile.isChecked()
+            binaryFormat = [None, 'npz', 'hdf5'][dial.binaryFormat.currentIndex()]
             fileNameList = [qt.safe_str(fn) for fn in dial.selectedFiles()]
-        return fileNameList, singleFile, comment
+        return fileNameList, singleFile, comment, binaryFormat
 
 
 class DummyNotifier(qt.QObject):
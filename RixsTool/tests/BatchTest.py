@@ -0,0 +1,102 @@
+#/*##########################################################################
+# Copyright (C) 2014 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# This toolkit is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2 of the License, or (at your option)
+# any later version.
+#
+# PyMca is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyMca; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# PyMca follows the dual licensing model of Riverbank's PyQt and cannot be
+# used as a free plugin for a non-free program.
+#
+# Please contact the ESRF industrial unit (industry@esrf.fr) if this license
+# is a problem for you.
+#############################################################################*/
+__author__ = "Tonn Rueter - ESRF Data Analysis Unit"
+
+import unittest
+import shutil
+import tempfile
+import numpy
+from os import listdir as OsListDir
+from os import makedirs as OsMakeDirs
+from os.path import join as OsPathJoin
+
+from PyMca5.PyMcaIO import EdfFile
+
+from RixsTool.Batch import main
+from RixsTool.Operations import Filter
+from RixsTool.Pipeline import Pipeline
+
+
+class testBatchReduction(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.inputDirectory = OsPathJoin(self.directory, 'input')
+        self.outputDirectory = OsPathJoin(self.directory, 'output')
+        OsMakeDirs(self.inputDirectory)
+        random = numpy.random.RandomState(0)
+        self.images = {}
+        for idx in range(3):
+            image = random.normal(100., 20., size=(40, 50)).astype(numpy.float32)
+            edf = EdfFile.EdfFile(OsPathJoin(self.inputDirectory, 'image%d.edf' % idx), 'wb')
+            edf.WriteImage({}, image)
+            del edf
+            self.images['image%d' % idx] = image
+        self.filterParams = {'low': 20., 'high': 150., 'offset': 10.}
+        self.parameterFile = OsPathJoin(self.directory, 'parameters.json')
+        Pipeline([('bandpass', self.filterParams), ('axisSum', {'axis': 1})]).save(self.parameterFile)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def checkOutput(self):
+        self.assertEqual(sorted(OsListDir(self.outputDirectory)), ['%s.dat' % key for key in sorted(self.images)])
+        for key, image in self.images.items():
+            expected = Filter.bandPassFilter(image, dict(self.filterParams)).sum(axis=1)
+            data = numpy.loadtxt(OsPathJoin(self.outputDirectory, '%s.dat' % key))
+            self.assertTrue(numpy.array_equal(data[:, 0], numpy.arange(len(expected))))
+            self.assertTrue(numpy.allclose(data[:, 1], expected, atol=1e-5))
+
+    def testRun(self):
+        status = main([self.parameterFile, self.inputDirectory, '-o', self.outputDirectory, '-p', '1'])
+        self.assertEqual(status, 0)
+        self.checkOutput()
+
+    def testParallelRunWithDefectiveFile(self):
+        # A file that can not be read is reported, the others are reduced
+        with open(OsPathJoin(self.inputDirectory, 'defective.edf'), 'wb') as fileHandle:
+            fileHandle.write(b'no EDF header')
+        status = main([self.parameterFile, self.inputDirectory, '-o', self.outputDirectory, '-p', '2'])
+        self.assertEqual(status, 1)
+        self.checkOutput()
+
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(unittest.TestLoader().loadTestsFromTestCase(testBatchReduction))
+    else:
+        # use a predefined order
+        testSuite.addTest(testBatchReduction('testRun'))
+        testSuite.addTest(testBatchReduction('testParallelRunWithDefectiveFile'))
+    return testSuite
+
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
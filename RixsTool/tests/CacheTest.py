@@ -0,0 +1,122 @@
+#/*##########################################################################
+# Copyright (C) 2014 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# This toolkit is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2 of the License, or (at your option)
+# any later version.
+#
+# PyMca is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyMca; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# PyMca follows the dual licensing model of Riverbank's PyQt and cannot be
+# used as a free plugin for a non-free program.
+#
+# Please contact the ESRF industrial unit (industry@esrf.fr) if this license
+# is a problem for you.
+#############################################################################*/
+__author__ = "Tonn Rueter - ESRF Data Analysis Unit"
+import unittest
+import shutil
+import tempfile
+import numpy
+from os import makedirs as OsMakeDirs
+from os.path import join as OsPathJoin
+
+from PyMca5.PyMcaIO import EdfFile
+
+from RixsTool.Cache import FileCache
+from RixsTool.Project import RixsProject
+
+
+class testFileCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.imageDirectory = OsPathJoin(self.directory, 'images')
+        OsMakeDirs(self.imageDirectory)
+        self.images = []
+        for idx in range(5):
+            image = numpy.arange(64 * 32, dtype=numpy.float32).reshape(64, 32) + idx
+            edf = EdfFile.EdfFile(OsPathJoin(self.imageDirectory, 'image%d.edf' % idx), 'wb')
+            edf.WriteImage({}, image)
+            del edf
+            self.images += [image]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def crawl(self):
+        project = RixsProject()
+        project.fileCache = FileCache(OsPathJoin(self.directory, 'cache'))
+        errorList = project.crawl(self.imageDirectory)
+        self.assertEqual(errorList, [])
+        return [container.item() for container in project['Images'].children]
+
+    def testCrawlKeepsItemsUnloaded(self):
+        # First crawl stores the files in the cache, the second one reads them from it
+        for run in ['store', 'read']:
+            itemList = self.crawl()
+            self.assertEqual(len(itemList), len(self.images))
+            for item in itemList:
+                self.assertTrue(item.loader() is not None,
+                                "Item '%s' has no loader after crawl (%s)" % (item.key(), run))
+                self.assertTrue(item._array is None,
+                                "Item '%s' was loaded by crawl (%s)" % (item.key(), run))
+
+    def testCachedData(self):
+        self.crawl()
+        itemList = self.crawl()
+        arrays = sorted([item.array for item in itemList], key=lambda array: array[0, 0])
+        for array, image in zip(arrays, self.images):
+            self.assertTrue(numpy.array_equal(array, image))
+
+    def testEviction(self):
+        project = RixsProject()
+        project.fileCache = cache = FileCache(OsPathJoin(self.directory, 'cache'))
+        fileNameList = [OsPathJoin(self.imageDirectory, 'image%d.edf' % idx) for idx in range(len(self.images))]
+        project.read(fileNameList[0])
+        entrySize = cache.size()
+        cache.maxSize = int(2.5 * entrySize)
+
+        # Reading does not scan the cache directory unless a new entry exceeds the maximum size
+        scans = []
+        entries = cache._entries
+        cache._entries = lambda: scans.append(1) or entries()
+        project.read(fileNameList[0])
+        project.read(fileNameList[1])
+        self.assertEqual(scans, [])
+        project.read(fileNameList[2])
+        self.assertEqual(len(scans), 1)
+        for fileName in fileNameList[3:]:
+            project.read(fileName)
+            self.assertTrue(0 < sum(size for entry, size, lastUse in entries()) <= cache.maxSize)
+        self.assertEqual(cache._size, cache.size())
+        self.assertTrue(cache.get(fileNameList[-1]) is not None)
+
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(unittest.TestLoader().loadTestsFromTestCase(testFileCache))
+    else:
+        # use a predefined order
+        testSuite.addTest(testFileCache('testCrawlKeepsItemsUnloaded'))
+        testSuite.addTest(testFileCache('testCachedData'))
+        testSuite.addTest(testFileCache('testEviction'))
+    return testSuite
+
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,137 @@
+#/*##########################################################################
+# Copyright (C) 2014 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# This toolkit is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2 of the License, or (at your option)
+# any later version.
+#
+# PyMca is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyMca; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# PyMca follows the dual licensing model of Riverbank's PyQt and cannot be
+# used as a free plugin for a non-free program.
+#
+# Please contact the ESRF industrial unit (industry@esrf.fr) if this license
+# is a problem for you.
+#############################################################################*/
+__author__ = "Tonn Rueter - ESRF Data Analysis Unit"
+
+import unittest
+import shutil
+import tempfile
+import numpy
+from os.path import join as OsPathJoin
+
+from RixsTool.Items import SpecItem, ScanItem
+from RixsTool.Export import exportSpectra, h5py
+
+
+class testExport(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        random = numpy.random.RandomState(0)
+        self.itemList = []
+        for idx in range(3):
+            item = SpecItem('spec%d' % idx, {}, random.normal(100., 20., 10 + idx), '')
+            self.itemList += [item]
+        item = ScanItem('scan', {}, random.normal(100., 20., 10), '')
+        item.setScale(numpy.linspace(900., 910., 10))
+        self.itemList += [item]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def columns(self, item):
+        scale = item.scale() if isinstance(item, ScanItem) else numpy.arange(len(item.array), dtype=numpy.float64)
+        return scale, item.array
+
+    def expectedScan(self, scanNumber, item):
+        # Data rows as written by numpy.savetxt
+        scale, counts = self.columns(item)
+        rows = tempfile.TemporaryFile()
+        try:
+            numpy.savetxt(rows, numpy.column_stack((scale, counts)), fmt='%.6f')
+            rows.seek(0)
+            data = rows.read()
+        finally:
+            rows.close()
+        return ('#S %d %s\n#N 2\n#L PixelNo  Counts\n' % (scanNumber, item.key())).encode('utf-8') + data + b'\n'
+
+    def testSpec(self):
+        fileName = OsPathJoin(self.directory, 'spectra.dat')
+        self.assertEqual(exportSpectra(self.itemList, fileName), [fileName])
+        expected = b'\n' + b''.join([self.expectedScan(idx + 1, item) for idx, item in enumerate(self.itemList)])
+        with open(fileName, 'rb') as fileHandle:
+            self.assertEqual(fileHandle.read(), expected)
+
+        # One file per spectrum
+        progress = []
+        fileNameList = exportSpectra(self.itemList, fileName, singleFile=False,
+                                     callback=lambda count, total: progress.append((count, total)))
+        self.assertEqual(len(fileNameList), len(self.itemList))
+        self.assertEqual(progress, [(idx + 1, len(self.itemList)) for idx in range(len(self.itemList))])
+        for numberedName, item in zip(fileNameList, self.itemList):
+            with open(numberedName, 'rb') as fileHandle:
+                self.assertEqual(fileHandle.read(), b'\n' + self.expectedScan(1, item))
+
+    def testNpz(self):
+        fileName = OsPathJoin(self.directory, 'spectra.dat')
+        fileNameList = exportSpectra(self.itemList, fileName, binaryFormat='npz')
+        self.assertEqual(fileNameList, [fileName, OsPathJoin(self.directory, 'spectra.npz')])
+        archive = numpy.load(fileNameList[1])
+        try:
+            self.assertEqual(list(archive['keys']), [item.key() for item in self.itemList])
+            for idx, item in enumerate(self.itemList):
+                scale, counts = self.columns(item)
+                self.assertTrue(numpy.array_equal(archive['scale%d' % idx], scale))
+                self.assertTrue(numpy.array_equal(archive['counts%d' % idx], counts))
+        finally:
+            archive.close()
+
+    @unittest.skipIf(h5py is None, 'h5py is not available')
+    def testHDF5(self):
+        fileName = OsPathJoin(self.directory, 'spectra.dat')
+        fileNameList = exportSpectra(self.itemList, fileName, binaryFormat='hdf5')
+        self.assertEqual(fileNameList, [fileName, OsPathJoin(self.directory, 'spectra.h5')])
+        with h5py.File(fileNameList[1], 'r') as h5File:
+            self.assertEqual(len(h5File), len(self.itemList))
+            for idx, item in enumerate(self.itemList):
+                group = h5File['%05d' % idx]
+                scale, counts = self.columns(item)
+                self.assertEqual(group.attrs['key'], item.key())
+                self.assertTrue(numpy.array_equal(group['scale'][()], scale))
+                self.assertTrue(numpy.array_equal(group['counts'][()], counts))
+
+    def testUnknownFormat(self):
+        fileName = OsPathJoin(self.directory, 'spectra.dat')
+        self.assertRaises(ValueError, exportSpectra, self.itemList, fileName, binaryFormat='mat')
+
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(unittest.TestLoader().loadTestsFromTestCase(testExport))
+    else:
+        # use a predefined order
+        testSuite.addTest(testExport('testSpec'))
+        testSuite.addTest(testExport('testNpz'))
+        testSuite.addTest(testExport('testHDF5'))
+        testSuite.addTest(testExport('testUnknownFormat'))
+    return testSuite
+
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
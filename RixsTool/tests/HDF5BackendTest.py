@@ -0,0 +1,113 @@
+#/*##########################################################################
+# Copyright (C) 2014 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# This toolkit is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2 of the License, or (at your option)
+# any later version.
+#
+# PyMca is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyMca; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# PyMca follows the dual licensing model of Riverbank's PyQt and cannot be
+# used as a free plugin for a non-free program.
+#
+# Please contact the ESRF industrial unit (industry@esrf.fr) if this license
+# is a problem for you.
+#############################################################################*/
+__author__ = "Tonn Rueter - ESRF Data Analysis Unit"
+
+import unittest
+import shutil
+import tempfile
+import numpy
+from os.path import join as OsPathJoin
+
+from RixsTool.Items import SpecItem, ScanItem, ImageItem, StackItem, DarkItem
+from RixsTool.Project import RixsProject
+from RixsTool.HDF5Backend import h5py
+
+
+@unittest.skipIf(h5py is None, 'h5py is not available')
+class testHDF5Backend(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fileName = OsPathJoin(self.directory, 'project.h5')
+        random = numpy.random.RandomState(0)
+
+        self.project = RixsProject()
+        scan = ScanItem('scan', {'title': 'scan'}, random.normal(100., 20., 10), '')
+        scan.setScale(numpy.linspace(900., 910., 10))
+        self.project.addItems([
+            SpecItem('spec', {}, random.normal(100., 20., 10), ''),
+            scan,
+            ImageItem('image', {}, random.normal(100., 20., (4, 5)), ''),
+            StackItem('stack', {}, random.normal(100., 20., (2, 4, 5)), ''),
+            DarkItem('dark', {}, random.normal(100., 20., 4), '', mode='row', count=3)
+        ])
+        self.project.addGroup('Results')
+        self.project.save(self.fileName)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def keys(self, project):
+        return sorted(project.getIdDict().keys())
+
+    def testRoundTrip(self):
+        project = RixsProject()
+        itemList = project.load(self.fileName)
+        self.assertEqual(len(itemList), 5)
+        self.assertEqual(self.keys(project), self.keys(self.project))
+        for key in ['spec', 'scan', 'image', 'stack', 'dark']:
+            item, loaded = self.project[key].item(), project[key].item()
+            self.assertEqual(type(loaded), type(item))
+            self.assertTrue(numpy.array_equal(loaded.array, item.array))
+        self.assertEqual(project['scan'].item().header, {'title': 'scan'})
+        self.assertTrue(numpy.array_equal(project['scan'].item().scale(), self.project['scan'].item().scale()))
+        dark = project['dark'].item()
+        self.assertEqual((dark.mode, dark.count), ('row', 3))
+        self.assertFalse(project['Results'].hasItem())
+
+    def testDuplicateKey(self):
+        # Loading fails before the project is changed
+        project = RixsProject()
+        project.addItem(ImageItem('stack', {}, numpy.zeros((4, 5)), ''))
+        keys = self.keys(project)
+        self.assertRaises(ValueError, project.load, self.fileName)
+        self.assertEqual(self.keys(project), keys)
+        self.assertNotIn('Results', project)
+
+        # A group label must not be used by an item
+        project = RixsProject()
+        project.addItem(SpecItem('Results', {}, numpy.zeros(10), ''))
+        keys = self.keys(project)
+        self.assertRaises(ValueError, project.load, self.fileName)
+        self.assertEqual(self.keys(project), keys)
+
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(unittest.TestLoader().loadTestsFromTestCase(testHDF5Backend))
+    else:
+        # use a predefined order
+        testSuite.addTest(testHDF5Backend('testRoundTrip'))
+        testSuite.addTest(testHDF5Backend('testDuplicateKey'))
+    return testSuite
+
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
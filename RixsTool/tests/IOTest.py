@@ -0,0 +1,154 @@
+#/*##########################################################################
+# Copyright (C) 2014 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# This toolkit is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2 of the License, or (at your option)
+# any later version.
+#
+# PyMca is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyMca; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# PyMca follows the dual licensing model of Riverbank's PyQt and cannot be
+# used as a free plugin for a non-free program.
+#
+# Please contact the ESRF industrial unit (industry@esrf.fr) if this license
+# is a problem for you.
+#############################################################################*/
+__author__ = "Tonn Rueter - ESRF Data Analysis Unit"
+import unittest
+import shutil
+import pickle
+import tempfile
+import numpy
+from os.path import join as OsPathJoin
+
+from PyMca5.PyMcaIO import EdfFile
+
+from RixsTool.IO import RawReader, EdfReader
+from RixsTool.Items import ImageItem, StackItem
+
+
+class testRawReader(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def itemize(self, content):
+        fileName = OsPathJoin(self.directory, 'spectrum.dat')
+        with open(fileName, 'w') as fileHandle:
+            fileHandle.write(content)
+        return RawReader().itemize(fileName)
+
+    def testColumns(self):
+        itemList = self.itemize('# Comment\n0 1. 10\n1 2. 20  # Comment\n\n2 3. 30\n')
+        self.assertEqual(len(itemList), 1)
+        item = itemList[0]
+        self.assertTrue(numpy.array_equal(item.scale(), [0., 1., 2.]))
+        self.assertTrue(numpy.array_equal(item.array, [1., 2., 3.]))
+        self.assertEqual(item.columns().shape, (2, 3))
+
+    def testRaggedRows(self):
+        # Total number of values is a multiple of the number of columns in both cases
+        for content in ['0 1 2\n3 4 5\n6 7\n8\n', '0 1 2\n3 4\n5 6 7 8\n']:
+            with self.assertRaises(ValueError):
+                self.itemize(content)
+
+    def testNonNumeric(self):
+        with self.assertRaises(ValueError):
+            self.itemize('0 1\n2 a\n')
+
+
+class testEdfReader(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        random = numpy.random.RandomState(0)
+        self.images = [random.normal(100., 20., size=(40, 50)).astype(numpy.float32) for idx in range(3)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write(self, name, images, headers=None, byteOrder=''):
+        fileName = OsPathJoin(self.directory, name)
+        edf = EdfFile.EdfFile(fileName, 'wb')
+        for idx, image in enumerate(images):
+            edf.WriteImage(headers[idx] if headers else {}, image, ByteOrder=byteOrder)
+        del edf
+        return fileName
+
+    def testImage(self):
+        for byteOrder in ['LowByteFirst', 'HighByteFirst']:
+            fileName = self.write('%s.edf' % byteOrder, self.images[:1], byteOrder=byteOrder)
+            itemList = EdfReader().itemize(fileName)
+            self.assertEqual(len(itemList), 1)
+            item = itemList[0]
+            self.assertTrue(isinstance(item, ImageItem))
+            # Pixel data is read on access, in native byte order
+            self.assertTrue(item._array is None)
+            self.assertEqual(item.shape(), (40, 50))
+            self.assertTrue(item.dtype().isnative)
+            self.assertTrue(numpy.array_equal(item.array, self.images[0]))
+            self.assertTrue(numpy.array_equal(item.array, EdfFile.EdfFile(fileName, 'rb').GetData(0)))
+
+            # Loaders are passed to worker processes
+            loader = pickle.loads(pickle.dumps(item.loader()))
+            self.assertTrue(numpy.array_equal(loader(), self.images[0]))
+
+    def testStack(self):
+        # Evenly spaced images are mapped as a single strided view, otherwise the images are copied
+        longHeader = dict(('Key%d' % idx, 64 * 'x') for idx in range(32))
+        headers = [{}, longHeader, {}]
+        for name, headerList in [('even.edf', None), ('uneven.edf', headers)]:
+            fileName = self.write(name, self.images, headerList)
+            itemList = EdfReader().itemize(fileName)
+            self.assertEqual(len(itemList), 1)
+            item = itemList[0]
+            self.assertTrue(isinstance(item, StackItem))
+            self.assertTrue(item._array is None)
+            self.assertEqual(item.shape(), (3, 40, 50))
+            offsets = [frameMap.offset for frameMap in item.loader().frameMaps]
+            self.assertEqual(len(set(numpy.diff(offsets))), 1 if headerList is None else 2)
+
+            # Single images are read without loading the stack
+            for idx, image in enumerate(self.images):
+                self.assertTrue(numpy.array_equal(item.frame(idx), image))
+            self.assertTrue(item._array is None)
+            for frame, image in zip(item.frames(), self.images):
+                self.assertTrue(numpy.array_equal(frame, image))
+            self.assertTrue(numpy.array_equal(item.array, numpy.array(self.images)))
+
+            loader = pickle.loads(pickle.dumps(item.loader()))
+            self.assertTrue(numpy.array_equal(loader(), numpy.array(self.images)))
+
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(unittest.TestLoader().loadTestsFromTestCase(testRawReader))
+        testSuite.addTest(unittest.TestLoader().loadTestsFromTestCase(testEdfReader))
+    else:
+        # use a predefined order
+        testSuite.addTest(testRawReader('testColumns'))
+        testSuite.addTest(testRawReader('testRaggedRows'))
+        testSuite.addTest(testRawReader('testNonNumeric'))
+        testSuite.addTest(testEdfReader('testImage'))
+        testSuite.addTest(testEdfReader('testStack'))
+    return testSuite
+
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,385 @@
+#/*##########################################################################
+# Copyright (C) 2014 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# This toolkit is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2 of the License, or (at your option)
+# any later version.
+#
+# PyMca is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyMca; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# PyMca follows the dual licensing model of Riverbank's PyQt and cannot be
+# used as a free plugin for a non-free program.
+#
+# Please contact the ESRF industrial unit (industry@esrf.fr) if this license
+# is a problem for you.
+#############################################################################*/
+__author__ = "Tonn Rueter - ESRF Data Analysis Unit"
+import unittest
+import numpy
+
+# Numeric routines from PyMca, used by the reference implementations
+from PyMca5.PyMca.Gefit import LeastSquaresFit as LSF
+from PyMca5.PyMca.SpecfitFuns import gauss as gaussianModel
+from PyMca5.PyMca import SNIPModule as SNIP
+
+from RixsTool.Operations import Normalization, Filter, Manipulation, Alignment, Integration, SlopeCorrection, \
+    darkMap
+from RixsTool.Items import DarkItem
+from RixsTool.Project import RixsProject
+from RixsTool.Pipeline import Pipeline
+
+
+#
+# Reference implementations: the per curve loops that the vectorized operations replaced
+#
+def fftAlignmentReference(curves, portion=.8, idx0=0, minChannel=0, maxChannel=-1):
+    if maxChannel < 0:
+        maxChannel = curves.shape[1] - 1
+    window = numpy.arange(minChannel, maxChannel)
+    fft0 = numpy.fft.fft(curves[idx0][window])
+    shiftList = len(curves) * [float('NaN')]
+    for idx, y in enumerate(curves):
+        shiftTmp = numpy.fft.ifft(fft0 * numpy.fft.fft(y[window]).conjugate()).real
+        m = shiftTmp.size // 2
+        shiftPhase = numpy.zeros(shiftTmp.shape)
+        shiftPhase[m:] = shiftTmp[:-m]
+        shiftPhase[:m] = shiftTmp[-m:]
+        normFactor = shiftPhase.max() - shiftPhase.min()
+        if normFactor <= 0.:
+            continue
+        shiftPhase = (shiftPhase - shiftPhase.min()) / normFactor
+        left = right = shiftPhase.argmax()
+        while shiftPhase[left] >= portion and left > 0:
+            left -= 1
+        while shiftPhase[right] >= portion and right < len(shiftPhase) - 1:
+            right += 1
+        mask = numpy.arange(left, right + 1)
+        shiftList[idx] = numpy.sum(shiftPhase[mask] * mask / shiftPhase[mask].sum()) - m
+    return numpy.array(shiftList)
+
+
+def bandPassReference(image, low=None, high=None, offset=0., replace=0.):
+    low = image.min() if low is None else low
+    high = image.max() if high is None else high
+    out = image.astype(type(offset)) - offset
+    out = numpy.where(low <= out, out, replace)
+    return numpy.where(out <= high, out, replace)
+
+
+def bandPassID32Reference(image, energy=931.942, binning=4, preset=300):
+    detectorEfficiency = energy * 0.24801587301587297
+    offset = numpy.mean(image[:100, :]) + 1 + preset * 0.00016
+    return bandPassReference(image, detectorEfficiency * 0.035, detectorEfficiency * binning * .9, offset, 0)
+
+
+def smileReference(image, a, b, c):
+    # Line by line skew with oversampling two on the 2048 point grid of the detector
+    shifts = a * numpy.arange(len(image)) ** 2 + b * numpy.arange(len(image)) + c
+    interpRange = numpy.linspace(0, 2047, 2 * image.shape[1])
+    result = numpy.array([numpy.interp(interpRange - shift, numpy.arange(image.shape[1]), line,
+                                       left=float('NaN'), right=float('NaN')) for line, shift in zip(image, shifts)])
+    return numpy.nan_to_num(result / 2.)
+
+
+def fitAlignmentReference(curves, snipWidth):
+    curves = numpy.float64(curves)
+    subtracted = curves - numpy.array([SNIP.getSnip1DBackground(curve, snipWidth) for curve in curves])
+    normalized = Normalization.zeroToOne(subtracted, {})['image']
+    positions = []
+    for idx, y in enumerate(subtracted):
+        peakIdx = y.argmax()
+        fwhmIdx = numpy.nonzero(y >= .5 * normalized[idx])[0]
+        mask = numpy.nonzero(y >= .1 * normalized[idx])[0]
+        ydata = curves[idx, mask]
+        estimates = [y[peakIdx] + curves[idx].min(), float(peakIdx), float(fwhmIdx.max() - fwhmIdx.min())]
+        fitp, chisq, sigma = LSF(gaussianModel, numpy.asarray(estimates), xdata=mask, ydata=ydata - ydata.min())
+        positions += [fitp[1]]
+    return positions[0] - numpy.array(positions)
+
+
+def centerOfMassReference(curves, portion=.8, idx0=0):
+    def trapz(y):
+        return y.sum() - .5 * (y[0] + y[-1])
+
+    centroids = []
+    for y in numpy.float64(curves):
+        if y.max() <= y.min():
+            centroids += [float('NaN')]
+            continue
+        ynormed = (y - y.min()) / (y.max() - y.min())
+        left = right = ynormed.argmax()
+        while left >= 0 and ynormed[left] > portion:
+            left -= 1
+        while right < len(y) and ynormed[right] > portion:
+            right += 1
+        if left < 0 or right >= len(y):
+            centroids += [float('NaN')]
+            continue
+        mask = numpy.arange(left, right + 1)
+        centroids += [trapz(ynormed[mask] * mask) / trapz(ynormed[mask])]
+    return centroids[idx0] - numpy.array(centroids)
+
+
+def sliceAndSumReference(image, binWidth=8, sliceAxis=1, mode='strict'):
+    curves = image if sliceAxis == 0 else image.T
+    stop = len(curves) if mode == 'relaxed' else len(curves) - len(curves) % binWidth
+    result = numpy.array([curves[start:start + binWidth].sum(axis=0) for start in range(0, stop, binWidth)],
+                         dtype=image.dtype).reshape(-1, curves.shape[1])
+    return result if sliceAxis == 0 else result.T
+
+
+class testOperations(unittest.TestCase):
+    def setUp(self):
+        self.random = numpy.random.RandomState(0)
+        self.stack = self.random.normal(100., 20., size=(3, 40, 50))
+        self.stack[1] += 50.
+
+        # Gaussian peak in every row, shifted from row to row
+        x = numpy.arange(50.)
+        self.centers = 25. + self.random.uniform(-4., 4., size=(40, 1))
+        self.peaks = 1000. * numpy.exp(-(x - self.centers) ** 2 / 18.) + self.random.normal(0., 5., size=(40, 50))
+
+    def assertStackEqualsImages(self, function, params, exact=True):
+        # Processing a stack has to give the same result as processing its images one after the other. Transforms
+        # of differently laid out arrays may differ by rounding errors (exact=False)
+        result = function(self.stack, dict(params))
+        for image, imageResult in zip(self.stack, result):
+            expected = function(image, dict(params))
+            if exact:
+                self.assertTrue(numpy.array_equal(imageResult, expected))
+            else:
+                self.assertTrue(numpy.allclose(imageResult, expected, rtol=1e-12, atol=1e-12))
+
+    def testZeroToOne(self):
+        zeroToOne = lambda data, params: Normalization.zeroToOne(data, params)['image']
+        for data in [self.stack[0, 0], self.stack[0]]:
+            expected = (data - data.min()) / (data.max() - data.min())
+            self.assertTrue(numpy.array_equal(zeroToOne(data, {}), expected))
+        self.assertTrue(numpy.array_equal(zeroToOne(numpy.ones(10), {}), numpy.zeros(10)))
+        self.assertStackEqualsImages(zeroToOne, {})
+
+    def testFFTAlignment(self):
+        for params in [{}, {'portion': .5, 'idx0': 3}, {'minChannel': 5, 'maxChannel': 45}]:
+            # Curves along the rows and along the columns
+            result = Alignment.fftAlignment(self.peaks, dict(params, axis=0))
+            expected = fftAlignmentReference(self.peaks, **params)
+            self.assertTrue(numpy.allclose(result, expected, equal_nan=True))
+            result = Alignment.fftAlignment(self.peaks.T, dict(params, axis=1))
+            self.assertTrue(numpy.allclose(result, expected, equal_nan=True))
+        # The shifts follow the peaks
+        shifts = Alignment.fftAlignment(self.peaks, {'axis': 0})
+        self.assertTrue(numpy.allclose(shifts, self.centers[0] - self.centers.ravel(), atol=.5))
+        # Empty curves have no shift
+        self.assertTrue(numpy.all(numpy.isnan(Alignment.fftAlignment(numpy.zeros((4, 50)), {'axis': 0}))))
+
+    def testMaxAlignment(self):
+        # Integer shifts as found curve by curve
+        for idx0 in [0, 3]:
+            expected = numpy.array([self.peaks[idx0].argmax() - curve.argmax() for curve in self.peaks])
+            result = Alignment.maxAlignment(self.peaks, {'axis': 0, 'idx0': idx0})
+            self.assertTrue(numpy.array_equal(result, expected))
+            result = Alignment.maxAlignment(self.peaks.T, {'axis': 1, 'idx0': idx0})
+            self.assertTrue(numpy.array_equal(result, expected))
+
+        # Sub-pixel interpolation is exact for noise free gaussian and parabolic peaks
+        x = numpy.arange(50.)
+        shifts = self.centers[0] - self.centers.ravel()
+        gaussians = numpy.exp(-(x - self.centers) ** 2 / 18.)
+        parabolas = numpy.maximum(100. - (x - self.centers) ** 2, 0.)
+        for interpolation, peaks in [('gaussian', gaussians), ('parabolic', parabolas)]:
+            result = Alignment.maxAlignment(peaks, {'axis': 0, 'interpolation': interpolation})
+            self.assertTrue(numpy.allclose(result, shifts))
+        self.assertRaises(ValueError, Alignment.maxAlignment, self.peaks, {'axis': 0, 'interpolation': 'cubic'})
+
+    def testCenterOfMassAlignment(self):
+        # Constant curves and peaks at the curve ends have no shift
+        peaks = numpy.array(self.peaks)
+        peaks[5] = 1.
+        peaks[6, -3:] = 5000.
+        for params in [{}, {'portion': .5, 'idx0': 3}]:
+            result = Alignment.centerOfMassAlignment(peaks, dict(params, axis=0))
+            expected = centerOfMassReference(peaks, **params)
+            self.assertTrue(numpy.allclose(result, expected, equal_nan=True))
+            self.assertTrue(numpy.allclose(Alignment.centerOfMassAlignment(peaks.T, dict(params, axis=1)), result,
+                                           equal_nan=True))
+        self.assertTrue(numpy.all(numpy.isnan(result[5:7])))
+        self.assertEqual(numpy.count_nonzero(numpy.isfinite(result)), len(result) - 2)
+        self.assertRaises(ZeroDivisionError, Alignment.centerOfMassAlignment, peaks, {'axis': 0, 'idx0': 5})
+        self.assertRaises(IndexError, Alignment.centerOfMassAlignment, peaks, {'axis': 0, 'idx0': 6})
+
+    def testFitAlignment(self):
+        shifts = self.centers[0] - self.centers.ravel()
+        result = Alignment.fitAlignment(self.peaks, {'axis': 0})
+        self.assertTrue(numpy.allclose(result, shifts, atol=.1))
+        self.assertTrue(numpy.allclose(Alignment.fitAlignment(self.peaks.T, {'axis': 1}), result))
+
+        # The fits of single curves can end in a local minimum, compare the curves where they converged
+        expected = fitAlignmentReference(self.peaks, snipWidth=5)
+        converged = numpy.abs(expected - shifts) < .1
+        self.assertTrue(numpy.count_nonzero(converged) > 30)
+        self.assertTrue(numpy.allclose(result[converged], expected[converged], atol=1e-3))
+
+    def testSnip(self):
+        # Identical to SNIP applied to every curve, with and without smoothing
+        image = self.peaks + 100. + numpy.linspace(0., 50., 50)
+        for params in [{}, {'width': 3}, {'width': 12, 'smoothing': 3}, {'smoothing': 0}]:
+            width, smoothing = params.get('width', 5), params.get('smoothing', 1)
+            background = numpy.array([SNIP.getSnip1DBackground(curve, width, smoothing=smoothing) for curve in image])
+            self.assertTrue(numpy.allclose(Filter.snip(image, dict(params, background=True)), background))
+            self.assertTrue(numpy.allclose(Filter.snip(image, dict(params)), image - background))
+            self.assertTrue(numpy.allclose(Filter.snip(image.T, dict(params, axis=0, background=True)), background.T))
+        self.assertStackEqualsImages(Filter.snip, {'width': 4})
+
+    def testSliceAndSum(self):
+        images = [self.stack[0], self.random.randint(0, 1000, size=(40, 50)).astype(numpy.int32)]
+        for image in images:
+            for binWidth in [1, 7, 8, 50]:
+                for sliceAxis in [0, 1]:
+                    for mode in ['strict', 'relaxed']:
+                        params = {'binWidth': binWidth, 'sliceAxis': sliceAxis, 'sumAxis': sliceAxis, 'mode': mode}
+                        result = Integration.sliceAndSum(image, dict(params))
+                        expected = sliceAndSumReference(image, binWidth, sliceAxis, mode)
+                        self.assertEqual(result.dtype, image.dtype)
+                        self.assertEqual(result.shape, expected.shape)
+                        self.assertTrue(numpy.allclose(result, expected))
+        self.assertRaises(ValueError, Integration.sliceAndSum, self.stack[0], {'mode': 'loose'})
+        self.assertRaises(ValueError, Integration.sliceAndSum, self.stack[0], {'sliceAxis': 0, 'sumAxis': 1})
+
+    def skewReference(self, image, shiftArray, oversampling=1):
+        # Line by line interpolation on a grid spanning the full length of the lines
+        nPoints = image.shape[1]
+        interpRange = numpy.linspace(0, nPoints - 1, oversampling * nPoints)
+        return numpy.array([numpy.interp(interpRange - shift, numpy.arange(nPoints), line, left=0., right=0.)
+                            for line, shift in zip(image, shiftArray)]) / oversampling
+
+    def testBandPassFilter(self):
+        # Images larger than a block of rows
+        image = self.random.normal(500., 200., size=(300, 400))
+        counts = self.random.randint(0, 1000, size=(300, 400)).astype(numpy.uint16)
+        for data, params in [(image, {}),
+                             (image, {'low': 100., 'high': 800., 'offset': 114.}),
+                             (image.astype(numpy.float32), {'low': 100., 'high': 800., 'replace': -1.}),
+                             (counts, {'low': 10, 'high': 600, 'offset': 50}),
+                             (counts, {'low': 10, 'high': 600, 'offset': 50, 'replace': 0}),
+                             (counts, {'low': 10., 'high': 600., 'offset': 50.})]:
+            result = Filter.bandPassFilter(data, dict(params))
+            expected = bandPassReference(data, **params)
+            self.assertEqual(result.dtype, expected.dtype)
+            self.assertTrue(numpy.array_equal(result, expected))
+
+        # Filtering in place
+        params = {'low': 100., 'high': 800., 'offset': 114.}
+        expected = bandPassReference(image, **params)
+        self.assertTrue(Filter.bandPassFilter(image, dict(params, out=image)) is image)
+        self.assertTrue(numpy.array_equal(image, expected))
+
+        for params in [{}, {'energy': 530., 'binning': 2, 'preset': 60}]:
+            self.assertTrue(numpy.array_equal(Filter.bandPassFilterID32(counts, dict(params)),
+                                              bandPassID32Reference(counts, **params)))
+
+    def testSkewAlongAxis(self):
+        image = self.stack[0]
+        shiftArray = numpy.linspace(-3., 3., image.shape[0])
+        skew = lambda data, params: Manipulation.skewAlongAxis(data, dict(params, shiftArray=shiftArray))
+
+        # The grid has as many points as the lines, not the 2048 of the detector
+        for oversampling in [1, 2]:
+            result = skew(image, {'oversampling': oversampling})
+            self.assertEqual(result.shape, (image.shape[0], oversampling * image.shape[1]))
+            self.assertTrue(numpy.allclose(result, self.skewReference(image, shiftArray, oversampling)))
+        result = Manipulation.skewAlongAxis(image, {'shiftArray': numpy.full(image.shape[0], 2.)})
+        self.assertTrue(numpy.allclose(result[:, 2:], image[:, :-2]))
+        self.assertTrue(numpy.array_equal(result[:, :2], numpy.zeros((image.shape[0], 2))))
+
+        # Along the columns
+        result = Manipulation.skewAlongAxis(image.T, {'shiftArray': shiftArray, 'axis': 0})
+        self.assertTrue(numpy.allclose(result, self.skewReference(image, shiftArray).T))
+        self.assertStackEqualsImages(skew, {})
+
+    def testSmileCorrection(self):
+        # Identical to the line by line correction for images of detector width
+        image = self.random.normal(100., 20., size=(6, 2048))
+        params = {'a': -5.25e-3, 'b': .1, 'c': 1.5}
+        self.assertTrue(numpy.allclose(SlopeCorrection.smileCorrection(image, dict(params)),
+                                       smileReference(image, **params)))
+        self.assertTrue(numpy.allclose(SlopeCorrection.smileCorrection(image.T, dict(params)),
+                                       smileReference(image, **params).T))
+
+    def testStacks(self):
+        # Stacks give the results of their images, thresholds and dark levels are determined per image
+        self.assertStackEqualsImages(Filter.bandPassFilter, {})
+        self.assertStackEqualsImages(Filter.bandPassFilter, {'low': 20., 'high': 150., 'offset': 10.})
+        self.assertStackEqualsImages(Filter.bandPassFilterID32, {'energy': 400., 'preset': 100.})
+        self.assertStackEqualsImages(Filter.bandPassFilterID32, {'energy': 400., 'dark': self.stack[0]})
+        self.assertStackEqualsImages(Alignment.fftAlignment, {'axis': 0}, exact=False)
+        self.assertStackEqualsImages(Alignment.fftAlignment, {'axis': 1, 'minChannel': 5, 'maxChannel': 30},
+                                     exact=False)
+        self.assertStackEqualsImages(Manipulation.flip, {})
+        self.assertStackEqualsImages(SlopeCorrection.smileCorrection, {'a': -1e-3, 'b': .05, 'c': .5})
+        for axis in [0, 1]:
+            self.assertStackEqualsImages(Integration.axisSum, {'axis': axis})
+            self.assertStackEqualsImages(Integration.sliceAndSum, {'binWidth': 7, 'sliceAxis': axis, 'sumAxis': axis})
+
+    def testDarkMap(self):
+        expected = self.stack.mean(axis=0)
+        self.assertTrue(numpy.allclose(darkMap(self.stack), expected))
+        self.assertTrue(numpy.allclose(darkMap(list(self.stack)), expected))
+        self.assertTrue(numpy.allclose(darkMap(iter(self.stack), mode='row'), expected.mean(axis=1)))
+        self.assertRaises(ValueError, darkMap, [])
+        self.assertRaises(ValueError, darkMap, self.stack, 'column')
+
+        # Filters take the dark map from the project by its key
+        project = RixsProject()
+        dark = darkMap(self.stack[:2])
+        project.addItem(DarkItem('dark', {}, dark, '', count=2))
+        self.assertEqual(project.darkKeys(), ['dark'])
+        self.assertRaises(KeyError, project.darkOffset, 'Images')
+
+        params = {'low': 10., 'high': 200., 'offset': 'dark'}
+        pipeline = Pipeline([('bandpass', params)]).resolve(project.darkOffset)
+        expected = Filter.bandPassFilter(self.stack[2], dict(params, offset=dark))
+        self.assertTrue(numpy.array_equal(pipeline.run(self.stack[2]), expected))
+
+        params = {'energy': 932., 'binning': 4., 'preset': 300., 'dark': 'dark'}
+        pipeline = Pipeline([('bandpassID32', params)]).resolve(project.darkOffset)
+        expected = Filter.bandPassFilterID32(self.stack[2], dict(params, dark=dark))
+        self.assertTrue(numpy.array_equal(pipeline.run(self.stack[2]), expected))
+
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(unittest.TestLoader().loadTestsFromTestCase(testOperations))
+    else:
+        # use a predefined order
+        testSuite.addTest(testOperations('testZeroToOne'))
+        testSuite.addTest(testOperations('testFFTAlignment'))
+        testSuite.addTest(testOperations('testMaxAlignment'))
+        testSuite.addTest(testOperations('testCenterOfMassAlignment'))
+        testSuite.addTest(testOperations('testFitAlignment'))
+        testSuite.addTest(testOperations('testSnip'))
+        testSuite.addTest(testOperations('testSliceAndSum'))
+        testSuite.addTest(testOperations('testBandPassFilter'))
+        testSuite.addTest(testOperations('testSkewAlongAxis'))
+        testSuite.addTest(testOperations('testSmileCorrection'))
+        testSuite.addTest(testOperations('testStacks'))
+        testSuite.addTest(testOperations('testDarkMap'))
+    return testSuite
+
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,100 @@
+#/*##########################################################################
+# Copyright (C) 2014 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# This toolkit is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2 of the License, or (at your option)
+# any later version.
+#
+# PyMca is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyMca; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# PyMca follows the dual licensing model of Riverbank's PyQt and cannot be
+# used as a free plugin for a non-free program.
+#
+# Please contact the ESRF industrial unit (industry@esrf.fr) if this license
+# is a problem for you.
+#############################################################################*/
+__author__ = "Tonn Rueter - ESRF Data Analysis Unit"
+
+import unittest
+import shutil
+import tempfile
+import numpy
+from os.path import join as OsPathJoin
+
+from PyMca5.PyMcaIO import EdfFile
+
+from RixsTool.Parallel import ParallelExecutor
+from RixsTool.Batch import reduceImage
+from RixsTool.Pipeline import Pipeline
+
+
+class testParallelExecutor(unittest.TestCase):
+    def setUp(self):
+        random = numpy.random.RandomState(0)
+        self.images = [random.normal(100., 20., size=(40, 50)) for idx in range(7)]
+        self.pipeline = Pipeline([
+            ('bandpass', {'low': 20., 'high': 150., 'offset': 10.}),
+            ('axisSum', {'axis': 1})
+        ])
+        self.expected = [self.pipeline.run(image) for image in self.images]
+
+    def assertResultsEqual(self, resultList):
+        self.assertEqual(len(resultList), len(self.expected))
+        for result, expected in zip(resultList, self.expected):
+            self.assertTrue(numpy.array_equal(result, expected))
+
+    def testWorkerCount(self):
+        self.assertEqual(ParallelExecutor(4).workerCount(2), 2)
+        self.assertEqual(ParallelExecutor(4).workerCount(10), 4)
+        self.assertEqual(ParallelExecutor(4).workerCount(0), 1)
+        self.assertTrue(ParallelExecutor().workerCount(1000) >= 1)
+
+    def testMap(self):
+        # Results are returned in order, independent of the pool
+        argumentList = [(image, self.pipeline) for image in self.images]
+        for executor in [ParallelExecutor(1), ParallelExecutor(3), ParallelExecutor(3, useThreads=True)]:
+            self.assertResultsEqual(executor.map(reduceImage, argumentList))
+
+    def testWorkersReadFiles(self):
+        directory = tempfile.mkdtemp()
+        try:
+            argumentList = []
+            for idx, image in enumerate(self.images):
+                fileName = OsPathJoin(directory, 'image%d.edf' % idx)
+                edf = EdfFile.EdfFile(fileName, 'wb')
+                edf.WriteImage({}, image)
+                del edf
+                argumentList += [(('image%d.edf' % idx, fileName), self.pipeline)]
+            self.assertResultsEqual(ParallelExecutor(3).map(reduceImage, argumentList))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(unittest.TestLoader().loadTestsFromTestCase(testParallelExecutor))
+    else:
+        # use a predefined order
+        testSuite.addTest(testParallelExecutor('testWorkerCount'))
+        testSuite.addTest(testParallelExecutor('testMap'))
+        testSuite.addTest(testParallelExecutor('testWorkersReadFiles'))
+    return testSuite
+
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
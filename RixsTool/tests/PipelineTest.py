@@ -0,0 +1,131 @@
+#/*##########################################################################
+# Copyright (C) 2014 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# This toolkit is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2 of the License, or (at your option)
+# any later version.
+#
+# PyMca is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyMca; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# PyMca follows the dual licensing model of Riverbank's PyQt and cannot be
+# used as a free plugin for a non-free program.
+#
+# Please contact the ESRF industrial unit (industry@esrf.fr) if this license
+# is a problem for you.
+#############################################################################*/
+__author__ = "Tonn Rueter - ESRF Data Analysis Unit"
+import unittest
+import shutil
+import tempfile
+import numpy
+from os.path import join as OsPathJoin
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+from RixsTool.Operations import Filter, Integration
+from RixsTool.Pipeline import Pipeline
+
+
+class testPipeline(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.offset = numpy.linspace(0., 3., 12, dtype=numpy.float32).reshape(3, 4)
+        self.pipeline = Pipeline([
+            ('bandpass', {'low': 1., 'high': 50., 'offset': self.offset}),
+            ('axisSum', {'axis': 1})
+        ])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def testJSONRoundTrip(self):
+        reloaded = Pipeline.fromJSON(self.pipeline.toJSON())
+        self.assertEqual(reloaded, self.pipeline)
+        self.assertEqual(hash(reloaded), hash(self.pipeline))
+
+    def testFileRoundTrip(self):
+        extensions = ['.json', '.yaml'] if yaml is not None else ['.json']
+        for extension in extensions:
+            fileName = OsPathJoin(self.directory, 'pipeline' + extension)
+            self.pipeline.save(fileName)
+            reloaded = Pipeline.fromFile(fileName)
+            self.assertEqual(reloaded, self.pipeline)
+            self.assertEqual(hash(reloaded), hash(self.pipeline))
+
+    def testListParameter(self):
+        listPipeline = Pipeline([('bandpass', {'low': 1., 'high': 50., 'offset': self.offset.tolist()}),
+                                 ('axisSum', {'axis': 1})])
+        self.assertEqual(listPipeline, self.pipeline)
+        self.assertNotEqual(listPipeline, Pipeline([('bandpass', {'low': 1., 'high': 50., 'offset': 1.}),
+                                                    ('axisSum', {'axis': 1})]))
+
+    def testRun(self):
+        image = numpy.arange(12.).reshape(3, 4) * 4.
+        expected = Integration.axisSum(Filter.bandPassFilter(image, {'low': 1., 'high': 50., 'offset': self.offset}),
+                                       {'axis': 1})
+        self.assertTrue(numpy.array_equal(self.pipeline.run(image), expected))
+
+    def testDarkReference(self):
+        dark = numpy.full((3, 4), 2.)
+        fileName = OsPathJoin(self.directory, 'dark.npy')
+        numpy.save(fileName, dark)
+        pipeline = Pipeline([('bandpassID32', {'energy': 932., 'dark': fileName})])
+        image = numpy.arange(12.).reshape(3, 4) * 100.
+        with self.assertRaises(ValueError):
+            pipeline.run(image)
+
+        resolved = pipeline.resolve()
+        expected = Filter.bandPassFilterID32(image, {'energy': 932., 'dark': dark})
+        self.assertTrue(numpy.array_equal(resolved.run(image), expected))
+
+        # The reference is stored instead of the map, also after concatenation
+        self.assertEqual(resolved.toDict()['stages'][0][1]['dark'], fileName)
+        concatenated = Pipeline([('flip', {})]) + resolved
+        self.assertEqual(concatenated.toDict()['stages'][1][1]['dark'], fileName)
+        reloaded = Pipeline.fromJSON(resolved.toJSON())
+        self.assertEqual(reloaded, pipeline)
+        self.assertEqual(reloaded.resolve(), resolved)
+        self.assertEqual(hash(reloaded.resolve()), hash(resolved))
+
+    def testProjectReference(self):
+        darks = {'dark': numpy.arange(3.)}
+        pipeline = Pipeline([('bandpass', {'low': 0., 'high': 100., 'offset': 'dark'})]).resolve(darks.get)
+        image = numpy.full((3, 4), 10.)
+        # Per row levels are applied to the rows
+        self.assertTrue(numpy.array_equal(pipeline.run(image)[:, 0], [10., 9., 8.]))
+
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(unittest.TestLoader().loadTestsFromTestCase(testPipeline))
+    else:
+        # use a predefined order
+        testSuite.addTest(testPipeline('testJSONRoundTrip'))
+        testSuite.addTest(testPipeline('testFileRoundTrip'))
+        testSuite.addTest(testPipeline('testListParameter'))
+        testSuite.addTest(testPipeline('testRun'))
+        testSuite.addTest(testPipeline('testDarkReference'))
+        testSuite.addTest(testPipeline('testProjectReference'))
+    return testSuite
+
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,175 @@
+#/*##########################################################################
+# Copyright (C) 2014 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# This toolkit is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2 of the License, or (at your option)
+# any later version.
+#
+# PyMca is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyMca; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# PyMca follows the dual licensing model of Riverbank's PyQt and cannot be
+# used as a free plugin for a non-free program.
+#
+# Please contact the ESRF industrial unit (industry@esrf.fr) if this license
+# is a problem for you.
+#############################################################################*/
+__author__ = "Tonn Rueter - ESRF Data Analysis Unit"
+
+import unittest
+import shutil
+import tempfile
+import numpy
+from os.path import join as OsPathJoin
+
+from PyMca5.PyMcaIO import EdfFile
+
+from RixsTool.Operations import Filter
+from RixsTool.Watch import FolderIndex, WatchFolderReduction
+
+
+class testFolderIndex(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def writeFile(self, name, content=b'data'):
+        fileName = OsPathJoin(self.directory, name)
+        with open(fileName, 'ab') as fileHandle:
+            fileHandle.write(content)
+        return fileName
+
+    def testPoll(self):
+        self.writeFile('existing.edf')
+        index = FolderIndex(self.directory, ignoreExisting=True, stablePolls=1)
+        fileName = self.writeFile('new.edf')
+        self.writeFile('other.txt')
+        # A new file is reported once it did not change for one poll
+        self.assertEqual(index.poll(), [])
+        self.assertEqual(index.poll(), [fileName])
+        # Reported files are not reported again, neither before nor after they are done
+        self.assertEqual(index.poll(), [])
+        index.done(fileName)
+        self.assertEqual(index.poll(), [])
+
+    def testGrowingFile(self):
+        index = FolderIndex(self.directory, stablePolls=1)
+        fileName = self.writeFile('growing.edf')
+        self.assertEqual(index.poll(), [])
+        self.writeFile('growing.edf', b'more data')
+        self.assertEqual(index.poll(), [])
+        self.assertEqual(index.poll(), [fileName])
+
+    def testRetry(self):
+        index = FolderIndex(self.directory, stablePolls=1, maxRetries=1)
+        fileName = self.writeFile('retry.edf')
+        index.poll()
+        self.assertEqual(index.poll(), [fileName])
+        # A file handed back has to be stable for twice as many polls
+        self.assertTrue(index.retry(fileName))
+        self.assertEqual(index.poll(), [])
+        self.assertEqual(index.poll(), [])
+        self.assertEqual(index.poll(), [fileName])
+        # Once the retries are exhausted the file is given up
+        self.assertFalse(index.retry(fileName))
+        self.assertEqual([index.poll() for idx in range(4)], [[]] * 4)
+
+
+class testWatchFolderReduction(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.outputDirectory = tempfile.mkdtemp()
+        self.outputFileName = OsPathJoin(self.outputDirectory, 'spectra.spec')
+        self.filterParams = {'low': 20., 'high': 150., 'offset': 10.}
+        self.pipeline = [('bandpass', self.filterParams), ('axisSum', {'axis': 1})]
+        self.random = numpy.random.RandomState(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        shutil.rmtree(self.outputDirectory, ignore_errors=True)
+
+    def writeImage(self, name):
+        image = self.random.normal(100., 20., size=(40, 50)).astype(numpy.float32)
+        edf = EdfFile.EdfFile(OsPathJoin(self.directory, name), 'wb')
+        edf.WriteImage({}, image)
+        del edf
+        return image
+
+    def readScans(self):
+        scans = []
+        with open(self.outputFileName, 'r') as fileHandle:
+            for line in fileHandle:
+                if line.startswith('#S '):
+                    scans += [(line.split()[2], [])]
+                elif line.strip() and not line.startswith('#') and scans:
+                    scans[-1][1].append([float(value) for value in line.split()])
+        return [(title, numpy.asarray(rows)) for title, rows in scans]
+
+    def testPoll(self):
+        images = {'image0.edf': self.writeImage('image0.edf')}
+        watcher = WatchFolderReduction(self.directory, self.pipeline, self.outputFileName, stablePolls=0,
+                                       accumulate=True)
+        resultList = watcher.poll()
+        self.assertEqual([(fileName, error) for fileName, spectra, error in resultList],
+                         [(OsPathJoin(self.directory, 'image0.edf'), None)])
+        # Files added while watching are reduced by the next poll, known files are not reduced again
+        images['image1.edf'] = self.writeImage('image1.edf')
+        self.assertEqual(len(watcher.poll()), 1)
+        self.assertEqual(watcher.poll(), [])
+
+        scans = self.readScans()
+        self.assertEqual(sorted(title for title, data in scans), sorted(images))
+        expectedSum = 0.
+        for title, data in scans:
+            expected = Filter.bandPassFilter(images[title], dict(self.filterParams)).sum(axis=1)
+            expectedSum = expectedSum + expected
+            self.assertTrue(numpy.array_equal(data[:, 0], numpy.arange(len(expected))))
+            self.assertTrue(numpy.allclose(data[:, 1], expected, atol=1e-4))
+        self.assertEqual(watcher.accumulator.count, 2)
+        self.assertTrue(numpy.allclose(watcher.accumulator.array, expectedSum, rtol=1e-5))
+
+    def testDefectiveFile(self):
+        with open(OsPathJoin(self.directory, 'defective.edf'), 'wb') as fileHandle:
+            fileHandle.write(b'no EDF header')
+        watcher = WatchFolderReduction(self.directory, self.pipeline, self.outputFileName, stablePolls=0,
+                                       maxRetries=0)
+        resultList = watcher.poll()
+        self.assertEqual(len(resultList), 1)
+        fileName, spectra, error = resultList[0]
+        self.assertEqual(spectra, [])
+        self.assertTrue(error is not None)
+        self.assertEqual(watcher.poll(), [])
+
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(unittest.TestLoader().loadTestsFromTestCase(testFolderIndex))
+        testSuite.addTest(unittest.TestLoader().loadTestsFromTestCase(testWatchFolderReduction))
+    else:
+        # use a predefined order
+        testSuite.addTest(testFolderIndex('testPoll'))
+        testSuite.addTest(testFolderIndex('testGrowingFile'))
+        testSuite.addTest(testFolderIndex('testRetry'))
+        testSuite.addTest(testWatchFolderReduction('testPoll'))
+        testSuite.addTest(testWatchFolderReduction('testDefectiveFile'))
+    return testSuite
+
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
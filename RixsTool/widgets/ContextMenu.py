@@ -81,6 +81,10 @@ class RenameAction(AbstractAction):
     pass
 
 
+class DarkMapAction(AbstractAction):
+    pass
+
+
 #
 # Actions concerning the FileSystemBrowser
 #
@@ -153,6 +157,12 @@ class ProjectContextMenu(AbstractContextMenu):
             self
         )
 
+        darkMapAction = DarkMapAction(
+            None,
+            'Average images to dark map',
+            self
+        )
+
         removeContainerAction = RemoveContainerAction(
             qt.QIcon(qt.QPixmap(':/minus.ico')),
             'Disband group',
@@ -162,6 +172,7 @@ class ProjectContextMenu(AbstractContextMenu):
         self.actionList = [
             showItemAction,
             removeItemAction,
+            darkMapAction,
             'seperator',
             renameContainerAction,
             expandContainerAction,
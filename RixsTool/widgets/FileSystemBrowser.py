@@ -90,9 +90,9 @@ class DirTree(qt.QTreeView):
             self.callback = None
 
         #
-        # List to keep track of files and avoid unnecessary
+        # Set to keep track of files and avoid unnecessary
         #
-        self.fileList = []
+        self.fileList = set()
 
     def handleDirectoryChangedSignal(self, path):
         """
@@ -117,7 +117,7 @@ class DirTree(qt.QTreeView):
         #
         # Update self.fileList
         #
-        self.fileList += newFiles
+        self.fileList.update(newFiles)
 
         #
         # Emit signal
@@ -168,10 +168,10 @@ class DirTree(qt.QTreeView):
         #
         # Keep track of files in the directory
         #
-        self.fileList = filter(OsPathIsFile, lsDir)
+        self.fileList = set(filter(OsPathIsFile, lsDir))
         for directory in directoryList:
             lsSubDir = [OsPathJoin(directory, item) for item in OsListDir(directory)]
-            self.fileList += filter(OsPathIsFile, lsSubDir)
+            self.fileList.update(filter(OsPathIsFile, lsSubDir))
 
         if DEBUG >= 1:
             print('DirTree.setWorkingDirectory -- watcherDirs (%d):' % len(self.watcher.directories()))
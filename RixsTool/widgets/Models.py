@@ -95,6 +95,42 @@ class ProjectModel(RixsProject, qt.QAbstractItemModel):
         self.endInsertRows()
         return True
 
+    def addItems(self, itemList):
+        """
+        :param list itemList: Items to be inserted
+
+        Inserts a batch of items. Views are notified once per group instead of once per item. Items with a
+        key that is already present are skipped.
+
+        :returns: Containers of the inserted items
+        :rtype: list
+        """
+        if DEBUG >= 1:
+            print('### ProjectModel.addItems -- called ###')
+        containerList = []
+        insertCount = {}
+        for item in itemList:
+            try:
+                container = RixsProject.addItem(self, item)
+            except ValueError as error:
+                if DEBUG >= 1:
+                    print(error)
+                continue
+            containerList += [container]
+            parentContainer = container.parent
+            count = insertCount.get(parentContainer.getID(), (parentContainer, 0))[1]
+            insertCount[parentContainer.getID()] = (parentContainer, count + 1)
+
+        #
+        # New containers are appended, i.e. they occupy the last rows of their parent
+        #
+        for parentContainer, count in insertCount.values():
+            last = parentContainer.childCount() - 1
+            parentIndex = self.createIndex(parentContainer.childNumber(), 0, parentContainer)
+            self.beginInsertRows(parentIndex, last - count + 1, last)
+            self.endInsertRows()
+        return containerList
+
     def addGroup(self, label, node=None):
         """
         :param item:
@@ -279,13 +315,11 @@ class ProjectModel(RixsProject, qt.QAbstractItemModel):
     def addFileInfoList(self, fileInfoList):
         if DEBUG >= 1:
             print('ProjectView.addFileInfoList -- received fileInfoList (len: %d)' % len(fileInfoList))
-        itemList = []
-        for info in fileInfoList:
-            absFilePath = OsPathNormpath(str(info.canonicalFilePath()))
-            # self.read(absFilePath)
-            itemList += RixsProject.read(self, absFilePath)
-        for item in itemList:
-            self.addItem(item)
+        fileNameList = [OsPathNormpath(str(info.canonicalFilePath())) for info in fileInfoList]
+        itemList, errorList = self.readFiles(fileNameList)
+        for fileName, error in errorList:
+            print("ProjectModel.addFileInfoList -- Failed to read '%s': %s" % (fileName, error))
+        self.addItems(itemList)
 
 
 class QDirListModel(qt.QAbstractListModel):
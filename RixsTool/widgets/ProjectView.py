@@ -30,7 +30,7 @@ from PyMca5.PyMcaGui import PyMcaQt as qt
 
 from ..Utils import unique as RixsUtilsUnique
 from ..widgets.ContextMenu import ProjectContextMenu, RemoveAction, RemoveItemAction, RemoveContainerAction, \
-    ShowAction, ExpandAction, RenameAction
+    ShowAction, ExpandAction, RenameAction, DarkMapAction
 from ..Project import ItemContainer
 
 DEBUG = 0
@@ -38,6 +38,7 @@ DEBUG = 0
 
 class ProjectView(qt.QTreeView):
     showSignal = qt.pyqtSignal(object)
+    darkSignal = qt.pyqtSignal(object)
 
     def __init__(self, parent=None):
         super(ProjectView, self).__init__(parent)
@@ -96,7 +97,8 @@ class ProjectView(qt.QTreeView):
         if not any([container.hasItem() for container in containerList]):
             # No DataItem in selection, deactivate actions aimt at DataItems
             for action in menu.actionList:
-                if isinstance(action, ShowAction) or isinstance(action, RemoveItemAction):
+                if isinstance(action, ShowAction) or isinstance(action, RemoveItemAction)\
+                        or isinstance(action, DarkMapAction):
                     action.setEnabled(False)
         else:
             # if not any([container.childCount() for container in containerList]):
@@ -118,6 +120,9 @@ class ProjectView(qt.QTreeView):
                 model.removeContainer(idx)
         elif isinstance(action, ShowAction):
             self._emitShowSignal(containerList)
+        elif isinstance(action, DarkMapAction):
+            itemList = [ItemContainer.item(container) for container in filter(ItemContainer.hasItem, containerList)]
+            self.darkSignal.emit(itemList)
         elif isinstance(action, RenameAction):
             # TODO: Call visualization here
             pass
@@ -42,8 +42,10 @@ from PyMca5.PyMca import MaskImageWidget
 #
 # TODO: platform is import for dev purposes, remove me
 #
+from RixsTool.Operations import Manipulation
+from RixsTool.Pipeline import Pipeline
+import threading
 import platform
-import numpy
 
 DEBUG = 0
 PLATFORM = platform.system()
@@ -61,11 +63,98 @@ class FlipWidget(object):
         self._active = val
 
     def process(self, image, param):
-        return numpy.flipud(image)
+        return Manipulation.flip(image, param)
 
     def getValues(self):
         return {}
 
+    def getStage(self):
+        return 'flip', {}
+
+
+class ProcessingThread(qt.QThread):
+
+    __doc__ = """Thread that performs the image processing of :py:class:`RixsMaskImageWidget` outside of the GUI thread.
+
+    Requests are coalesced: Only the latest request is kept while the thread is busy, older ones are dropped
+    without being processed. A request in progress becomes stale as soon as a newer one is submitted. Processing
+    functions are expected to check for this regularly and give up, results of stale requests are not emitted.
+
+    .. py:attribute:: resultReadySignal
+
+        Emits request number and result of a finished request"""
+
+    resultReadySignal = qt.pyqtSignal(object, object)
+
+    def __init__(self, parent=None):
+        qt.QThread.__init__(self, parent)
+        self._condition = threading.Condition()
+        self._pending = None
+        self._latestRequest = 0
+        self._stopped = False
+
+    def submit(self, function):
+        """
+        :param function: Callable that receives a callable without arguments, which returns True once the request
+         is stale. Returns the result or None if it gave up.
+
+        :returns int: Request number
+        """
+        with self._condition:
+            self._latestRequest += 1
+            self._pending = (self._latestRequest, function)
+            requestNumber = self._latestRequest
+            self._condition.notify()
+        if not self.isRunning():
+            self.start()
+        return requestNumber
+
+    def cancel(self):
+        """
+        Makes pending requests and the request in progress stale.
+        """
+        with self._condition:
+            self._latestRequest += 1
+            self._pending = None
+
+    def isStale(self, requestNumber):
+        """
+        :param int requestNumber: Number returned by :py:func:`submit`
+
+        :returns bool: True if a newer request has been submitted or the thread was stopped
+        """
+        return self._stopped or requestNumber != self._latestRequest
+
+    def stop(self):
+        """
+        Stops the thread after the current request and waits for it to finish.
+        """
+        with self._condition:
+            self._stopped = True
+            self._pending = None
+            self._condition.notify()
+        self.wait()
+
+    def run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                requestNumber, function = self._pending
+                self._pending = None
+            try:
+                result = function(lambda: self.isStale(requestNumber))
+            except Exception as error:
+                print('ProcessingThread.run -- Request %d failed: %s' % (requestNumber, str(error)))
+                continue
+            if result is None or self.isStale(requestNumber):
+                if DEBUG >= 1:
+                    print('ProcessingThread.run -- Discarding stale request %d' % requestNumber)
+                continue
+            self.resultReadySignal.emit(requestNumber, result)
+
 
 class RixsMaskImageWidget(MaskImageWidget.MaskImageWidget):
 
@@ -112,6 +201,17 @@ class RixsMaskImageWidget(MaskImageWidget.MaskImageWidget):
         # ]
         self.toolList = 3 * [None]
 
+        # CACHE: Maps the position of a tool in toolList to a pair of
+        # cache key and result of the tool, c.f. processImage
+        self._stageCache = {}
+
+        # PROCESSING: Tools are applied outside of the GUI thread
+        self.processingThread = ProcessingThread(self)
+        self.processingThread.resultReadySignal.connect(self.processingFinished)
+        app = qt.QApplication.instance()
+        if app:
+            app.aboutToQuit.connect(self.processingThread.stop)
+
         # FLIPING
         self.flipWidget = FlipWidget()
         self.toolList[0] = self.flipWidget
@@ -122,6 +222,7 @@ class RixsMaskImageWidget(MaskImageWidget.MaskImageWidget):
             'bandpassID32': BandPassID32Window()
         }
         self.filterWidget = None
+        self.darkResolver = None  # Looks up dark maps referenced by the filters, c.f. setDarkResolver
         self.setCurrentFilter('bandpass')  # self.toolList[1] is set to bandpassfilter
 
         # ALIGNMENT: Shift image along columns
@@ -191,34 +292,57 @@ class RixsMaskImageWidget(MaskImageWidget.MaskImageWidget):
         :param dict ddict: Remove parameter
 
         Function is trigger by :py:func:`RixsTool.widgets.ToolWindows.AbstractToolWindow.valuesChangedSignal`. The
-        dictionary parameter is not used and should be removed. The present function requests the tool parameter using
-        the :py:func:`RixsTool.widgets.ToolWindows.AbstractToolWindow.getValues` function and calls the generic
-        :py:func:`RixsTool.widgets.ToolWindows.AbstractToolWindow.process` function to obtain the result.
+        dictionary parameter is not used and should be removed. The present function collects the stages of the
+        active tools in a :py:class:`RixsTool.Pipeline.Pipeline`, c.f. :py:func:`pipeline`, and submits the processing
+        of the current image to the :py:attr:`processingThread`, c.f. :py:func:`processImage`.
 
-        To allow the image processing, the process function must be implemented in subclasses of
-         :py:func:`RixsTool.widgets.ToolWindows.AbstractToolWindow.process` and has to feature a two parameter
-         interface. The first parameter is the current image itself, the second is a dictionary of parameter values.
-
-        Calculated results are displayed using the :py:func:`addImage` function.
+        Calculated results are displayed by :py:func:`processingFinished`.
         """
-
-        #
-        # AVOID RECALCULATION: If change occured in tool at position idx,
-        # perform recalculation for self.toolList[idx:] ...
-        #
         if not self.currentImageItem:
             return
-        key = self.currentImageItem.key()
-        imageData = self.currentImageItem.array
+        imageItem = self.currentImageItem
+        pipeline = self.pipeline()
+        self.processingThread.submit(lambda isStale: self.processImage(imageItem, pipeline, isStale))
 
-        for tool in self.toolList:
-            if not tool.active():
+    def processImage(self, imageItem, pipeline, isStale):
+        """
+        :param ImageItem imageItem: Image to be processed
+        :param Pipeline pipeline: Stages of the active tools
+        :param isStale: Callable without arguments that returns True if the result is no longer needed
+
+        The result of every stage is cached. The cache key consists of the image ID and the key of the pipeline up to
+        the current stage. Therefore only the stages downstream of a change are recalculated.
+
+        :returns: Processed image or None if the request became stale
+        :rtype: ndarray
+        """
+        imageData = imageItem.array
+        for idx in range(len(pipeline)):
+            if isStale():
+                return None
+            cacheKey = (imageItem.getID(), pipeline.key(idx + 1))
+            cached = self._stageCache.get(idx)
+            if cached is not None and cached[0] == cacheKey:
+                imageData = cached[1]
+                if DEBUG >= 1:
+                    print('RixsMaskImageWidget.processImage -- Reusing result of stage %d' % idx)
                 continue
-            parameters = tool.getValues()
-            imageData = tool.process(imageData, parameters)
+            imageData = pipeline.runStage(idx, imageData)
+            self._stageCache[idx] = (cacheKey, imageData)
+        return imageData
+
+    def processingFinished(self, requestNumber, imageData):
+        """
+        :param int requestNumber: Number of the request, c.f. :py:func:`ProcessingThread.submit`
+        :param ndarray imageData: Processed image
 
+        Displays the result of the latest request. Results of requests that became stale while they were
+        passed to the GUI thread are ignored.
+        """
+        if self.processingThread.isStale(requestNumber) or not self.currentImageItem:
+            return
         if DEBUG >= 1:
-            print("RixsMaskImageWidget.filterValuesChanged -- key: '%s'" % key)
+            print("RixsMaskImageWidget.processingFinished -- key: '%s'" % self.currentImageItem.key())
         self.setImageData(
             data=imageData,
             clearmask=False,
@@ -226,6 +350,27 @@ class RixsMaskImageWidget(MaskImageWidget.MaskImageWidget):
             yScale=self.currentImageItem.scaleY
         )
 
+    def pipeline(self):
+        """
+        :returns Pipeline: Stages of the active tools in processing order, c.f.
+         :py:func:`RixsTool.widgets.ToolWindows.AbstractToolWindow.getStage`
+        """
+        return Pipeline([tool.getStage() for tool in self.toolList if tool.active()]).resolve(self.darkResolver)
+
+    def setDarkResolver(self, resolver):
+        """
+        :param callable resolver: Maps the key of a dark map to an array, e.g.
+         :py:func:`RixsTool.Project.RixsProject.darkOffset`
+        """
+        self.darkResolver = resolver
+
+    def setDarkKeys(self, keys):
+        """
+        :param list keys: Keys of the dark maps that can be selected in the filters
+        """
+        for tool in self.filterDict.values():
+            tool.setDarkKeys(keys)
+
     def hflip(self, **kw):
         if DEBUG >= 1:
             print('RixsMaskImageWidget.hflip -- called. kw: %s' % str(kw))
@@ -254,7 +399,9 @@ class RixsMaskImageWidget(MaskImageWidget.MaskImageWidget):
         return legend
 
     def setImageItem(self, projectItem):
+        self.processingThread.cancel()
         self.currentImageItem = projectItem
+        self._stageCache = {}
         imageData = self.currentImageItem.array
 
         self.setImageData(
@@ -291,6 +438,7 @@ class RixsMaskImageWidget(MaskImageWidget.MaskImageWidget):
     def addDockWidget(self, area, widget, orientation=qt.Qt.Vertical):
         self.graphWidget.graph.addDockWidget(area, widget, orientation)
 
+
 if __name__ == '__main__':
     app = qt.QApplication([])
     win = RixsMaskImageWidget()
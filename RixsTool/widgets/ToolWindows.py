@@ -81,6 +81,8 @@ class AbstractToolWindow(qt.QDockWidget):
         self.__uiLoaded = False
         self.__uiPath = uiPath
         self.process = None
+        self.stageName = None  # Name of the operation in RixsTool.Batch.BatchReduction
+        self.darkParameter = None  # Stage parameter that takes a dark map from the project, c.f. setDarkKeys
 
     def emitValuesChangedSignal(self, **kw):
         ddict = self.getValues()
@@ -128,6 +130,38 @@ class AbstractToolWindow(qt.QDockWidget):
         parameters = self.getValues()
         self.valuesChangedSignal.emit(parameters)
 
+    def getStage(self):
+        """
+        :returns tuple: Pair of operation name and parameters, c.f. :py:class:`RixsTool.Pipeline.Pipeline`
+
+        If a dark map is selected, the parameter darkParameter refers to it by its project key. The reference is
+        resolved by :py:func:`RixsTool.Pipeline.Pipeline.resolve`.
+        """
+        values = self.getValues()
+        if self.darkParameter is not None and self.darkComboBox.currentIndex() > 0:
+            values[self.darkParameter] = str(self.darkComboBox.currentText())
+        return self.stageName, values
+
+    def setDarkKeys(self, keys):
+        """
+        :param list keys: Keys of the dark maps in the project, c.f. :py:func:`RixsTool.Project.RixsProject.darkKeys`
+
+        Fills the dark map selection of the tool. The current selection is kept if the key is still present.
+        """
+        if self.darkParameter is None:
+            return
+        current = str(self.darkComboBox.currentText()) if self.darkComboBox.currentIndex() > 0 else None
+        self.darkComboBox.blockSignals(True)
+        self.darkComboBox.clear()
+        self.darkComboBox.addItem('No dark map')
+        for key in keys:
+            self.darkComboBox.addItem(key)
+        idx = self.darkComboBox.findText(current) if current is not None else 0
+        self.darkComboBox.setCurrentIndex(max(idx, 0))
+        self.darkComboBox.blockSignals(False)
+        if current is not None and idx < 0:
+            self.emitValuesChangedSignal()
+
     def getValues(self):
         ddict = {}
         sortedKeys = sorted(self._values.keys())
@@ -197,11 +231,15 @@ class BandPassFilterWindow(AbstractToolWindow):
         self.upperThresholdSpinBox.valueChanged.connect(self.emitValuesChangedSignal)
         self.lowerThresholdSpinBox.valueChanged.connect(self.emitValuesChangedSignal)
         self.offsetSpinBox.valueChanged.connect(self.emitValuesChangedSignal)
+        self.darkComboBox.currentIndexChanged.connect(self.emitValuesChangedSignal)
 
         #
         # Process
         #
         self.process = Filter.bandPassFilter
+        self.stageName = 'bandpass'
+        self.darkParameter = 'offset'
+        self.setDarkKeys([])
 
 
 class BandPassID32Window(AbstractToolWindow):
@@ -254,11 +292,15 @@ class BandPassID32Window(AbstractToolWindow):
         self.photonEdit.returnPressed.connect(self.emitValuesChangedSignal)
         self.binningEdit.returnPressed.connect(self.emitValuesChangedSignal)
         self.exposureEdit.returnPressed.connect(self.emitValuesChangedSignal)
+        self.darkComboBox.currentIndexChanged.connect(self.emitValuesChangedSignal)
 
         #
         # Process
         #
         self.process = Filter.bandPassFilterID32
+        self.stageName = 'bandpassID32'
+        self.darkParameter = 'dark'
+        self.setDarkKeys([])
 
     def getValues(self):
         ddict = AbstractToolWindow.getValues(self)
@@ -298,18 +340,28 @@ class ImageAlignmenWindow(AbstractToolWindow):
         # Process
         #
         self.process = self.alignImage  # Expects smile function
+        self.stageName = 'smileCorrection'
 
-    def alignImage(self, image, params):
-        func = FunctionItem('Slope Function', '')
-        expression = lambda x, a, b, c: a * x ** 2 + b * x + c
-        params = self.getValues()
+    def getStage(self):
+        return self.stageName, self.scaleValues(self.getValues())
+
+    @staticmethod
+    def scaleValues(values):
+        """
+        :param dict values: Values as shown in the spin boxes, c.f. :py:func:`getValues`
+
+        :returns dict: Parameters of :py:func:`RixsTool.Operations.SlopeCorrection.smileCorrection`
+        """
+        params = dict(values)
 
+        # Spin box shows the quadratic coefficient in units of 1e-5
         params['a'] *= 10.** -5
 
-        func.setExpression(expression)
-        func.setParameters(params)
+        return params
 
-        return SlopeCorrection.alignImage(image, func)
+    def alignImage(self, image, params):
+        # Might run outside the GUI thread, do not read the spin boxes here
+        return SlopeCorrection.smileCorrection(image, self.scaleValues(params))
 
 
 class SumImageTool(AbstractToolWindow):
@@ -348,14 +400,19 @@ class SumImageTool(AbstractToolWindow):
         # Process
         #
         self.process = self.sumImage
+        self.stageName = 'axisSum'
 
-    def sumImage(self, image, param=None):
+    def getStage(self):
         params = self.getValues()
         if str(params['axis']) == 'columns':
             axis = 1
         else:
             axis = 0
-        return Integration.axisSum(image, {'axis': axis})
+        return self.stageName, {'axis': axis}
+
+    def sumImage(self, image, param=None):
+        name, params = self.getStage()
+        return Integration.axisSum(image, params)
 
 
 class EnergyScaleTool(AbstractToolWindow):
@@ -399,7 +456,7 @@ class EnergyScaleTool(AbstractToolWindow):
         #
         # Set expression
         #
-        scale.setExpression(lambda x, a, b: a * x + b)
+        scale.setExpression('lambda x, a, b: a * x + b')
 
         #
         # Set parameters
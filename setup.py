@@ -42,7 +42,7 @@ distribution = setup(
     url="https://github.com/tonnrueter/RixsTool",
     long_description="Here be long description",
     platforms='any',
-    packages=['RixsTool', 'RixsTool.widgets'],
+    packages=['RixsTool', 'RixsTool.widgets', 'RixsTool.tests'],
     package_data={'RixsTool': ['ui/*.ui']},
-    scripts=["scripts/rixstool"]
+    scripts=["scripts/rixstool", "scripts/rixsbatch", "scripts/rixswatch"]
 )